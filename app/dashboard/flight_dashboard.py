@@ -1,33 +1,57 @@
 # dashboard/voos_dashboard.py
 from __future__ import annotations
-from typing import Optional
+import json
+from pathlib import Path
+from typing import Optional, Union
 import polars as pl
 import streamlit as st
 
 from .services.io import (
+    _source_version,
     _load_parquet_from_path,
     _load_parquet_from_bytes,
     _unique_values,
     _date_bounds,
+    _load_eventlog_pruned,
+    _load_cube,
+    _load_delay_sketch,
+    _load_series,
+    _load_periods,
+    _load_dimensions,
+    _expand_view,
+    _dataset_unique_values,
+    _dataset_date_bounds,
 )
 from .services.aggregations import (
     COLS,
     _apply_filters,
+    _supports_filters,
+    _filter_spec,
+    FILTER_INDEX_COLS,
     _agg_voos_por_dia,
     _agg_status,
     _agg_top_rotas,
     _base_atraso,
     _agg_aeroporto_mais_atrasos,
-    _agg_variacao_aeroporto,
     _agg_atrasos_por_ano,
     _agg_dias_semana_por_ano,
     _agg_periodo_por_ano,
     _agg_companhias_por_ano,
+    _agg_atrasos_lote,
+    _delay_sketch,
+    _rolling_store,
+    _period_store,
 )
+from .services.agg_cache import FrameView, _agg_cache
+from .services.bitmap_index import _build_bitmap_index
+from app.model.star_schema import StarSchema
+from app.utils.perf import Tracer, traced
 from .ui.charts import (
     render_kpis,
     render_general_charts,
     render_delay_insights,
+    render_delay_percentiles,
+    render_rolling_on_time,
 )
 from .ui.maps import render_route_map
 from .ui.charts import render_sample_and_downloads
@@ -36,28 +60,99 @@ from .ui.charts import render_sample_and_downloads
 class FlightsDashboard:
     """Classe principal que gera a UI e chama serviços."""
 
-    def render_dashboard(self, df: Optional[pl.DataFrame] = None) -> None:
-        """Renderiza todo o dashboard. Opcionalmente recebe um DataFrame pronto (Polars)."""
+    def render_dashboard(
+        self,
+        df: Optional[pl.DataFrame] = None,
+        dataset_path: Optional[str] = None,
+        cube_path: Optional[str] = None,
+        sketch_path: Optional[str] = None,
+        series_path: Optional[str] = None,
+        periods_path: Optional[str] = None,
+        dimensions_path: Optional[str] = None,
+    ) -> None:
+        """Renderiza todo o dashboard. Opcionalmente recebe um DataFrame pronto (Polars)
+        ou o caminho de um dataset particionado (ano=/mes=), lido de forma lazy.
+        Com `cube_path` (cubo gerado junto com o eventlog) KPIs e gráficos são
+        calculados sobre o cubo sempre que os filtros ativos permitirem; com
+        `sketch_path` os percentis de atraso saem dos sketches pré-computados e,
+        com `series_path`, a pontualidade em janelas móveis sai da série diária;
+        `periods_path` guarda as contagens por período usadas na comparação entre períodos.
+        Com `dimensions_path` o eventlog pode vir em estrela (ids no lugar dos atributos):
+        só as colunas usadas nas análises saem das dimensões, o resto entra na exibição."""
         st.set_page_config(page_title="Painel de Voos (Polars)", layout="wide")
 
-        df_raw = self._render_input_section(df)
-        self._render_sanity(df_raw)
+        # Painel de performance opcional: instrumenta esta execução do script
+        if not st.sidebar.toggle("Painel de performance", value=False, key="perf_panel"):
+            self._render_body(df, dataset_path, cube_path, sketch_path, series_path, periods_path, dimensions_path)
+            return
+        tracer = Tracer()
+        with tracer.activate():
+            self._render_body(df, dataset_path, cube_path, sketch_path, series_path, periods_path, dimensions_path)
+        self._render_perf_panel(tracer)
+
+    def _render_body(
+        self,
+        df: Optional[pl.DataFrame],
+        dataset_path: Optional[str],
+        cube_path: Optional[str],
+        sketch_path: Optional[str],
+        series_path: Optional[str],
+        periods_path: Optional[str],
+        dimensions_path: Optional[str],
+    ) -> None:
+        source, versao = self._render_input_section(df, dataset_path)
+        versao_dims = _source_version(dimensions_path)
+        dims = _load_dimensions(dimensions_path, versao_dims) if dimensions_path else None
+        # Frames viram FrameViews: agregações cacheadas pela chave (versão da fonte em disco, ou hash do conteúdo, + filtros)
+        versao_fonte = (versao, versao_dims)
+        if isinstance(source, pl.DataFrame):
+            root = _expand_view(FrameView.of(source, version=versao), dims, versao_dims)
+        else:
+            root = source
 
         # Filtros
         (
             empresas, situacoes, status, tipos_linha,
             origs, dests, faixa, bt_filtrar
-        ) = self._render_sidebar_filters(df_raw)
+        ) = self._render_sidebar_filters(root, dimensions_path, versao_fonte)
 
-        df_filtrado = (
-            _apply_filters(
-                df_raw, empresas, situacoes, status, tipos_linha, origs, dests, faixa
-            ) if bt_filtrar else df_raw
-        )
+        if isinstance(source, str):
+            # dataset particionado: data/empresa podam partições antes de ler qualquer byte
+            particoes = (faixa if bt_filtrar else None, tuple(empresas) if bt_filtrar and empresas else None)
+            df_raw = _load_eventlog_pruned(source, *particoes, dimensions_path, versao_fonte)
+            raw = FrameView.of(df_raw, version=(versao_fonte, particoes))
+        else:
+            df_raw, raw = root.frame, root
+        self._render_sanity(df_raw, dims)
+
+        filtros = (empresas, situacoes, status, tipos_linha, origs, dests, faixa)
+        spec = _filter_spec(*filtros) if bt_filtrar else ()
+        df_filtrado = self._filtered_view(raw, df_raw, filtros, spec)
+
+        # Agregações sobre o cubo quando ele existe e cobre os filtros ativos
+        versao_cubo = _source_version(cube_path)
+        cube = _load_cube(cube_path, versao_cubo) if cube_path else None
+        cube_view = FrameView.of(cube, "cube", versao_cubo) if cube is not None else None
+        if cube is not None and _supports_filters(cube, *filtros):
+            df_agg = self._filtered_view(cube_view, cube, filtros, spec)
+        else:
+            df_agg = df_filtrado
+
+        # Comparação entre períodos: os períodos são escolhidos na tela, então vale tudo menos o filtro de data
+        filtros_sem_data = (*filtros[:-1], None)
+        spec_sem_data = _filter_spec(*filtros_sem_data) if bt_filtrar else ()
+        versao_periodos = _source_version(periods_path)
+        periods = _load_periods(periods_path, versao_periodos) if periods_path else None
+        if periods is not None and not spec_sem_data:
+            df_periodos = FrameView.of(periods, "periods", versao_periodos)
+        elif cube is not None and _supports_filters(cube, *filtros_sem_data):
+            df_periodos = _period_store(self._filtered_view(cube_view, cube, filtros_sem_data, spec_sem_data))
+        else:
+            df_periodos = _period_store(self._filtered_view(raw, df_raw, filtros_sem_data, spec_sem_data))
 
         # KPIs + gráficos gerais
-        render_kpis(df_filtrado)
-        render_general_charts(df_filtrado)
+        render_kpis(df_agg)
+        render_general_charts(df_agg)
 
         # Insights de atraso
         st.sidebar.header("Parâmetros de Atraso")
@@ -65,34 +160,97 @@ class FlightsDashboard:
             "Considerar atraso acima de (minutos)", 0, 180, 15, 5, key="limite_min_insights"
         )
         df_delay = _base_atraso(df_filtrado, limite_min)
-        
-        
+        df_delay_agg = _base_atraso(df_agg, limite_min) if df_agg is not df_filtrado else df_delay
+
+        # as seis agregações de atraso saem de um único scan e ficam no cache para os gráficos abaixo
+        _agg_atrasos_lote(df_agg, limite_min)
 
         st.header("Insights de Atrasos")
         render_delay_insights(
-            df_delay,
+            df_delay_agg,
             _agg_aeroporto_mais_atrasos,
-            _agg_variacao_aeroporto,
             _agg_atrasos_por_ano,
             _agg_dias_semana_por_ano,
             _agg_periodo_por_ano,
             _agg_companhias_por_ano,
-            df_filtered_no_date=df_delay,   # mesmo DF filtrado; o fallback ignora só a data internamente
+            df_periodos=df_periodos,
             delay_limit=limite_min,
         )
 
+        # Percentis de atraso: sketches pré-computados quando cobrem os filtros, senão montados do frame filtrado
+        versao_sketch = _source_version(sketch_path)
+        sketch = _load_delay_sketch(sketch_path, versao_sketch) if sketch_path else None
+        if sketch is not None and _supports_filters(sketch, *filtros):
+            df_sketch = self._filtered_view(FrameView.of(sketch, "sketch", versao_sketch), sketch, filtros, spec)
+        else:
+            df_sketch = _delay_sketch(df_filtrado)
+        render_delay_percentiles(df_sketch)
+
+        # Pontualidade 7d/30d por entidade: série diária do pipeline ou montada do eventlog carregado
+        versao_serie = _source_version(series_path)
+        series = _load_series(series_path, versao_serie) if series_path else None
+        df_serie = FrameView.of(series, "series", versao_serie) if series is not None else _rolling_store(raw)
+        render_rolling_on_time(df_serie, faixa if bt_filtrar else None)
+
         # Mapa de rotas
         render_route_map(df_filtrado, df_delay)
 
         # Amostra e downloads
-        render_sample_and_downloads(df_filtrado)
+        render_sample_and_downloads(df_filtrado, dims)
+
+        self._render_cache_stats()
 
     # -------------------------
     # Privados (UI de entrada e sanity)
     # -------------------------
-    def _render_input_section(self, df_initial: Optional[pl.DataFrame]) -> pl.DataFrame:
+    @staticmethod
+    def _filtered_view(view: FrameView, df: pl.DataFrame, filtros: tuple, spec: tuple) -> FrameView:
+        """View de `df` com os filtros aplicados; o filtro só roda se alguma agregação errar o cache."""
+        if not spec:
+            return view
+
+        def _resolve() -> pl.DataFrame:
+            # índices invertidos dos multiselects: montados uma vez por frame, reaproveitados a cada filtro
+            index = _build_bitmap_index(df, FILTER_INDEX_COLS, view.key)
+            return _apply_filters(df, *filtros, index=index)
+
+        return FrameView(view.key + (("filtros",) + spec,), resolve=_resolve, cache=view.cache)
+
+    def _render_perf_panel(self, tracer: Tracer):
+        resumo = tracer.summary()
+        with st.sidebar.expander("Performance", expanded=True):
+            if resumo.is_empty():
+                st.caption("Nenhuma etapa instrumentada nesta execução.")
+                return
+            total = sum(s["wall_ms"] for s in tracer.spans if s["depth"] == 0)
+            st.caption(f"{len(tracer.spans)} spans · {total:,.0f} ms nas etapas de topo · RSS {tracer.spans[-1]['rss_mb']:,.0f} MB")
+            st.dataframe(resumo.to_pandas(), use_container_width=True, hide_index=True)
+            st.download_button(
+                "Baixar trace (JSON)",
+                data=json.dumps(tracer.to_trace()),
+                file_name="dashboard_trace.json",
+                mime="application/json",
+            )
+
+    def _render_cache_stats(self):
+        stats = _agg_cache().stats()
+        with st.sidebar.expander("Cache de agregações"):
+            st.caption(
+                f"{stats['entradas']} entradas · {stats['bytes'] / 1024 ** 2:.1f} de "
+                f"{stats['orcamento'] / 1024 ** 2:.0f} MB · acertos {stats['acertos']} / erros {stats['erros']} "
+                f"({stats['taxa_acerto']:.0%}) · despejos {stats['despejos']}"
+            )
+
+    @traced()
+    def _render_input_section(
+        self, df_initial: Optional[pl.DataFrame], dataset_path: Optional[str] = None
+    ) -> tuple[Union[pl.DataFrame, str], Optional[str]]:
+        """Retorna o DataFrame carregado ou, para datasets particionados, o caminho do diretório, junto
+        com a versão em disco da fonte (None para frames que só existem em memória)."""
         if df_initial is not None:
-            return df_initial
+            return df_initial, None
+        if dataset_path is not None:
+            return dataset_path, _source_version(dataset_path)
 
         st.sidebar.subheader("Entrada de dados")
         fonte = st.sidebar.radio(
@@ -101,13 +259,15 @@ class FlightsDashboard:
             horizontal=True
         )
 
-        df: Optional[pl.DataFrame] = None
+        df: Optional[Union[pl.DataFrame, str]] = None
+        versao: Optional[str] = None
         if fonte == "Caminho fixo (Parquet)":
-            caminho_default = "logs/eventlog.parquet"
+            caminho_default = "logs/eventlog" if Path("logs/eventlog").is_dir() else "logs/eventlog.parquet"
             caminho = st.sidebar.text_input("Caminho do arquivo Parquet", value=caminho_default)
             if st.sidebar.button("Carregar do caminho", type="primary"):
                 try:
-                    df = _load_parquet_from_path(caminho)
+                    versao = _source_version(caminho)
+                    df = caminho if Path(caminho).is_dir() else _load_parquet_from_path(caminho, versao)
                     st.sidebar.success(f"Arquivo carregado: {caminho}")
                 except Exception as e:
                     st.sidebar.error(f"Erro ao ler '{caminho}': {e}")
@@ -122,15 +282,20 @@ class FlightsDashboard:
 
         # Fallback
         if df is None:
+            if Path("logs/eventlog").is_dir():
+                st.sidebar.info("Usando fallback: logs/eventlog")
+                return "logs/eventlog", _source_version("logs/eventlog")
             try:
-                df = _load_parquet_from_path("logs/eventlog.parquet")
+                versao = _source_version("logs/eventlog.parquet")
+                df = _load_parquet_from_path("logs/eventlog.parquet", versao)
                 st.sidebar.info("Usando fallback: logs/eventlog.parquet")
             except Exception:
                 st.warning("Carregue um Parquet (via caminho fixo ou seleção de arquivo) para continuar.")
                 st.stop()
-        return df
+        return df, versao
 
-    def _render_sanity(self, df: pl.DataFrame):
+    @traced()
+    def _render_sanity(self, df: pl.DataFrame, dims: Optional[dict] = None):
         colunas_esperadas = [
             COLS.EMPRESA_ICAO, COLS.NUMERO_VOO, COLS.ORIGEM_ICAO, COLS.DESTINO_ICAO,
             COLS.PARTIDA_PREV, COLS.PARTIDA_REAL, COLS.CHEGADA_PREV, COLS.CHEGADA_REAL,
@@ -139,20 +304,38 @@ class FlightsDashboard:
             COLS.DESTINO, COLS.DEST_MUN, "Destino GPS", "Destino Coordenadas", "Tamanho Destino",
             "Justificativa", COLS.TIPO_LINHA, COLS.EMPRESA, COLS.STATUS_VOO
         ]
-        faltando = [c for c in colunas_esperadas if c not in df.columns]
+        # com as dimensões, as colunas de exibição vêm dos ids
+        disponiveis = StarSchema().display_columns(df.columns) if dims is not None else df.columns
+        faltando = [c for c in colunas_esperadas if c not in disponiveis]
         if faltando:
             st.warning(f"As colunas abaixo não foram encontradas e alguns recursos podem desabilitar: {faltando}")
 
-    def _render_sidebar_filters(self, df: pl.DataFrame):
+    @traced()
+    def _render_sidebar_filters(
+        self,
+        df: Union[FrameView, str],
+        dimensions_path: Optional[str] = None,
+        version: Optional[tuple] = None,
+    ):
+        # para datasets particionados as opções vêm de scans lazy só das colunas necessárias
+        if isinstance(df, str):
+            def unique_values(path: str, col: str) -> list:
+                return _dataset_unique_values(path, col, dimensions_path=dimensions_path, version=version)
+
+            def date_bounds(path: str, col: str) -> tuple:
+                return _dataset_date_bounds(path, col, version=version)
+        else:
+            unique_values, date_bounds = _unique_values, _date_bounds
+
         st.sidebar.header("Filtros")
-        airlines = st.sidebar.multiselect("Empresa Aérea", _unique_values(df, COLS.EMPRESA))
-        situations = st.sidebar.multiselect("Situação do Voo", _unique_values(df, COLS.SITUACAO_VOO))
-        statuses = st.sidebar.multiselect("Status do Voo", _unique_values(df, COLS.STATUS_VOO))
-        line_types = st.sidebar.multiselect("Tipo de Linha", _unique_values(df, COLS.TIPO_LINHA))
-        origins = st.sidebar.multiselect("Aeródromo Origem", _unique_values(df, COLS.ORIGEM))
-        destinations = st.sidebar.multiselect("Aeródromo Destino", _unique_values(df, COLS.DESTINO))
-
-        min_dt, max_dt = _date_bounds(df, COLS.PARTIDA_PREV)
+        airlines = st.sidebar.multiselect("Empresa Aérea", unique_values(df, COLS.EMPRESA))
+        situations = st.sidebar.multiselect("Situação do Voo", unique_values(df, COLS.SITUACAO_VOO))
+        statuses = st.sidebar.multiselect("Status do Voo", unique_values(df, COLS.STATUS_VOO))
+        line_types = st.sidebar.multiselect("Tipo de Linha", unique_values(df, COLS.TIPO_LINHA))
+        origins = st.sidebar.multiselect("Aeródromo Origem", unique_values(df, COLS.ORIGEM))
+        destinations = st.sidebar.multiselect("Aeródromo Destino", unique_values(df, COLS.DESTINO))
+
+        min_dt, max_dt = date_bounds(df, COLS.PARTIDA_PREV)
         if min_dt and max_dt:
             start_date = st.sidebar.date_input("Data Inicial da Partida Prevista", value=min_dt.date(), format="YYYY-MM-DD")
             end_date = st.sidebar.date_input("Data Final da Partida Prevista", value=max_dt.date(), format="YYYY-MM-DD")
@@ -0,0 +1,190 @@
+# dashboard/services/agg_cache.py
+from __future__ import annotations
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Optional
+import polars as pl
+
+from app.utils.perf import traced
+
+# Orçamento de memória do cache de agregações (resultados + frames derivados)
+AGG_CACHE_BUDGET_BYTES = 512 * 1024 ** 2
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, (pl.DataFrame, pl.Series)):
+        return int(value.estimated_size())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+def frame_fingerprint(df: pl.DataFrame) -> str:
+    """Id de versão de um frame sem origem em disco (upload, saída do pipeline): schema e hash de todas as linhas.
+
+    É O(linhas), mas vetorizado e calculado uma vez por execução; frames lidos de
+    arquivos usam a versão do arquivo (`version` em `FrameView.of`).
+    """
+    h = hashlib.sha1(repr((df.shape, list(df.schema.items()))).encode())
+    if df.height:
+        h.update(df.hash_rows(seed=0).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class AggCache:
+    """LRU com orçamento em bytes e contadores de acerto/erro, compartilhado entre sessões."""
+
+    def __init__(self, max_bytes: int = AGG_CACHE_BUDGET_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # chave -> (valor, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: tuple, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def get(self, key: tuple) -> Any:
+        """Valor guardado ou None (sem contar erro: quem chama decide se calcula)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, value: Any) -> None:
+        size = _sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return  # maior que o orçamento inteiro: devolve sem guardar
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entries),
+                "bytes": self._bytes,
+                "orcamento": self.max_bytes,
+                "acertos": self.hits,
+                "erros": self.misses,
+                "despejos": self.evictions,
+                "taxa_acerto": self.hits / total if total else 0.0,
+            }
+
+
+# Uma instância por processo (compartilhada entre sessões); sem depender do runtime do Streamlit
+_AGG_CACHE = AggCache()
+
+def _agg_cache() -> AggCache:
+    return _AGG_CACHE
+
+
+class FrameView:
+    """Frame identificado por uma chave leve (versão do dataset, filtros, derivações).
+
+    As agregações decoradas com `cached_agg` usam só a chave; o frame em si é
+    materializado (e guardado no cache) apenas quando alguma delas erra o cache.
+    """
+
+    def __init__(
+        self,
+        key: tuple,
+        frame: Optional[pl.DataFrame] = None,
+        resolve: Optional[Callable[[], pl.DataFrame]] = None,
+        cache: Optional[AggCache] = None,
+    ):
+        self.key = key
+        self.cache = cache or _agg_cache()
+        self._frame = frame
+        self._resolve = resolve
+
+    @classmethod
+    def of(cls, df: pl.DataFrame, kind: str = "frame", version: Any = None) -> FrameView:
+        """`version` identifica o dado na origem (ex.: tamanho/mtime dos Parquets); sem ela, hash do conteúdo."""
+        return cls((kind, frame_fingerprint(df) if version is None else version), frame=df)
+
+    @property
+    def frame(self) -> pl.DataFrame:
+        if self._frame is None:
+            self._frame = self.cache.get_or_compute(self.key + ("__frame__",), self._resolve)
+        return self._frame
+
+    @property
+    def loaded_frame(self) -> Optional[pl.DataFrame]:
+        """Frame já materializado (sem resolver); usado pela instrumentação para contar linhas."""
+        return self._frame
+
+    @property
+    def columns(self) -> list:
+        return self._meta("__columns__", lambda df: df.columns)
+
+    @property
+    def height(self) -> int:
+        return self._meta("__height__", lambda df: df.height)
+
+    def _meta(self, name: str, fn: Callable[[pl.DataFrame], Any]) -> Any:
+        if self._frame is not None:
+            return fn(self._frame)
+        return self.cache.get_or_compute(self.key + (name,), lambda: fn(self.frame))
+
+    def derive(self, name: str, params: tuple, fn: Callable[..., pl.DataFrame]) -> FrameView:
+        """Novo view `fn(frame, *params)`, resolvido de forma preguiçosa."""
+        return FrameView(self.key + ((name,) + tuple(params),), resolve=lambda: fn(self.frame, *params), cache=self.cache)
+
+
+def agg_key(view: FrameView, fn: Callable, args: tuple = (), kwargs: Optional[dict] = None) -> tuple:
+    """Chave de `fn(view, *args, **kwargs)` no cache (a mesma usada por `cached_agg`)."""
+    return view.key + ((fn.__qualname__, args, tuple(sorted((kwargs or {}).items()))),)
+
+def cached_agg(fn: Callable) -> Callable:
+    """Substitui `@st.cache_data` nas agregações: com um `FrameView` a chave é
+    (view.key, nome, parâmetros); com um DataFrame a função roda direto."""
+    @traced(fn.__qualname__)
+    @wraps(fn)
+    def wrapper(df, *args, **kwargs):
+        if not isinstance(df, FrameView):
+            return fn(df, *args, **kwargs)
+        key = agg_key(df, fn, args, kwargs)
+        return df.cache.get_or_compute(key, lambda: fn(df.frame, *args, **kwargs))
+    return wrapper
+
+def derived_view(fn: Callable) -> Callable:
+    """Para funções frame -> frame (ex.: `_base_atraso`): com um `FrameView` devolve outro view."""
+    @traced(fn.__qualname__)
+    @wraps(fn)
+    def wrapper(df, *args):
+        if not isinstance(df, FrameView):
+            return fn(df, *args)
+        return df.derive(fn.__qualname__, args, fn)
+    return wrapper
@@ -1,9 +1,17 @@
 
 # dashboard/services/aggregations.py
 from __future__ import annotations
+from datetime import date
 from typing import Optional
 import polars as pl
-import streamlit as st
+
+from app.model.delay_sketch import DelaySketch
+from app.model.period_comparison import PeriodComparison
+from app.model.rolling_series import RollingSeries
+from app.utils.perf import traced
+from .agg_cache import FrameView, agg_key, cached_agg, derived_view
+from .bitmap_index import BitmapIndex
+from .time_index import _time_range, _time_slice
 
 class COLS:
     EMPRESA_ICAO = "ICAO Empresa Aérea"
@@ -24,8 +32,104 @@ class COLS:
     DESTINO = "Aeródromo Destino"
     COORD_ORIG = "Origem Coordenadas"
     COORD_DEST = "Destino Coordenadas"
+    # coordenadas já resolvidas (Float32) pelo Transformer
+    LON_ORIG = "Origem Longitude"
+    LAT_ORIG = "Origem Latitude"
+    LON_DEST = "Destino Longitude"
+    LAT_DEST = "Destino Latitude"
+    # colunas exclusivas do cubo de agregação (ver app/model/aggregate_cube.py)
+    QTD_VOOS = "Qtd Voos"
+    FAIXA_ATRASO = "Faixa Atraso"
+
+# Colunas das dimensões de um eventlog em estrela (ver app/model/star_schema.py) trazidas para o frame
+# de análise: as usadas por filtros, agregações e mapa. As demais só entram na exibição/exportação
+STAR_COLUMNS = (
+    COLS.EMPRESA_ICAO,
+    COLS.EMPRESA,
+    COLS.ORIGEM_ICAO,
+    COLS.ORIGEM,
+    COLS.DESTINO_ICAO,
+    COLS.DESTINO,
+    COLS.LON_ORIG,
+    COLS.LAT_ORIG,
+    COLS.LON_DEST,
+    COLS.LAT_DEST,
+)
+
+# -------------- cubo --------------
+def _is_cube(df: pl.DataFrame) -> bool:
+    return COLS.QTD_VOOS in df.columns
+
+def _count_expr(df: pl.DataFrame) -> pl.Expr:
+    """Contagem de voos: linhas no eventlog, soma de `Qtd Voos` no cubo."""
+    return pl.col(COLS.QTD_VOOS).sum() if _is_cube(df) else pl.len()
+
+def _total_voos(df: pl.DataFrame) -> int:
+    return int(df.get_column(COLS.QTD_VOOS).sum()) if _is_cube(df) else df.height
+
+def _supports_filters(
+    df: pl.DataFrame,
+    empresas: list,
+    situacoes: list,
+    status: list,
+    tipos_linha: list,
+    icao_origem: list,
+    icao_destino: list,
+    faixa_partida: Optional[tuple],
+) -> bool:
+    """True se todas as colunas usadas pelos filtros ativos existem em `df` (ex.: no cubo)."""
+    needed = [
+        col for col, active in (
+            (COLS.EMPRESA, empresas),
+            (COLS.SITUACAO_VOO, situacoes),
+            (COLS.STATUS_VOO, status),
+            (COLS.TIPO_LINHA, tipos_linha),
+            (COLS.ORIGEM_ICAO, icao_origem),
+            (COLS.DESTINO_ICAO, icao_destino),
+            (COLS.PARTIDA_PREV, faixa_partida and any(faixa_partida)),
+        ) if active
+    ]
+    return all(c in df.columns for c in needed)
 
 # -------------- filtros --------------
+# Colunas dos multiselects da sidebar, cobertas pelo `BitmapIndex`
+FILTER_INDEX_COLS = (
+    COLS.EMPRESA,
+    COLS.SITUACAO_VOO,
+    COLS.STATUS_VOO,
+    COLS.TIPO_LINHA,
+    COLS.ORIGEM_ICAO,
+    COLS.DESTINO_ICAO,
+)
+
+def _filter_spec(
+    empresas: list,
+    situacoes: list,
+    status: list,
+    tipos_linha: list,
+    icao_origem: list,
+    icao_destino: list,
+    faixa_partida: Optional[tuple],
+) -> tuple:
+    """Forma canônica (hasheável) dos filtros ativos, usada nas chaves do cache de agregações."""
+    valores = (empresas, situacoes, status, tipos_linha, icao_origem, icao_destino)
+    spec = tuple(
+        (col, tuple(sorted(map(str, values))))
+        for col, values in zip(FILTER_INDEX_COLS, valores) if values
+    )
+    if faixa_partida and any(faixa_partida):
+        spec += ((COLS.PARTIDA_PREV, tuple(faixa_partida)),)
+    return spec
+
+def _is_in(df: pl.DataFrame, col: str, values: list) -> pl.Expr:
+    """`is_in` direto sobre a coluna codificada; em Enum descarta valores fora do domínio."""
+    dtype = df.schema.get(col)
+    if isinstance(dtype, pl.Enum):
+        dominio = set(dtype.categories)
+        values = [v for v in values if v in dominio]
+    return pl.col(col).is_in(values)
+
+@traced()
 def _apply_filters(
     df: pl.DataFrame,
     empresas: list,
@@ -35,30 +139,52 @@ def _apply_filters(
     icao_origem: list,
     icao_destino: list,
     faixa_partida: Optional[tuple],  # (start_str, end_str)
+    index: Optional[BitmapIndex] = None,
 ) -> pl.DataFrame:
+    selections = {
+        COLS.EMPRESA: empresas,
+        COLS.SITUACAO_VOO: situacoes,
+        COLS.STATUS_VOO: status,
+        COLS.TIPO_LINHA: tipos_linha,
+        COLS.ORIGEM_ICAO: icao_origem,
+        COLS.DESTINO_ICAO: icao_destino,
+    }
+    selections = {col: values for col, values in selections.items() if values}
+    if index is not None and selections and index.height == df.height and index.covers(list(selections)):
+        row_range = None
+        if faixa_partida and any(faixa_partida):
+            row_range = _time_range(df, COLS.PARTIDA_PREV, *faixa_partida)
+        if row_range is not None or not (faixa_partida and any(faixa_partida)):
+            # interseção dos row ids pré-computados; só as linhas resultantes são copiadas
+            return df[index.resolve(selections, row_range)]
+
     exprs = []
     if empresas:
-        exprs.append(pl.col(COLS.EMPRESA).is_in(empresas))
+        exprs.append(_is_in(df, COLS.EMPRESA, empresas))
     if situacoes:
-        exprs.append(pl.col(COLS.SITUACAO_VOO).is_in(situacoes))
+        exprs.append(_is_in(df, COLS.SITUACAO_VOO, situacoes))
     if status:
-        exprs.append(pl.col(COLS.STATUS_VOO).is_in(status))
+        exprs.append(_is_in(df, COLS.STATUS_VOO, status))
     if tipos_linha:
-        exprs.append(pl.col(COLS.TIPO_LINHA).is_in(tipos_linha))
+        exprs.append(_is_in(df, COLS.TIPO_LINHA, tipos_linha))
     if icao_origem:
-        exprs.append(pl.col(COLS.ORIGEM_ICAO).is_in(icao_origem))
+        exprs.append(_is_in(df, COLS.ORIGEM_ICAO, icao_origem))
     if icao_destino:
-        exprs.append(pl.col(COLS.DESTINO_ICAO).is_in(icao_destino))
+        exprs.append(_is_in(df, COLS.DESTINO_ICAO, icao_destino))
 
-    if faixa_partida and COLS.PARTIDA_PREV in df.columns:
+    if faixa_partida and any(faixa_partida) and COLS.PARTIDA_PREV in df.columns:
         start_str, end_str = faixa_partida
         dtype = df.schema.get(COLS.PARTIDA_PREV)
-        if dtype in (pl.Datetime, pl.Date):
-            day_expr = pl.col(COLS.PARTIDA_PREV).dt.strftime("%Y-%m-%d")
+        sliced = _time_slice(df, COLS.PARTIDA_PREV, start_str, end_str) if dtype in (pl.Datetime, pl.Date) else None
+        if sliced is not None:
+            # eventlog ordenado por partida: o período vira uma fatia por busca binária
+            df = sliced
+        elif dtype in (pl.Datetime, pl.Date):
+            day_expr = pl.col(COLS.PARTIDA_PREV).dt.date()
             if start_str:
-                exprs.append(day_expr >= pl.lit(start_str))
+                exprs.append(day_expr >= pl.lit(date.fromisoformat(start_str)))
             if end_str:
-                exprs.append(day_expr <= pl.lit(end_str))
+                exprs.append(day_expr <= pl.lit(date.fromisoformat(end_str)))
         else:
             s = pl.col(COLS.PARTIDA_PREV)
             if start_str:
@@ -74,63 +200,104 @@ def _apply_filters(
     return df.filter(filtro)
 
 # -------------- agregações gerais --------------
-@st.cache_data(show_spinner=False)
+@cached_agg
+def _agg_kpis(df: pl.DataFrame) -> tuple:
+    """(voos, empresas distintas, rotas distintas)."""
+    empresas = df.select(pl.col(COLS.EMPRESA).n_unique()).item() if COLS.EMPRESA in df.columns else 0
+    rotas = (
+        df.select(
+            pl.concat_str([pl.col(COLS.ORIGEM_ICAO), pl.lit("-"), pl.col(COLS.DESTINO_ICAO)]).n_unique()
+        ).item()
+        if COLS.ORIGEM_ICAO in df.columns and COLS.DESTINO_ICAO in df.columns
+        else 0
+    )
+    return _total_voos(df), empresas, rotas
+
+@cached_agg
 def _agg_voos_por_dia(df: pl.DataFrame) -> pl.DataFrame:
     if COLS.PARTIDA_PREV in df.columns and df.schema.get(COLS.PARTIDA_PREV) in (pl.Datetime, pl.Date):
         return (
             df.with_columns(pl.col(COLS.PARTIDA_PREV).dt.date().alias("Dia"))
               .group_by("Dia")
-              .agg(pl.len().alias("Voos"))
+              .agg(_count_expr(df).alias("Voos"))
               .sort("Dia")
         )
     elif COLS.PARTIDA_PREV in df.columns:
         return (
             df.with_columns(pl.col(COLS.PARTIDA_PREV).str.slice(0, 10).alias("dia_str"))
               .group_by("dia_str")
-              .agg(pl.len().alias("Voos"))
+              .agg(_count_expr(df).alias("Voos"))
               .sort("dia_str")
         )
     return pl.DataFrame({"Dia": [], "Voos": []})
 
-@st.cache_data(show_spinner=False)
+@cached_agg
 def _agg_status(df: pl.DataFrame) -> pl.DataFrame:
     col = COLS.STATUS_VOO if COLS.STATUS_VOO in df.columns else COLS.SITUACAO_VOO
     if col not in df.columns:
         return pl.DataFrame({"status": [], "Quantidade": []})
-    return (df.group_by(col).agg(pl.len().alias("Quantidade"))
+    return (df.group_by(col).agg(_count_expr(df).alias("Quantidade"))
               .rename({col: "status"})
               .sort("Quantidade", descending=True))
 
-@st.cache_data(show_spinner=False)
+@cached_agg
 def _agg_top_rotas(df: pl.DataFrame, topn: int = 20) -> pl.DataFrame:
     base_cols = [c for c in (COLS.ORIGEM_ICAO, COLS.DESTINO_ICAO) if c in df.columns]
     if len(base_cols) < 2:
         return pl.DataFrame({"origem": [], "destino": [], "Quantidade": []})
     return (
         df.group_by([COLS.ORIGEM_ICAO, COLS.DESTINO_ICAO])
-          .agg(pl.len().alias("Quantidade"))
+          .agg(_count_expr(df).alias("Quantidade"))
           .sort("Quantidade", descending=True)
           .head(topn)
           .rename({COLS.ORIGEM_ICAO: "origem", COLS.DESTINO_ICAO: "destino"})
     )
 
 # -------------- atrasos e insights --------------
-@st.cache_data(show_spinner=False)
-def _base_atraso(df: pl.DataFrame, limite: int) -> pl.DataFrame:
+# Cada agregação de atraso é um plano lazy sobre a base de atraso: a versão
+# individual (`_agg_*`) coleta o próprio plano e o lote (`_agg_atrasos_lote`)
+# coleta todos juntos, compartilhando um único scan.
+
+def _base_atraso_vazia(df: pl.DataFrame) -> Optional[pl.DataFrame]:
+    """Resultado de `_base_atraso` quando faltam colunas ou linhas; None se há o que calcular."""
+    if _is_cube(df):
+        if COLS.FAIXA_ATRASO not in df.columns or df.height == 0:
+            return pl.DataFrame(schema={COLS.QTD_VOOS: pl.UInt32})
+        return None
     req = [COLS.PARTIDA_PREV, COLS.PARTIDA_REAL]
     if any(c not in df.columns for c in req) or df.height == 0:
         return pl.DataFrame(schema={"atraso_min": pl.Float64})
+    return None
+
+def _plan_base_atraso(lf: pl.LazyFrame, cube: bool, limite: int) -> pl.LazyFrame:
+    calendario = [
+        pl.col(COLS.PARTIDA_PREV).dt.year().alias("Ano"),
+        pl.col(COLS.PARTIDA_PREV).dt.weekday().alias("dia_sem"),
+        pl.col(COLS.PARTIDA_PREV).dt.hour().alias("hora"),
+    ]
+    if cube:
+        # no cubo o atraso já vem em faixas de 5 min: "faixa > limite" equivale a "atraso > limite"
+        return (
+            lf
+            .filter(pl.col(COLS.FAIXA_ATRASO).is_not_null() & (pl.col(COLS.FAIXA_ATRASO) > limite))
+            .with_columns(calendario)
+        )
     return (
-        df
+        lf
         .with_columns([
             (pl.col(COLS.PARTIDA_REAL) - pl.col(COLS.PARTIDA_PREV)).dt.total_minutes().alias("atraso_min"),
-            pl.col(COLS.PARTIDA_PREV).dt.year().alias("Ano"),
-            pl.col(COLS.PARTIDA_PREV).dt.weekday().alias("dia_sem"),
-            pl.col(COLS.PARTIDA_PREV).dt.hour().alias("hora"),
+            *calendario,
         ])
         .filter(pl.col("atraso_min").is_not_null() & (pl.col("atraso_min") > limite))
     )
 
+@derived_view
+def _base_atraso(df: pl.DataFrame, limite: int) -> pl.DataFrame:
+    vazia = _base_atraso_vazia(df)
+    if vazia is not None:
+        return vazia
+    return _plan_base_atraso(df.lazy(), _is_cube(df), limite).collect()
+
 def _periodo_expr(h: pl.Expr) -> pl.Expr:
     return (
         pl.when((h >= 0) & (h < 6)).then(pl.lit("Madrugada"))
@@ -140,29 +307,29 @@ def _periodo_expr(h: pl.Expr) -> pl.Expr:
          .alias("periodo")
     )
 
-@st.cache_data(show_spinner=False)
-def _agg_aeroporto_mais_atrasos(df: pl.DataFrame) -> pl.DataFrame:
-    if df.is_empty() or COLS.ORIGEM not in df.columns:
-        return pl.DataFrame({"Aeroporto": [], "Quantidade Atrasos": []})
+def _plan_aeroporto_mais_atrasos(lf: pl.LazyFrame, count: pl.Expr) -> pl.LazyFrame:
     return (
-        df.group_by(COLS.ORIGEM)
-          .agg(pl.len().alias("Quantidade Atrasos"))
+        lf.group_by(COLS.ORIGEM)
+          .agg(count.alias("Quantidade Atrasos"))
           .rename({COLS.ORIGEM: "Aeroporto"})
           .sort("Quantidade Atrasos", descending=True)
     )
 
-@st.cache_data(show_spinner=False)
-def _agg_variacao_aeroporto(df: pl.DataFrame):  # ajuste o import conforme sua estrutura
-
-    if df.is_empty() or any(c not in df.columns for c in [COLS.ORIGEM, "ano"]):
-        return (pl.DataFrame(), pl.DataFrame(), None, None)
-
-    # garante tipo inteiro para o ano
-    df2 = df.with_columns(pl.col("ano").cast(pl.Int32))
+@cached_agg
+def _agg_aeroporto_mais_atrasos(df: pl.DataFrame) -> pl.DataFrame:
+    if df.is_empty() or COLS.ORIGEM not in df.columns:
+        return pl.DataFrame({"Aeroporto": [], "Quantidade Atrasos": []})
+    return _plan_aeroporto_mais_atrasos(df.lazy(), _count_expr(df)).collect()
 
-    # atrasos por ano e aeroporto
-    por_ano = df2.group_by(["ano", COLS.ORIGEM]).agg(pl.len().alias("qtd"))
+def _plan_variacao_aeroporto(lf: pl.LazyFrame, count: pl.Expr) -> pl.LazyFrame:
+    # atrasos por ano e aeroporto (garante tipo inteiro para o ano)
+    return (
+        lf.with_columns(pl.col("ano").cast(pl.Int32))
+          .group_by(["ano", COLS.ORIGEM])
+          .agg(count.alias("qtd"))
+    )
 
+def _variacao_from_por_ano(por_ano: pl.DataFrame):
     # escolhe os dois anos mais recentes
     anos = (
         por_ano.select(pl.col("ano").drop_nulls().unique().sort())
@@ -193,40 +360,212 @@ def _agg_variacao_aeroporto(df: pl.DataFrame):  # ajuste o import conforme sua e
 
     return (maiores_aumentos, maiores_quedas, a1, a2)
 
-@st.cache_data(show_spinner=False)
+@cached_agg
+def _agg_variacao_aeroporto(df: pl.DataFrame):  # ajuste o import conforme sua estrutura
+
+    if df.is_empty() or any(c not in df.columns for c in [COLS.ORIGEM, "ano"]):
+        return (pl.DataFrame(), pl.DataFrame(), None, None)
+    return _variacao_from_por_ano(_plan_variacao_aeroporto(df.lazy(), _count_expr(df)).collect())
+
+def _plan_atrasos_por_ano(lf: pl.LazyFrame, count: pl.Expr) -> pl.LazyFrame:
+    return lf.group_by("Ano").agg(count.alias("Quantidade Atrasos")).sort("Ano")
+
+@cached_agg
 def _agg_atrasos_por_ano(df: pl.DataFrame) -> pl.DataFrame:
     if df.is_empty() or "Ano" not in df.columns:
         return pl.DataFrame({"Ano": [], "Quantidade Atrasos": []})
-    return df.group_by("Ano").agg(pl.len().alias("Quantidade Atrasos")).sort("Ano")
+    return _plan_atrasos_por_ano(df.lazy(), _count_expr(df)).collect()
+
+def _plan_dias_semana_por_ano(lf: pl.LazyFrame, count: pl.Expr) -> pl.LazyFrame:
+    return (
+        lf.group_by(["Ano", "dia_sem"])
+          .agg(count.alias("Quantidade Atrasos"))
+          .sort(["Ano", "Quantidade Atrasos"], descending=[False, True])
+    )
 
-@st.cache_data(show_spinner=False)
+@cached_agg
 def _agg_dias_semana_por_ano(df: pl.DataFrame) -> pl.DataFrame:
     if df.is_empty() or any(c not in df.columns for c in ["Ano", "dia_sem"]):
         return pl.DataFrame({"Ano": [], "dia_sem": [], "Quantidade Atrasos": []})
+    return _plan_dias_semana_por_ano(df.lazy(), _count_expr(df)).collect()
+
+def _plan_periodo_por_ano(lf: pl.LazyFrame, count: pl.Expr) -> pl.LazyFrame:
     return (
-        df.group_by(["Ano", "dia_sem"])
-          .agg(pl.len().alias("Quantidade Atrasos"))
+        lf.with_columns(_periodo_expr(pl.col("hora")))
+          .group_by(["Ano", "periodo"])
+          .agg(count.alias("Quantidade Atrasos"))
           .sort(["Ano", "Quantidade Atrasos"], descending=[False, True])
     )
 
-@st.cache_data(show_spinner=False)
+@cached_agg
 def _agg_periodo_por_ano(df: pl.DataFrame) -> pl.DataFrame:
     if df.is_empty() or any(c not in df.columns for c in ["Ano", "hora"]):
         return pl.DataFrame({"Ano": [], "periodo": [], "Quantidade Atrasos": []})
+    return _plan_periodo_por_ano(df.lazy(), _count_expr(df)).collect()
+
+def _plan_companhias_por_ano(lf: pl.LazyFrame, count: pl.Expr) -> pl.LazyFrame:
     return (
-        df.with_columns(_periodo_expr(pl.col("hora")))
-          .group_by(["Ano", "periodo"])
-          .agg(pl.len().alias("Quantidade Atrasos"))
+        lf.group_by(["Ano", COLS.EMPRESA])
+          .agg(count.alias("Quantidade Atrasos"))
+          .rename({COLS.EMPRESA: "empresa"})
           .sort(["Ano", "Quantidade Atrasos"], descending=[False, True])
     )
 
-@st.cache_data(show_spinner=False)
+@cached_agg
 def _agg_companhias_por_ano(df: pl.DataFrame) -> pl.DataFrame:
     if df.is_empty() or COLS.EMPRESA not in df.columns or "Ano" not in df.columns:
         return pl.DataFrame({"Ano": [], "empresa": [], "Quantidade Atrasos": []})
+    return _plan_companhias_por_ano(df.lazy(), _count_expr(df)).collect()
+
+# agregação -> (colunas exigidas, plano lazy, finalização opcional sobre o resultado coletado)
+DELAY_AGGS = {
+    _agg_aeroporto_mais_atrasos: ((COLS.ORIGEM,), _plan_aeroporto_mais_atrasos, None),
+    _agg_variacao_aeroporto: ((COLS.ORIGEM, "ano"), _plan_variacao_aeroporto, _variacao_from_por_ano),
+    _agg_atrasos_por_ano: (("Ano",), _plan_atrasos_por_ano, None),
+    _agg_dias_semana_por_ano: (("Ano", "dia_sem"), _plan_dias_semana_por_ano, None),
+    _agg_periodo_por_ano: (("Ano", "hora"), _plan_periodo_por_ano, None),
+    _agg_companhias_por_ano: (("Ano", COLS.EMPRESA), _plan_companhias_por_ano, None),
+}
+
+def _collect_atrasos(df: pl.DataFrame, limite: int) -> dict:
+    """Todas as agregações de `DELAY_AGGS` sobre a base de atraso num único `collect_all`.
+
+    Os planos partem da mesma base lazy; com `comm_subplan_elim` o Polars
+    calcula filtro e colunas de calendário uma vez, lendo só as colunas que
+    algum plano usa, e alimenta todos os group_bys.
+    """
+    vazia = _base_atraso_vazia(df)
+    if vazia is not None:
+        return {fn: fn(vazia) for fn in DELAY_AGGS}
+
+    base = _plan_base_atraso(df.lazy(), _is_cube(df), limite)
+    schema = base.collect_schema()
+    count = _count_expr(df)
+    plans = {
+        fn: plan(base, count)
+        for fn, (required, plan, _) in DELAY_AGGS.items()
+        if all(c in schema for c in required)
+    }
+    linhas, *collected = pl.collect_all([base.select(pl.len()), *plans.values()], comm_subplan_elim=True)
+    results = dict(zip(plans, collected))
+
+    # sem linhas ou sem colunas: o retorno padrão vem da própria função
+    vazio = pl.DataFrame(schema=schema)
+    out = {}
+    for fn, (_, _, finish) in DELAY_AGGS.items():
+        if fn in results and linhas.item() > 0:
+            out[fn] = finish(results[fn]) if finish else results[fn]
+        else:
+            out[fn] = fn(vazio)
+    return out
+
+@traced()
+def _agg_atrasos_lote(df, limite: int) -> dict:
+    """Resultados de todas as agregações de `DELAY_AGGS` sobre `_base_atraso(df, limite)`.
+
+    Com um `FrameView`, o que falta no cache é calculado de uma vez e guardado
+    sob as mesmas chaves das funções individuais, então as chamadas seguintes
+    a `_agg_*` sobre o view de atraso acertam o cache.
+    """
+    if not isinstance(df, FrameView):
+        return _collect_atrasos(df, limite)
+
+    view = _base_atraso(df, limite)
+    keys = {fn: agg_key(view, fn) for fn in DELAY_AGGS}
+    cached = {fn: view.cache.get(key) for fn, key in keys.items()}
+    if all(v is not None for v in cached.values()):
+        return cached
+
+    results = _collect_atrasos(df.frame, limite)
+    for fn, value in results.items():
+        view.cache.put(keys[fn], value)
+    return results
+
+# -------------- percentis de atraso (sketches) --------------
+# agrupamentos oferecidos -> colunas do sketch
+PERCENTIL_GRUPOS = {
+    "Rota": (COLS.ORIGEM_ICAO, COLS.DESTINO_ICAO),
+    "Aeroporto de origem": (COLS.ORIGEM_ICAO, COLS.ORIGEM),
+    "Aeroporto de destino": (COLS.DESTINO_ICAO, COLS.DESTINO),
+    "Companhia": (COLS.EMPRESA,),
+}
+
+def _is_sketch(df: pl.DataFrame) -> bool:
+    return DelaySketch.BUCKET_COL in df.columns
+
+@derived_view
+def _delay_sketch(df: pl.DataFrame) -> pl.DataFrame:
+    """Sketch de `df`: o próprio frame se já for um sketch, senão montado agora a partir do eventlog."""
+    if _is_sketch(df) or COLS.PARTIDA_REAL not in df.columns:
+        return df
+    return DelaySketch().build(df)
+
+@cached_agg
+def _agg_percentis_atraso(df: pl.DataFrame, by: tuple = (), qs: tuple = (0.5, 0.9, 0.99)) -> pl.DataFrame:
+    """p50/p90/... do atraso de partida por `by`, fundindo os sketches (sem reler o eventlog)."""
+    if df.is_empty() or not _is_sketch(df) or not all(c in df.columns for c in by):
+        return pl.DataFrame(schema={**{c: pl.Utf8 for c in by}, COLS.QTD_VOOS: pl.UInt32, **{f"p{q * 100:g}": pl.Float64 for q in qs}})
+    out = DelaySketch().quantiles(df, list(by), qs)
+    return out.sort(COLS.QTD_VOOS, descending=True) if by else out
+
+# -------------- pontualidade em janelas móveis --------------
+def _is_series(df: pl.DataFrame) -> bool:
+    return "Voos Acum" in df.columns
+
+@derived_view
+def _rolling_store(df: pl.DataFrame) -> pl.DataFrame:
+    """Série de pontualidade: o próprio frame se já for a série gravada pelo pipeline, senão montada do eventlog."""
+    if _is_series(df) or COLS.PARTIDA_REAL not in df.columns:
+        return df
+    return RollingSeries().build(df)
+
+@cached_agg
+def _agg_entidades_serie(df: pl.DataFrame, tipo: str) -> list:
+    """Entidades do `tipo` na série, da com mais voos para a com menos."""
+    if not _is_series(df):
+        return []
     return (
-        df.group_by(["Ano", COLS.EMPRESA])
-          .agg(pl.len().alias("Quantidade Atrasos"))
-          .rename({COLS.EMPRESA: "empresa"})
-          .sort(["Ano", "Quantidade Atrasos"], descending=[False, True])
+        df.filter(pl.col("Tipo") == tipo)
+        .group_by("Entidade").agg(pl.col("Voos").sum())
+        .sort(["Voos", "Entidade"], descending=[True, False])
+        .get_column("Entidade").to_list()
     )
+
+@cached_agg
+def _agg_serie_pontualidade(df: pl.DataFrame, tipo: str, entidade: str, janelas: tuple = RollingSeries.WINDOWS) -> pl.DataFrame:
+    if not _is_series(df):
+        return pl.DataFrame(schema={"Dia": pl.Date, "Voos": pl.UInt32})
+    return RollingSeries().series(df, tipo, entidade, janelas)
+
+# -------------- comparação entre períodos --------------
+def _is_period_store(df: pl.DataFrame) -> bool:
+    return "Granularidade" in df.columns
+
+@derived_view
+def _period_store(df: pl.DataFrame) -> pl.DataFrame:
+    """Contagens por período x entidade: o próprio frame se já vier do pipeline, senão montadas do eventlog/cubo."""
+    if _is_period_store(df) or COLS.PARTIDA_PREV not in df.columns:
+        return df
+    return PeriodComparison().build(df)
+
+@cached_agg
+def _agg_periodos(df: pl.DataFrame, granularidade: str) -> list:
+    if not _is_period_store(df):
+        return []
+    return PeriodComparison().periods(df, granularidade)
+
+@cached_agg
+def _agg_comparacao_periodos(
+    df: pl.DataFrame,
+    granularidade: str,
+    tipo: str,
+    anterior: str,
+    atual: str,
+    limite: Optional[int] = None,
+    top: int = 10,
+) -> tuple:
+    """(maiores aumentos, maiores quedas) de `tipo` entre dois períodos; `limite` conta só atrasos acima dele."""
+    if not _is_period_store(df):
+        vazio = pl.DataFrame(schema={tipo: pl.Utf8, "Anterior": pl.Int64, "Atual": pl.Int64, "Delta": pl.Int64})
+        return vazio, vazio
+    return PeriodComparison().compare(df, granularidade, tipo, anterior, atual, limite, top)
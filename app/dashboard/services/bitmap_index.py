@@ -0,0 +1,113 @@
+# dashboard/services/bitmap_index.py
+from __future__ import annotations
+from typing import Optional
+import numpy as np
+import polars as pl
+
+from app.utils.perf import traced
+from .agg_cache import _agg_cache
+
+
+class BitmapIndex:
+    """Índice invertido (valor -> linhas) para as colunas dos filtros multiselect.
+
+    Cada valor guarda suas linhas em uma de duas formas, como num bitmap
+    "roaring": lista ordenada de row ids (uint32) quando o valor é esparso, ou
+    bitset compactado (`np.packbits`) quando cobre mais de 1/32 das linhas e a
+    lista sairia maior que o bitset. Os filtros viram uniões (dentro da coluna)
+    e interseções (entre colunas) desses conjuntos; só as linhas resultantes
+    são materializadas.
+    """
+
+    DENSE_RATIO = 32
+
+    def __init__(self, df: pl.DataFrame, columns: list):
+        self.height = df.height
+        self.postings: dict[str, dict] = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            # ordenação estável pelo código físico: cada valor vira um trecho contíguo de row ids crescentes
+            codigo = pl.col(col).to_physical()
+            ordered = df.select([
+                codigo.sort(nulls_last=True).alias("_codigo"),
+                pl.int_range(pl.len(), dtype=pl.UInt32).sort_by(codigo, nulls_last=True, maintain_order=True).alias("_rid"),
+            ]).head(df.height - df.get_column(col).null_count())
+            row_ids = ordered.get_column("_rid").to_numpy()
+            lens = ordered.get_column("_codigo").rle().struct.field("len").to_numpy()
+            ends = np.cumsum(lens)
+            # valor de cada trecho: o da sua primeira linha
+            values = df.get_column(col).gather(row_ids[ends - lens])
+            postings = {}
+            for value, ids in zip(values.to_list(), np.split(row_ids, ends[:-1])):
+                if len(ids) * self.DENSE_RATIO > self.height:
+                    mask = np.zeros(self.height, dtype=bool)
+                    mask[ids] = True
+                    postings[value] = np.packbits(mask)
+                else:
+                    postings[value] = ids
+            self.postings[col] = postings
+
+    @property
+    def nbytes(self) -> int:
+        return sum(p.nbytes for postings in self.postings.values() for p in postings.values())
+
+    def covers(self, columns: list) -> bool:
+        return all(c in self.postings for c in columns)
+
+    def _is_dense(self, posting: np.ndarray) -> bool:
+        return posting.dtype == np.uint8
+
+    def _mask(self, posting: np.ndarray) -> np.ndarray:
+        return np.unpackbits(posting, count=self.height).astype(bool)
+
+    def _union(self, col: str, values: list) -> np.ndarray:
+        """Linhas com qualquer um dos `values` em `col` (row ids ou bitset)."""
+        postings = [self.postings[col][v] for v in values if v in self.postings[col]]
+        if not postings:
+            return np.empty(0, dtype=np.uint32)
+        if any(self._is_dense(p) for p in postings):
+            mask = np.zeros(self.height, dtype=bool)
+            for p in postings:
+                if self._is_dense(p):
+                    mask |= self._mask(p)
+                else:
+                    mask[p] = True
+            return np.packbits(mask)
+        if len(postings) == 1:
+            return postings[0]
+        return np.unique(np.concatenate(postings))
+
+    def resolve(self, selections: dict, row_range: Optional[tuple] = None) -> np.ndarray:
+        """Row ids (ordenados) que satisfazem todas as seleções e caem em `row_range` [lo, hi)."""
+        sets = [self._union(col, values) for col, values in selections.items() if values]
+        sparse = sorted((s for s in sets if not self._is_dense(s)), key=len)
+        dense = [s for s in sets if self._is_dense(s)]
+
+        if sparse:
+            ids = sparse[0]
+            for other in sparse[1:]:
+                ids = np.intersect1d(ids, other, assume_unique=True)
+        else:
+            mask = self._mask(dense.pop(0)) if dense else np.ones(self.height, dtype=bool)
+            if row_range is not None:
+                lo, hi = row_range
+                mask[:lo] = False
+                mask[hi:] = False
+            ids = np.flatnonzero(mask).astype(np.uint32)
+
+        if row_range is not None and len(ids):
+            lo, hi = row_range
+            ids = ids[np.searchsorted(ids, lo, side="left"):np.searchsorted(ids, hi, side="left")]
+        for d in dense:
+            if not len(ids):
+                break
+            # bit da linha no bitset compactado: byte id // 8, bit 7 - id % 8
+            ids = ids[(d[ids >> 3] >> (7 - (ids & 7))) & 1 == 1]
+        return ids
+
+
+@traced()
+def _build_bitmap_index(df: pl.DataFrame, columns: tuple, key: tuple) -> BitmapIndex:
+    """Índice de `df`, guardado no cache de agregações sob `key` (a chave do `FrameView`)."""
+    return _agg_cache().get_or_compute(key + (("bitmap_index", columns),), lambda: BitmapIndex(df, list(columns)))
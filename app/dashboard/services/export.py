@@ -0,0 +1,117 @@
+# dashboard/services/export.py
+from __future__ import annotations
+import gzip
+import hashlib
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Callable, Optional, Sequence
+import polars as pl
+
+from app.model.star_schema import StarSchema
+from app.utils.perf import traced
+
+_USE_ZSTD = True
+try:
+    import zstandard  # type: ignore
+except Exception:
+    _USE_ZSTD = False
+
+# Arquivos temporários de exportação (um por view/formato/colunas)
+EXPORT_DIR = Path(tempfile.gettempdir()) / "airports_flights_exports"
+# Linhas por bloco na escrita do CSV comprimido
+EXPORT_CHUNK_ROWS = 200_000
+# Exportações não baixadas são apagadas depois desse tempo
+EXPORT_TTL_S = 30 * 60
+
+# formato -> (extensão, mime)
+EXPORT_FORMATS = {
+    "parquet": (".parquet", "application/octet-stream"),
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+}
+if _USE_ZSTD:
+    EXPORT_FORMATS["csv.zst"] = (".csv.zst", "application/zstd")
+
+
+def _open_compressed(path: Path, fmt: str) -> IO[bytes]:
+    if fmt == "csv.gz":
+        return gzip.open(path, "wb", compresslevel=6)
+    return zstandard.ZstdCompressor(level=3).stream_writer(open(path, "wb"), closefd=True)
+
+def _write_csv_chunks(df: pl.DataFrame, out: IO[bytes], chunk_rows: int,
+                      prepare: Callable[[pl.DataFrame], pl.DataFrame] = lambda chunk: chunk) -> None:
+    """CSV em blocos de `chunk_rows` (fatias sem cópia): só o texto de um bloco fica em memória por vez."""
+    for i, chunk in enumerate(df.iter_slices(chunk_rows)):
+        prepare(chunk).write_csv(out, include_header=i == 0)
+    if df.height == 0:
+        prepare(df).write_csv(out)
+
+def export_path(key: tuple, fmt: str, columns: Sequence[str]) -> Path:
+    digest = hashlib.sha1(repr((key, fmt, tuple(columns))).encode()).hexdigest()[:16]
+    return EXPORT_DIR / f"voos_filtrado_{digest}{EXPORT_FORMATS[fmt][0]}"
+
+@traced()
+def _export_filtered(
+    df: pl.DataFrame,
+    path: Path,
+    fmt: str,
+    columns: Optional[Sequence[str]] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    dims: Optional[dict] = None,
+) -> Path:
+    """Grava `df` (só `columns`) em `path` sem montar o arquivo inteiro em memória.
+
+    Parquet e CSV simples saem pelo engine de streaming (`sink_*`); CSV
+    comprimido é escrito bloco a bloco no compressor. O arquivo é gerado num
+    `.tmp` e renomeado no fim, para um download nunca ver um arquivo pela metade.
+    Com `dims` (eventlog em estrela) as colunas das dimensões entram junto com a
+    escrita, a partir dos ids.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação desconhecido: {fmt}")
+    star = StarSchema() if dims is not None else None
+    if columns:
+        df = df.select(star.required_columns(columns, df.columns) if star is not None else columns)
+
+    def _prepare(frame):
+        if star is None:
+            return frame
+        frame = star.expand(frame, dims, columns)
+        return frame.select(columns) if columns else frame
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    if fmt == "parquet":
+        _prepare(df.lazy()).sink_parquet(tmp)
+    elif fmt == "csv":
+        _prepare(df.lazy()).sink_csv(tmp)
+    else:
+        with _open_compressed(tmp, fmt) as out:
+            _write_csv_chunks(df, out, chunk_rows, _prepare)
+    tmp.replace(path)
+    return path
+
+def _evict_exports(max_age_s: float = EXPORT_TTL_S, keep: Optional[Path] = None,
+                   export_dir: Path = EXPORT_DIR) -> int:
+    """Apaga exportações mais velhas que `max_age_s` (exceto `keep`); devolve quantas saíram."""
+    if not export_dir.exists():
+        return 0
+    limite = time.time() - max_age_s
+    removidos = 0
+    for path in export_dir.iterdir():
+        if path == keep:
+            continue
+        try:
+            if path.stat().st_mtime < limite:
+                path.unlink()
+                removidos += 1
+        except FileNotFoundError:
+            pass  # outra sessão já apagou
+    return removidos
+
+def _discard_export(path: Path, on_discard: Optional[Callable[[], None]] = None) -> None:
+    """Remove o arquivo depois do download (callback do `st.download_button`)."""
+    path.unlink(missing_ok=True)
+    if on_discard is not None:
+        on_discard()
@@ -1,19 +1,97 @@
 
 # dashboard/services/io.py
 from __future__ import annotations
-from typing import Optional, Tuple
+import hashlib
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
 import polars as pl
 import streamlit as st
 
+from app.model.aggregate_cube import AggregateCube
+from app.model.star_schema import StarSchema
+from app.utils.perf import traced
+from .agg_cache import FrameView, cached_agg
+from .aggregations import COLS, STAR_COLUMNS
+from .time_index import _sort_by_time
+
+_TIME_COL = "Partida Prevista"
+
+# Os loaders recebem `version` (de `_source_version`) só para a chave do cache:
+# um Parquet regravado pela ingestão é lido de novo, mesmo no mesmo caminho.
+def _source_version(path: Optional[str]) -> Optional[str]:
+    """Versão de um arquivo ou dataset em disco: nome, tamanho e mtime de cada Parquet, sem ler dados."""
+    if not path or not Path(path).exists():
+        return None
+    root = Path(path)
+    files = sorted(root.rglob("*.parquet")) if root.is_dir() else [root]
+    h = hashlib.sha1()
+    for f in files:
+        stat = f.stat()
+        h.update(f"{f.relative_to(root) if root.is_dir() else f.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+@traced()
+@st.cache_data(show_spinner=False)
+def _load_parquet_from_path(path: str, version: Optional[str] = None) -> pl.DataFrame:
+    return _sort_by_time(pl.read_parquet(path), _TIME_COL)
+
+@traced()
+@st.cache_data(show_spinner=False)
+def _load_cube(path: str, version: Optional[str] = None) -> Optional[pl.DataFrame]:
+    if not Path(path).exists():
+        return None
+    cube = pl.read_parquet(path)
+    # sem compressão o cubo só duplicaria o eventlog na memória: os gráficos usam o fato
+    if not AggregateCube.compresses(cube):
+        return None
+    return _sort_by_time(cube, _TIME_COL)
+
+@traced()
+@st.cache_data(show_spinner=False)
+def _load_delay_sketch(path: str, version: Optional[str] = None) -> Optional[pl.DataFrame]:
+    if not Path(path).exists():
+        return None
+    return _sort_by_time(pl.read_parquet(path), _TIME_COL)
+
+@traced()
 @st.cache_data(show_spinner=False)
-def _load_parquet_from_path(path: str) -> pl.DataFrame:
+def _load_series(path: str, version: Optional[str] = None) -> Optional[pl.DataFrame]:
+    if not Path(path).exists():
+        return None
     return pl.read_parquet(path)
 
+@traced()
 @st.cache_data(show_spinner=False)
-def _load_parquet_from_bytes(file_bytes: bytes) -> pl.DataFrame:
-    return pl.read_parquet(file_bytes)
+def _load_periods(path: str, version: Optional[str] = None) -> Optional[pl.DataFrame]:
+    if not Path(path).exists():
+        return None
+    return pl.read_parquet(path)
+
+@traced()
+@st.cache_data(show_spinner=False)
+def _load_dimensions(path: str, version: Optional[str] = None) -> Optional[dict]:
+    return StarSchema.read(path)
+
+@traced()
+def _expand_star(df: pl.DataFrame, dims: Optional[dict]) -> pl.DataFrame:
+    """Fato em estrela -> frame de análise: só as `STAR_COLUMNS` saem das dimensões; os ids ficam
+    para a exibição buscar as demais colunas (navegador/exportação)."""
+    if dims is None or not StarSchema.is_star(df.columns):
+        return df
+    return StarSchema().expand(df, dims, STAR_COLUMNS, keep_keys=True)
 
+def _expand_view(view: FrameView, dims: Optional[dict], dims_key: str) -> FrameView:
+    """`_expand_star` sobre um view: resolvido uma vez e guardado no cache de agregações."""
+    if dims is None or not StarSchema.is_star(view.columns):
+        return view
+    return FrameView(view.key + (("estrela", dims_key),), resolve=lambda: _expand_star(view.frame, dims), cache=view.cache)
+
+@traced()
 @st.cache_data(show_spinner=False)
+def _load_parquet_from_bytes(file_bytes: bytes) -> pl.DataFrame:
+    return _sort_by_time(pl.read_parquet(file_bytes), _TIME_COL)
+
+@cached_agg
 def _unique_values(df: pl.DataFrame, col: str, limit: int = 20000) -> list:
     if col not in df.columns:
         return []
@@ -22,7 +100,7 @@ def _unique_values(df: pl.DataFrame, col: str, limit: int = 20000) -> list:
         vals = vals[:limit]
     return sorted([v for v in vals if v is not None])
 
-@st.cache_data(show_spinner=False)
+@cached_agg
 def _date_bounds(df: pl.DataFrame, col: str) -> Tuple[Optional[object], Optional[object]]:
     if col not in df.columns:
         return (None, None)
@@ -33,3 +111,85 @@ def _date_bounds(df: pl.DataFrame, col: str) -> Tuple[Optional[object], Optional
     if s.is_empty():
         return (None, None)
     return (s.min(), s.max())
+
+# -------------- dataset particionado (ano=/mes=/empresa=) --------------
+_PARTITION_KEYS = ("ano", "mes", "empresa")
+# cada combinação de filtros guarda um eventlog inteiro: só as últimas ficam em memória
+_PRUNED_CACHE_ENTRIES = 4
+_PRUNED_CACHE_TTL_S = 30 * 60
+
+def _scan_eventlog(path: str) -> pl.LazyFrame:
+    if Path(path).is_dir():
+        return pl.scan_parquet(path, hive_partitioning=True)
+    return pl.scan_parquet(path)
+
+def _partition_predicates(
+    columns: list,
+    faixa_partida: Optional[tuple],
+    empresas: Optional[Sequence],
+) -> list:
+    """Predicados sobre as chaves hive: partições fora do filtro nem chegam a ser lidas."""
+    exprs = []
+    if faixa_partida and "ano" in columns and "mes" in columns:
+        start_str, end_str = faixa_partida
+        ano_mes = pl.col("ano").cast(pl.Int32) * 100 + pl.col("mes").cast(pl.Int32)
+        if start_str:
+            exprs.append(ano_mes >= int(start_str[:4]) * 100 + int(start_str[5:7]))
+        if end_str:
+            exprs.append(ano_mes <= int(end_str[:4]) * 100 + int(end_str[5:7]))
+    if empresas and "empresa" in columns:
+        exprs.append(pl.col("empresa").cast(pl.Utf8).is_in(list(empresas)))
+    return exprs
+
+@traced()
+@st.cache_data(show_spinner=False, max_entries=_PRUNED_CACHE_ENTRIES, ttl=_PRUNED_CACHE_TTL_S)
+def _load_eventlog_pruned(
+    path: str,
+    faixa_partida: Optional[tuple] = None,
+    empresas: Optional[tuple] = None,
+    dimensions_path: Optional[str] = None,
+    version: Optional[tuple] = None,
+) -> pl.DataFrame:
+    lf = _scan_eventlog(path)
+    columns = lf.collect_schema().names()
+    dims = _load_dimensions(dimensions_path, _source_version(dimensions_path)) if dimensions_path else None
+    if empresas and dims is not None and StarSchema.AIRLINE_KEY in columns:
+        # eventlog em estrela: as partições por companhia usam o id
+        companhias = dims["companhias"].filter(pl.col(COLS.EMPRESA).cast(pl.Utf8).is_in(list(empresas)))
+        empresas = tuple(str(i) for i in companhias.get_column(StarSchema.ID_COL))
+    exprs = _partition_predicates(columns, faixa_partida, empresas)
+    if exprs:
+        lf = lf.filter(pl.all_horizontal(exprs))
+    # as partições voltam em ordem lexicográfica (mes=1, mes=10, ...): reordena pelo tempo
+    df = lf.drop([c for c in columns if c in _PARTITION_KEYS]).collect()
+    return _sort_by_time(_expand_star(df, dims), _TIME_COL)
+
+@traced()
+@st.cache_data(show_spinner=False)
+def _dataset_unique_values(
+    path: str,
+    col: str,
+    limit: int = 20000,
+    dimensions_path: Optional[str] = None,
+    version: Optional[tuple] = None,
+) -> list:
+    lf = _scan_eventlog(path)
+    dims = _load_dimensions(dimensions_path, _source_version(dimensions_path)) if dimensions_path else None
+    if dims is not None:
+        lf = StarSchema().expand(lf, dims, [col])
+    if col not in lf.collect_schema().names():
+        return []
+    vals = lf.select(pl.col(col).unique()).collect().to_series().to_list()
+    if len(vals) > limit:
+        vals = vals[:limit]
+    return sorted([v for v in vals if v is not None])
+
+@traced()
+@st.cache_data(show_spinner=False)
+def _dataset_date_bounds(path: str, col: str, version: Optional[tuple] = None) -> Tuple[Optional[object], Optional[object]]:
+    lf = _scan_eventlog(path)
+    schema = lf.collect_schema()
+    if col not in schema.names() or schema.get(col) not in (pl.Datetime, pl.Date):
+        return (None, None)
+    bounds = lf.select(pl.col(col).min().alias("min"), pl.col(col).max().alias("max")).collect()
+    return (bounds.item(0, "min"), bounds.item(0, "max"))
@@ -0,0 +1,48 @@
+# dashboard/services/pagination.py
+from __future__ import annotations
+from typing import Optional, Union
+import polars as pl
+
+from app.model.star_schema import StarSchema
+from app.utils.perf import traced
+from .agg_cache import FrameView, cached_agg
+
+# Tamanhos de página oferecidos no navegador de dados
+PAGE_SIZES = (50, 100, 250, 500)
+
+
+@cached_agg
+def _sort_order(df: pl.DataFrame, col: str, descending: bool = False) -> pl.Series:
+    """Permutação (UInt32/UInt64) que ordena `df` por `col`; calculada uma vez por (view, coluna, sentido).
+
+    Guarda só os índices (4–8 bytes/linha): trocar de página vira um `gather` das linhas visíveis.
+    """
+    return df.get_column(col).arg_sort(descending=descending, nulls_last=True)
+
+@traced()
+def _page_rows(
+    df: Union[FrameView, pl.DataFrame],
+    columns: tuple,
+    page: int,
+    page_size: int,
+    sort_col: Optional[str] = None,
+    descending: bool = False,
+    dims: Optional[dict] = None,
+) -> pl.DataFrame:
+    """Linhas da página `page` (0-based), só com `columns` e Categorical/Enum já em texto.
+
+    Com um `FrameView` a permutação de ordenação fica no cache do view; só as
+    linhas da página são copiadas e convertidas. Com `dims` (eventlog em estrela)
+    as colunas das dimensões saem dos ids dessas linhas.
+    """
+    frame = df.frame if isinstance(df, FrameView) else df
+    offset = page * page_size
+    read = StarSchema().required_columns(columns, frame.columns) if dims is not None else list(columns)
+    if sort_col is None:
+        rows = frame.lazy().select(read).slice(offset, page_size).collect()
+    else:
+        idx = _sort_order(df, sort_col, descending).slice(offset, page_size)
+        rows = frame.select(pl.col(read).gather(idx))
+    if dims is not None:
+        rows = StarSchema().expand(rows, dims, columns).select(columns)
+    return rows.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.Utf8))
@@ -0,0 +1,59 @@
+# dashboard/services/time_index.py
+from __future__ import annotations
+from datetime import date, datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+import polars as pl
+
+
+def _sort_by_time(df: pl.DataFrame, col: str) -> pl.DataFrame:
+    """Ordena por `col` (nulos no fim). Quase sem custo quando o Parquet já vem ordenado,
+    e deixa a flag de ordenação ligada para as buscas binárias de `_time_slice`."""
+    if col not in df.columns or df.schema.get(col) not in (pl.Datetime, pl.Date):
+        return df
+    return df.sort(col, nulls_last=True)
+
+def _is_time_sorted(df: pl.DataFrame, col: str) -> bool:
+    return col in df.columns and df.get_column(col).flags["SORTED_ASC"]
+
+def _bound(dtype: pl.DataType, day: str, next_day: bool = False):
+    d = date.fromisoformat(day) + timedelta(days=1 if next_day else 0)
+    if dtype == pl.Date:
+        return d
+    tz = getattr(dtype, "time_zone", None)
+    return datetime(d.year, d.month, d.day, tzinfo=ZoneInfo(tz) if tz else None)
+
+def _time_range(
+    df: pl.DataFrame,
+    col: str,
+    start_str: Optional[str],
+    end_str: Optional[str],
+) -> Optional[tuple]:
+    """Offsets [lo, hi) das linhas entre start e end (dias inclusivos), por busca binária.
+
+    None se `col` não estiver marcada como ordenada.
+    """
+    if not _is_time_sorted(df, col):
+        return None
+    s = df.get_column(col)
+    lo = int(s.search_sorted(_bound(s.dtype, start_str), side="left")) if start_str else 0
+    if end_str:
+        hi = int(s.search_sorted(_bound(s.dtype, end_str, next_day=True), side="left"))
+    else:
+        # sem limite final: vai até o último valor não nulo
+        hi = df.height - s.null_count()
+    return lo, max(hi, lo)
+
+def _time_slice(
+    df: pl.DataFrame,
+    col: str,
+    start_str: Optional[str],
+    end_str: Optional[str],
+) -> Optional[pl.DataFrame]:
+    """Recorte [start, end] como fatia zero-copy do DataFrame, ou None se `col` não
+    estiver marcada como ordenada (quem chama cai no filtro por comparação)."""
+    rng = _time_range(df, col, start_str, end_str)
+    if rng is None:
+        return None
+    lo, hi = rng
+    return df.slice(lo, hi - lo)
@@ -1,10 +1,21 @@
 
 # dashboard/ui/charts.py
 from __future__ import annotations
-import io
+from datetime import date
+from typing import Optional, Union
 import polars as pl
 import streamlit as st
-from ..services.aggregations import _base_atraso, _agg_variacao_aeroporto
+from ..services.aggregations import _agg_kpis, _agg_percentis_atraso, PERCENTIL_GRUPOS, COLS
+from ..services.aggregations import _agg_entidades_serie, _agg_serie_pontualidade
+from ..services.aggregations import _agg_comparacao_periodos, _agg_periodos
+from app.model.delay_sketch import DelaySketch
+from app.model.period_comparison import PeriodComparison
+from app.model.rolling_series import RollingSeries
+from app.model.star_schema import StarSchema
+from ..services.agg_cache import FrameView
+from ..services.pagination import PAGE_SIZES, _page_rows
+from ..services.export import EXPORT_FORMATS, _discard_export, _evict_exports, _export_filtered, export_path
+from app.utils.perf import traced
 
 _USE_PLOTLY = True
 try:
@@ -17,18 +28,19 @@ from ..services.aggregations import (
     _agg_voos_por_dia, _agg_status, _agg_top_rotas
 )
 
+@traced()
+def _to_pandas(df: pl.DataFrame):
+    """Converte para pandas decodificando Categorical/Enum em texto (os gráficos esperam strings)."""
+    return df.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.Utf8)).to_pandas()
+
+@traced("plotly_chart")
+def _plotly_chart(target, fig):
+    """Serialização + envio da figura ao front (medido à parte da montagem com `px`)."""
+    target.plotly_chart(fig, use_container_width=True)
+
+@traced()
 def render_kpis(df_filtrado: pl.DataFrame):
-    total_voos = df_filtrado.height
-    empresas_k = df_filtrado.select(
-        pl.col("Empresa Aérea").n_unique() if "Empresa Aérea" in df_filtrado.columns else pl.lit(0)
-    ).item()
-    rotas_k = (
-        df_filtrado.select(
-            pl.concat_str([pl.col("ICAO Aeródromo Origem"), pl.lit("-"), pl.col("ICAO Aeródromo Destino")]).n_unique()
-            if "ICAO Aeródromo Origem" in df_filtrado.columns and "ICAO Aeródromo Destino" in df_filtrado.columns
-            else pl.lit(0)
-        ).item()
-    )
+    total_voos, empresas_k, rotas_k = _agg_kpis(df_filtrado)
 
     c1, c2, c3 = st.columns(3)
     c1.metric("Voos (após filtros)", f"{total_voos:,}".replace(",", "."))
@@ -36,6 +48,7 @@ def render_kpis(df_filtrado: pl.DataFrame):
     c3.metric("Rotas distintas", f"{rotas_k:,}".replace(",", "."))
     st.markdown("---")
 
+@traced()
 def render_general_charts(df_filtrado: pl.DataFrame):
     colA, colB = st.columns([2, 1])
 
@@ -45,12 +58,12 @@ def render_general_charts(df_filtrado: pl.DataFrame):
         if ag.height == 0:
             st.info("Sem dados suficientes para este gráfico.")
         else:
-            pdf = ag.to_pandas()
+            pdf = _to_pandas(ag)
             if _USE_PLOTLY:
                 xcol = "Dia" if "Dia" in pdf.columns else "dia_str"
                 fig = px.bar(pdf, x=xcol, y="Voos")
                 fig.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=340)
-                st.plotly_chart(fig, use_container_width=True)
+                _plotly_chart(st, fig)
             else:
                 xcol = "Dia" if "Dia" in pdf.columns else "dia_str"
                 chart = alt.Chart(pdf).mark_bar().encode(x=xcol, y="Voos").properties(height=340)
@@ -62,11 +75,11 @@ def render_general_charts(df_filtrado: pl.DataFrame):
         if ags.height == 0:
             st.info("Sem dados de status.")
         else:
-            pdf = ags.to_pandas()
+            pdf = _to_pandas(ags)
             if _USE_PLOTLY:
                 fig = px.pie(pdf, names="status", values="Quantidade", hole=0.30)
                 fig.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=340, showlegend=True)
-                st.plotly_chart(fig, use_container_width=True)
+                _plotly_chart(st, fig)
             else:
                 chart = alt.Chart(pdf).mark_arc().encode(theta="Quantidade", color="status").properties(height=340)
                 st.altair_chart(chart, use_container_width=True)
@@ -76,11 +89,11 @@ def render_general_charts(df_filtrado: pl.DataFrame):
     if ag_top.height == 0:
         st.info("Sem dados de rotas.")
     else:
-        pdf = ag_top.to_pandas()
+        pdf = _to_pandas(ag_top)
         if _USE_PLOTLY:
             fig = px.bar(pdf, x="Quantidade", y=pdf["origem"] + " ➔ " + pdf["destino"], orientation="h")
             fig.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=520)
-            st.plotly_chart(fig, use_container_width=True)
+            _plotly_chart(st, fig)
         else:
             chart = (
                 alt.Chart(pdf)
@@ -92,50 +105,54 @@ def render_general_charts(df_filtrado: pl.DataFrame):
 
     st.markdown("---")
 
-def _compute_airport_variation_flex(df_delay: pl.DataFrame, df_no_date: pl.DataFrame, delay_limit: int):
-    """
-    Try to compute airport variation (delta). If only one year exists in the
-    current date-filtered dataframe, re-run ignoring date filters but keeping
-    other filters. Returns (increases, decreases, year_prev, year_curr, used_fallback).
-    """
-    inc, dec, y_prev, y_curr = _agg_variacao_aeroporto(df_delay)
-    if y_prev and y_curr:
-        return inc, dec, y_prev, y_curr, False
-
-    # fallback ignoring date
-    df_delay_all = _base_atraso(df_no_date, delay_limit)
-    inc2, dec2, yp2, yc2 = _agg_variacao_aeroporto(df_delay_all)
-    return inc2, dec2, yp2, yc2, True
+@traced()
+def _render_period_comparison(df_periodos: FrameView, delay_limit: int):
+    st.subheader("Variação entre períodos")
+    c1, c2, c3 = st.columns(3)
+    granularidade = c1.selectbox("Período", list(PeriodComparison.PERIODS), index=2, key="cmp_granularidade")
+    tipo = c2.selectbox("Comparar", list(PeriodComparison.ENTITIES), key="cmp_tipo")
+    metrica = c3.selectbox("Contar", ["Atrasos", "Voos"], key="cmp_metrica")
+
+    periodos = _agg_periodos(df_periodos, granularidade)
+    if len(periodos) < 2:
+        st.info("Menos de dois períodos nos dados para comparar.")
+        return
+    c4, c5 = st.columns(2)
+    anterior = c4.selectbox("De", periodos, index=len(periodos) - 2, key=f"cmp_de_{granularidade}")
+    atual = c5.selectbox("Para", periodos, index=len(periodos) - 1, key=f"cmp_para_{granularidade}")
+
+    limite = delay_limit if metrica == "Atrasos" else None
+    aumentos, quedas = _agg_comparacao_periodos(df_periodos, granularidade, tipo, anterior, atual, limite)
+    st.caption(f"{metrica}{f' acima de {delay_limit} min' if limite is not None else ''}: {anterior} → {atual}")
+    for titulo, tabela in (("Maiores aumentos", aumentos), ("Maiores quedas", quedas)):
+        if tabela.is_empty():
+            st.caption(f"{titulo}: nenhum.")
+        elif _USE_PLOTLY:
+            fig = px.bar(_to_pandas(tabela), x="Delta", y=tipo, orientation="h", title=titulo,
+                         hover_data=["Anterior", "Atual"])
+            fig.update_layout(height=240, margin=dict(l=0, r=0, t=40, b=0), yaxis={"autorange": "reversed"})
+            _plotly_chart(st, fig)
+        else:
+            st.dataframe(_to_pandas(tabela))
 
+@traced()
 def render_delay_insights(
     df_delay: pl.DataFrame,
     agg_aeroporto_mais_atrasos,
-    agg_variacao_aeroporto,
     agg_atrasos_por_ano,
     agg_dias_semana_por_ano,
     agg_periodo_por_ano,
     agg_companhias_por_ano,
     *,
-    df_filtered_no_date: pl.DataFrame,   # <-- NOVO (DF filtrado sem a restrição de data)
-    delay_limit: int,                    # <-- NOVO (mesmo limite usado para gerar df_delay)
-    base_delay_fn=None,                  # <-- NOVO (injete aqui sua função _base_atraso; se None, assume _base_atraso global)
+    df_periodos: FrameView,   # contagens por período (filtros sem a data), ver `_period_store`
+    delay_limit: int,         # mesmo limite usado para gerar df_delay
 ):
-    # permite injeção ou fallback para um nome global _base_atraso
-    if base_delay_fn is None:
-        try:
-            base_delay_fn = _base_atraso  # type: ignore[name-defined]
-        except NameError:
-            raise RuntimeError(
-                "Defina base_delay_fn (ex.: _base_atraso) ao chamar render_delay_insights "
-                "ou garanta que _base_atraso esteja no escopo."
-            )
-
     col1, col2 = st.columns([1.3, 1])
 
     # 1) Aeroportos com mais atrasos
     ag_aero = agg_aeroporto_mais_atrasos(df_delay)
     if ag_aero.height > 0:
-        pdf = ag_aero.head(25).to_pandas()
+        pdf = _to_pandas(ag_aero.head(25))
         if _USE_PLOTLY:
             fig = px.bar(
                 pdf,
@@ -145,65 +162,26 @@ def render_delay_insights(
                 title="Aeroportos com mais atrasos (Top 25)",
             )
             fig.update_layout(height=520, margin=dict(l=0, r=0, t=40, b=0))
-            col1.plotly_chart(fig, use_container_width=True)
+            _plotly_chart(col1, fig)
         else:
             col1.dataframe(pdf)
     else:
         col1.info("Sem dados de atrasos para os filtros atuais.")
 
-    # 2) Variação por aeroporto (com fallback automático 1C)
-    aumentos, quedas, a1, a2, used_fallback = _compute_airport_variation_flex(
-        df_delay=df_delay,
-        df_no_date=df_filtered_no_date,
-        delay_limit=delay_limit,
-    )
-
+    # 2) Variação entre dois períodos quaisquer (lookup nas contagens pré-agregadas)
     with col2:
-        st.subheader("Variação por aeroporto")
-        if a1 is None or a2 is None:
-            st.info("Não foi possível identificar dois anos para comparar, mesmo fora do filtro de datas.")
-        else:
-            if used_fallback:
-                st.caption(f"Comparando {a1} → {a2} (ignorando filtro de datas; demais filtros preservados)")
-            else:
-                st.caption(f"Comparando {a1} → {a2}")
-
-            if _USE_PLOTLY and aumentos.height > 0:
-                fig_up = px.bar(
-                    aumentos.to_pandas(),
-                    x="Delta",
-                    y="Aeroporto",
-                    orientation="h",
-                    title="Maiores aumentos",
-                )
-                fig_up.update_layout(height=240, margin=dict(l=0, r=0, t=40, b=0))
-                st.plotly_chart(fig_up, use_container_width=True)
-            else:
-                st.dataframe(aumentos.to_pandas())
-
-            if _USE_PLOTLY and quedas.height > 0:
-                fig_dn = px.bar(
-                    quedas.to_pandas(),
-                    x="Delta",
-                    y="Aeroporto",
-                    orientation="h",
-                    title="Maiores quedas",
-                )
-                fig_dn.update_layout(height=240, margin=dict(l=0, r=0, t=40, b=0))
-                st.plotly_chart(fig_dn, use_container_width=True)
-            else:
-                st.dataframe(quedas.to_pandas())
+        _render_period_comparison(df_periodos, delay_limit)
 
     st.markdown("---")
 
     # 3) Atrasos por ano
     ag_ano = agg_atrasos_por_ano(df_delay)
     if ag_ano.height > 0:
-        pdf = ag_ano.to_pandas()
+        pdf = _to_pandas(ag_ano)
         if _USE_PLOTLY:
             fig = px.line(pdf, x="Ano", y="Quantidade Atrasos", markers=True, title="Total de atrasos por ano")
             fig.update_layout(height=320, margin=dict(l=0, r=0, t=40, b=0))
-            st.plotly_chart(fig, use_container_width=True)
+            _plotly_chart(st, fig)
         else:
             st.dataframe(pdf)
     else:
@@ -227,12 +205,12 @@ def render_delay_insights(
             )
             .drop("_dow")
         )
-        pdf = ag_sem.to_pandas()
+        pdf = _to_pandas(ag_sem)
         if _USE_PLOTLY:
             fig = px.bar(pdf, x="Dia", y="Quantidade Atrasos", facet_col="Ano",
                          title="Dias da semana com mais atrasos (por ano)")
             fig.update_layout(height=360, margin=dict(l=0, r=0, t=40, b=0))
-            st.plotly_chart(fig, use_container_width=True)
+            _plotly_chart(st, fig)
         else:
             st.dataframe(pdf)
     else:
@@ -241,12 +219,12 @@ def render_delay_insights(
     # 5) Período do dia por ano
     ag_per = agg_periodo_por_ano(df_delay)
     if ag_per.height > 0:
-        pdf = ag_per.to_pandas()
+        pdf = _to_pandas(ag_per)
         if _USE_PLOTLY:
             fig = px.bar(pdf, x="periodo", y="Quantidade Atrasos", facet_col="Ano",
                          title="Período do dia com mais atrasos (por ano)")
             fig.update_layout(height=360, margin=dict(l=0, r=0, t=40, b=0))
-            st.plotly_chart(fig, use_container_width=True)
+            _plotly_chart(st, fig)
         else:
             st.dataframe(pdf)
     else:
@@ -262,45 +240,131 @@ def render_delay_insights(
             .filter(pl.col("rk") <= N)
             .drop("rk")
         )
-        pdf = tops.to_pandas()
+        pdf = _to_pandas(tops)
         if _USE_PLOTLY:
             fig = px.bar(pdf, x="Quantidade Atrasos", y="empresa", facet_col="Ano",
                          orientation="h", title=f"Companhias que mais atrasam (Top {N} por ano)")
             fig.update_layout(height=520, margin=dict(l=0, r=0, t=40, b=0))
-            st.plotly_chart(fig, use_container_width=True)
+            _plotly_chart(st, fig)
         else:
             st.dataframe(pdf)
     else:
         st.info("Sem dados por companhia.")
 
-def render_sample_and_downloads(df_filtrado: pl.DataFrame):
-    st.markdown("---")
-    st.subheader("Amostra dos dados filtrados")
-    n = min(1000, df_filtrado.height)
-    if n > 0:
-        st.dataframe(df_filtrado.head(n).to_pandas(), use_container_width=True, hide_index=True)
+@traced()
+def render_delay_percentiles(df_sketch: Union[FrameView, pl.DataFrame]):
+    st.header("Percentis de atraso")
+    geral = _agg_percentis_atraso(df_sketch)
+    if geral.is_empty() or not geral.get_column(COLS.QTD_VOOS).item():
+        st.info("Sem voos com partida real para estimar percentis.")
+        return
+
+    voos, p50, p90, p99 = geral.row(0)
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Voos com partida real", f"{voos:,}".replace(",", "."))
+    c2.metric("p50 (min)", f"{p50:,.1f}")
+    c3.metric("p90 (min)", f"{p90:,.1f}")
+    c4.metric("p99 (min)", f"{p99:,.1f}")
+
+    grupo = st.selectbox("Agrupar por", list(PERCENTIL_GRUPOS), key="percentis_grupo")
+    tabela = _agg_percentis_atraso(df_sketch, PERCENTIL_GRUPOS[grupo]).head(50)
+    st.dataframe(_to_pandas(tabela.with_columns(pl.col(r"^p\d.*$").round(1))), use_container_width=True, hide_index=True)
+    st.caption(
+        f"Estimados pela fusão de sketches por dia × rota × companhia (erro relativo ≤ {DelaySketch.RELATIVE_ACCURACY:.0%}); "
+        "partidas antecipadas contam como atraso 0. Top 50 grupos por quantidade de voos."
+    )
+
+@traced()
+def render_rolling_on_time(df_serie: Union[FrameView, pl.DataFrame], faixa_partida: Optional[tuple] = None):
+    st.header("Pontualidade em janelas móveis")
+    c1, c2 = st.columns([1, 3])
+    tipo = c1.selectbox("Série por", list(RollingSeries.ENTITIES), key="serie_tipo")
+    entidades = _agg_entidades_serie(df_serie, tipo)
+    if not entidades:
+        st.info("Sem voos realizados para montar a série.")
+        return
+    entidade = c2.selectbox(tipo, entidades, key=f"serie_entidade_{tipo}")
+
+    # janelas calculadas sobre a série inteira; o período do filtro só recorta o que é exibido
+    serie = _agg_serie_pontualidade(df_serie, tipo, entidade)
+    if faixa_partida and any(faixa_partida):
+        inicio, fim = faixa_partida
+        if inicio:
+            serie = serie.filter(pl.col("Dia") >= date.fromisoformat(inicio))
+        if fim:
+            serie = serie.filter(pl.col("Dia") <= date.fromisoformat(fim))
+    if serie.is_empty():
+        st.info("Sem dias no período selecionado.")
+        return
+
+    colunas = [f"Pontualidade {k}d (%)" for k in RollingSeries.WINDOWS]
+    pdf = _to_pandas(serie)
+    if _USE_PLOTLY:
+        fig = px.line(pdf, x="Dia", y=colunas)
+        fig.update_layout(height=360, margin=dict(l=0, r=0, t=10, b=0), yaxis_title="% pontual", legend_title=None)
+        _plotly_chart(st, fig)
     else:
-        st.info("Nenhuma linha após os filtros.")
+        st.line_chart(pdf, x="Dia", y=colunas)
+    st.caption(
+        f"Pontual = partida até {RollingSeries.ON_TIME_LIMIT_MIN} min após o previsto. "
+        "Janelas móveis pelas somas acumuladas diárias de cada entidade."
+    )
 
-    col1, col2 = st.columns(2)
+def _display_columns(view: FrameView, dims: Optional[dict]) -> list:
+    """Colunas oferecidas ao usuário: num eventlog em estrela os ids dão lugar às colunas das dimensões."""
+    return StarSchema().display_columns(view.columns) if dims is not None else view.columns
 
-    @st.cache_data(show_spinner=False)
-    def _export_parquet_bytes(df: pl.DataFrame) -> bytes:
-        buf = io.BytesIO()
-        df.write_parquet(buf)
-        return buf.getvalue()
+def _render_data_browser(view: FrameView, total: int, dims: Optional[dict] = None):
+    """Navegador paginado: ordenação, projeção e busca só das linhas da página visível."""
+    todas = _display_columns(view, dims)
+    c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+    colunas = c1.multiselect("Colunas", todas, default=todas, key="browser_cols") or todas
+    ordenaveis = [c for c in view.columns if c not in StarSchema.KEYS]
+    ordem = c2.selectbox("Ordenar por", ["(ordem original)", *ordenaveis], key="browser_sort")
+    desc = c3.toggle("Decrescente", key="browser_desc")
+    tamanho = c4.selectbox("Linhas/página", PAGE_SIZES, index=1, key="browser_page_size")
 
-    @st.cache_data(show_spinner=False)
-    def _export_csv_bytes(df: pl.DataFrame) -> bytes:
-        return df.write_csv().encode("utf-8")
+    paginas = max(1, -(-total // tamanho))
+    if st.session_state.get("browser_page", 1) > paginas:  # filtros/tamanho mudaram: volta para a última página válida
+        st.session_state["browser_page"] = paginas
+    pagina = st.number_input(f"Página (de {paginas:,})".replace(",", "."), 1, paginas, 1, key="browser_page")
+    sort_col = None if ordem == "(ordem original)" else ordem
+    rows = _page_rows(view, tuple(colunas), pagina - 1, tamanho, sort_col, desc, dims)
 
-    with col1:
-        if st.button("Gerar arquivo Parquet (filtrado)"):
-            data = _export_parquet_bytes(df_filtrado)
-            st.download_button("Baixar Parquet", data=data, file_name="voos_filtrado.parquet",
-                               mime="application/octet-stream")
+    inicio = (pagina - 1) * tamanho
+    st.dataframe(rows.to_pandas(), use_container_width=True, hide_index=True)
+    st.caption(f"Linhas {inicio + 1:,}–{inicio + rows.height:,} de {total:,}".replace(",", "."))
 
-    with col2:
-        if st.button("Gerar arquivo CSV (filtrado)"):
-            data = _export_csv_bytes(df_filtrado)
-            st.download_button("Baixar CSV", data=data, file_name="voos_filtrado.csv", mime="text/csv")
+@traced()
+def render_sample_and_downloads(df_filtrado: Union[FrameView, pl.DataFrame], dims: Optional[dict] = None):
+    view = df_filtrado if isinstance(df_filtrado, FrameView) else FrameView.of(df_filtrado)
+    st.markdown("---")
+    st.subheader("Dados filtrados")
+    total = view.height
+    if total == 0:
+        st.info("Nenhuma linha após os filtros.")
+    else:
+        _render_data_browser(view, total, dims)
+
+    # Exportação em arquivo temporário (escrito em blocos); apagado após o download ou pelo TTL
+    col1, col2 = st.columns([1, 3])
+    fmt = col1.selectbox("Formato", list(EXPORT_FORMATS), key="export_fmt")
+    todas = _display_columns(view, dims)
+    colunas = col2.multiselect("Colunas do arquivo", todas, default=todas, key="export_cols") or todas
+    path = export_path(view.key, fmt, colunas)
+
+    if st.button("Gerar arquivo (filtrado)"):
+        _evict_exports(keep=path)
+        if not path.exists():
+            with st.spinner("Gerando arquivo..."):
+                _export_filtered(view.frame, path, fmt, colunas, dims=dims)
+        st.session_state["export_file"] = str(path)
+
+    if st.session_state.get("export_file") == str(path) and path.exists():
+        ext, mime = EXPORT_FORMATS[fmt]
+        tamanho = path.stat().st_size / 1024 ** 2
+        with open(path, "rb") as f:
+            st.download_button(
+                f"Baixar {fmt.upper()} ({tamanho:,.1f} MB)", data=f, file_name=f"voos_filtrado{ext}", mime=mime,
+                on_click=_discard_export, args=(path, lambda: st.session_state.pop("export_file", None)),
+            )
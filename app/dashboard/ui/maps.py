@@ -1,17 +1,19 @@
 # dashboard/ui/maps.py
 from __future__ import annotations
+import json
 import polars as pl
 import streamlit as st
 import pydeck as pdk
-import numpy as np
+from pydeck.bindings.json_tools import default_serialize
 
+from ..services.agg_cache import cached_agg
 from ..services.aggregations import COLS
+from app.utils.perf import traced
 
-@st.cache_data(show_spinner=False)
-def _prepare_routes(df_base: pl.DataFrame, coord_fmt: str, topn: int, usar_delay: bool):
-    if df_base.is_empty() or any(c not in df_base.columns for c in [COLS.COORD_ORIG, COLS.COORD_DEST]):
-        return (pl.DataFrame(schema={"origem_lon": pl.Float64}), pl.DataFrame(schema={"lon": pl.Float64}))
+RESOLVED_COORDS = [COLS.LON_ORIG, COLS.LAT_ORIG, COLS.LON_DEST, COLS.LAT_DEST]
 
+def _parse_coordinates(df_base: pl.DataFrame, coord_fmt: str) -> pl.DataFrame:
+    """Eventlogs antigos (sem lon/lat resolvidos): interpreta o texto das coordenadas linha a linha."""
     dfc = (
         df_base
         .with_columns([
@@ -42,13 +44,31 @@ def _prepare_routes(df_base: pl.DataFrame, coord_fmt: str, topn: int, usar_delay
     o_lon, o_lat = _pick(pl.col("_o_a"), pl.col("_o_b"), pl.col("_o_b"), pl.col("_o_a"))
     d_lon, d_lat = _pick(pl.col("_d_a"), pl.col("_d_b"), pl.col("_d_b"), pl.col("_d_a"))
 
-    dfc = dfc.with_columns([
+    return dfc.with_columns([
         o_lon.alias("origem_lon"),
         o_lat.alias("origem_lat"),
         d_lon.alias("destino_lon"),
         d_lat.alias("destino_lat"),
     ]).drop(["_o_a", "_o_b", "_d_a", "_d_b"])
 
+@cached_agg
+def _prepare_routes(df_base: pl.DataFrame, coord_fmt: str, topn: int, usar_delay: bool):
+    resolved = all(c in df_base.columns for c in RESOLVED_COORDS)
+    if df_base.is_empty() or not (resolved or all(c in df_base.columns for c in [COLS.COORD_ORIG, COLS.COORD_DEST])):
+        return (pl.DataFrame(schema={"origem_lon": pl.Float64}), pl.DataFrame(schema={"lon": pl.Float64}))
+
+    use_resolved = resolved and coord_fmt.startswith("auto")
+    if use_resolved:
+        # lon/lat já resolvidos por aeroporto no Transformer: sem parsing de texto por linha
+        dfc = df_base.with_columns([
+            pl.col(COLS.LON_ORIG).alias("origem_lon"),
+            pl.col(COLS.LAT_ORIG).alias("origem_lat"),
+            pl.col(COLS.LON_DEST).alias("destino_lon"),
+            pl.col(COLS.LAT_DEST).alias("destino_lat"),
+        ])
+    else:
+        dfc = _parse_coordinates(df_base, coord_fmt)
+
     def _is_valid(lon: pl.Expr, lat: pl.Expr) -> pl.Expr:
         return (
             lon.is_not_null() & lat.is_not_null() &
@@ -68,12 +88,18 @@ def _prepare_routes(df_base: pl.DataFrame, coord_fmt: str, topn: int, usar_delay
     if usar_delay and "atraso_min" in dfc.columns:
         agg_cols.append(pl.col("atraso_min").mean().alias("atraso_medio"))
 
-    rotas = (
-        dfc.group_by(["origem_lon", "origem_lat", "destino_lon", "destino_lat"])
-           .agg(agg_cols)
-           .sort("Quantidade", descending=True)
-           .head(topn)
-    )
+    coord_cols = ["origem_lon", "origem_lat", "destino_lon", "destino_lat"]
+    keys = [COLS.ORIGEM_ICAO, COLS.DESTINO_ICAO]
+    if use_resolved and all(c in dfc.columns for c in keys):
+        # rota = par de aeroportos (chaves inteiras do dicionário); coordenadas são atributos da chave
+        rotas = (
+            dfc.group_by(keys)
+               .agg([pl.col(c).first() for c in coord_cols] + agg_cols)
+               .drop(keys)
+        )
+    else:
+        rotas = dfc.group_by(coord_cols).agg(agg_cols)
+    rotas = rotas.sort("Quantidade", descending=True).head(topn)
 
     nos = (
         pl.concat([
@@ -86,6 +112,79 @@ def _prepare_routes(df_base: pl.DataFrame, coord_fmt: str, topn: int, usar_delay
 
     return rotas, nos
 
+# Nível de detalhe: só as rotas de maior volume viram arcos (tesselados, com picking);
+# as demais vão como linhas retas, bem mais baratas de desenhar
+ARC_LOD_LIMIT = 1500
+# ~10 m de precisão: suficiente para o mapa e encurta o JSON enviado ao deck
+COORD_DECIMALS = 4
+
+def _scale01(col: str) -> pl.Expr:
+    """Normaliza `col` entre os quantis 5% e 95% (recortado em [0, 1])."""
+    x = pl.col(col).cast(pl.Float64)
+    lo, hi = x.quantile(0.05, "linear"), x.quantile(0.95, "linear")
+    return ((x - lo) / pl.max_horizontal(hi - lo, pl.lit(1e-6))).clip(0, 1)
+
+class _CompactDeck(pdk.Deck):
+    """`pdk.Deck` serializado sem indentação, com os frames Polars das camadas escritos pelo próprio Polars.
+
+    O `to_json` padrão do pydeck indenta cada registro e passa tudo por objetos
+    Python; com milhares de rotas essa serialização dominava o render do mapa.
+    Os dados continuam indo como uma lista de registros (`write_json`), um
+    objeto por rota, e não como atributos colunares: o `st.pydeck_chart` só
+    recebe o spec JSON e o tooltip lê os campos (`qtd`, `atraso_medio`) de cada objeto.
+    """
+
+    def to_json(self):
+        frames = [(layer, layer.data) for layer in self.layers if isinstance(layer.data, pl.DataFrame)]
+        for i, (layer, _) in enumerate(frames):
+            layer.data = f"__camada_{i}__"
+        try:
+            spec = json.dumps(self, sort_keys=True, default=default_serialize, separators=(",", ":"))
+        finally:
+            for layer, frame in frames:
+                layer.data = frame
+        for i, (_, frame) in enumerate(frames):
+            spec = spec.replace(f'"__camada_{i}__"', frame.write_json(), 1)
+        return spec
+
+    __repr__ = to_json
+
+@cached_agg
+def _route_map_data(df_base: pl.DataFrame, coord_fmt: str, topn: int, usar_delay: bool) -> tuple:
+    """Frames prontos para o deck (arcos, linhas, nós): cores, larguras e raios calculados em colunas."""
+    rotas, nos = _prepare_routes(df_base, coord_fmt, topn, usar_delay)
+    if rotas.is_empty():
+        return None, None, None
+
+    por_atraso = usar_delay and "atraso_medio" in rotas.columns
+    c01 = _scale01("atraso_medio" if por_atraso else "Quantidade")
+    if por_atraso:
+        rgb = [(c01 * 255).round(), 100 * (1 - c01), 255 * (1 - c01)]
+    else:
+        rgb = [50 + 205 * c01, 100 * (1 - c01), 200 * (1 - c01)]
+
+    def pos(lon: str, lat: str) -> pl.Expr:
+        return pl.concat_list([pl.col(lon).round(COORD_DECIMALS), pl.col(lat).round(COORD_DECIMALS)])
+
+    rotas = (
+        rotas
+        .sort("Quantidade", descending=True)
+        .select([
+            pos("origem_lon", "origem_lat").alias("s"),
+            pos("destino_lon", "destino_lat").alias("t"),
+            pl.concat_list([c.round().cast(pl.UInt8) for c in rgb] + [pl.lit(180, pl.UInt8)]).alias("c"),
+            ((1.0 + pl.col("Quantidade").cast(pl.Float64).sqrt()) * 1.2).round(2).alias("w"),
+            pl.col("Quantidade").alias("qtd"),
+            *([pl.col("atraso_medio").round(1)] if "atraso_medio" in rotas.columns else []),
+        ])
+    )
+    nos = nos.select([
+        pos("lon", "lat").alias("p"),
+        pl.min_horizontal(pl.lit(50000.0), 20000.0 + 3000.0 * pl.col("Quantidade").cast(pl.Float64).sqrt()).round(0).alias("r"),
+    ])
+    return rotas.head(ARC_LOD_LIMIT), rotas.slice(ARC_LOD_LIMIT), nos
+
+@traced()
 def render_route_map(df_filtrado: pl.DataFrame, df_delay: pl.DataFrame | None = None):
     st.markdown("---")
     st.header("Mapa de Rotas (Brasil)")
@@ -96,52 +195,21 @@ def render_route_map(df_filtrado: pl.DataFrame, df_delay: pl.DataFrame | None =
     usar_delay = st.sidebar.checkbox("Colorir por atraso médio (min)", value=True)
 
     df_mapa = df_delay if (df_delay is not None and "atraso_min" in df_delay.columns and df_delay.height > 0) else df_filtrado
-    rotas, nos = _prepare_routes(df_mapa, coord_fmt, top_n, usar_delay)
+    arcos, linhas, nos = _route_map_data(df_mapa, coord_fmt, top_n, usar_delay)
 
-    if rotas.is_empty():
+    if arcos is None:
         st.info("Sem dados de rotas válidas para o mapa com os filtros atuais.")
         return
-
-    rotas_pd = rotas.to_pandas()
-    nos_pd = nos.to_pandas()
-
-    # Tipos
-    for c in ["origem_lon", "origem_lat", "destino_lon", "destino_lat"]:
-        if c in rotas_pd.columns:
-            rotas_pd[c] = rotas_pd[c].astype(float)
-    for c in ["lon", "lat"]:
-        if c in nos_pd.columns:
-            nos_pd[c] = nos_pd[c].astype(float)
-
-    # Cores
-    if usar_delay and "atraso_medio" in rotas_pd.columns:
-        atraso = rotas_pd["atraso_medio"].astype(float)
-        a_min, a_max = atraso.quantile(0.05), atraso.quantile(0.95)
-        a_rng = max(a_max - a_min, 1e-6)
-        c01 = ((atraso - a_min) / a_rng).clip(0, 1)
-        r = (c01 * 255).round().astype(int)
-        g = (100 * (1 - c01)).round().astype(int)
-        b = (255 * (1 - c01)).round().astype(int)
-    else:
-        qtd = rotas_pd["Quantidade"].astype(float)
-        q_min, q_max = qtd.quantile(0.05), qtd.quantile(0.95)
-        q_rng = max(q_max - q_min, 1e-6)
-        c01 = ((qtd - q_min) / q_rng).clip(0, 1)
-        r = (50 + 205 * c01).round().astype(int)
-        g = (100 * (1 - c01)).round().astype(int)
-        b = (200 * (1 - c01)).round().astype(int)
-
-    rotas_pd["rgba"] = list(zip(r, g, b, [180]*len(r)))
-    rotas_pd["_w"] = (1.0 + (rotas_pd["Quantidade"].astype(float)) ** 0.5) * 1.2
-    nos_pd["radius"] = np.minimum(50000.0, 20000.0 + 3000.0 * np.sqrt(nos_pd["Quantidade"].astype(float)).values)
+    if linhas.height:
+        st.caption(f"Top {arcos.height} rotas em arcos; as outras {linhas.height} como linhas simples.")
 
     view_state = pdk.ViewState(latitude=-14.235, longitude=-51.925, zoom=3.5, pitch=0)
 
     nodes_layer = pdk.Layer(
         "ScatterplotLayer",
-        data=nos_pd,
-        get_position="[lon, lat]",
-        get_radius="radius",
+        data=nos,
+        get_position="p",
+        get_radius="r",
         get_fill_color=[30, 144, 255, 140],
         pickable=True,
         opacity=0.6,
@@ -149,27 +217,43 @@ def render_route_map(df_filtrado: pl.DataFrame, df_delay: pl.DataFrame | None =
 
     arcs_layer = pdk.Layer(
         "ArcLayer",
-        data=rotas_pd,
-        get_source_position="[origem_lon, origem_lat]",
-        get_target_position="[destino_lon, destino_lat]",
-        get_width="_w",
-        get_source_color="rgba",
-        get_target_color="rgba",
+        data=arcos,
+        get_source_position="s",
+        get_target_position="t",
+        get_width="w",
+        get_source_color="c",
+        get_target_color="c",
         pickable=True,
         great_circle=True,
         auto_highlight=True,
     )
 
+    layers = [arcs_layer, nodes_layer]
+    if linhas.height:
+        layers.insert(0, pdk.Layer(
+            "LineLayer",
+            data=linhas,
+            get_source_position="s",
+            get_target_position="t",
+            get_color="c",
+            get_width=1,
+            opacity=0.4,
+        ))
+
     tooltip = {
         "html": "<b>Rotas</b><br/>Qtd: {qtd}"
-                + ("<br/>Atraso médio: {atraso_medio} min" if ("atraso_medio" in rotas_pd.columns) else ""),
+                + ("<br/>Atraso médio: {atraso_medio} min" if "atraso_medio" in arcos.columns else ""),
         "style": {"backgroundColor": "rgba(30,30,30,0.8)", "color": "white"},
     }
 
-    r = pdk.Deck(
-        layers=[arcs_layer, nodes_layer],
+    r = _CompactDeck(
+        layers=layers,
         initial_view_state=view_state,
         map_style="light",
         tooltip=tooltip,
     )
-    st.pydeck_chart(r, use_container_width=True)
+    _pydeck_chart(r)
+
+@traced("pydeck_chart")
+def _pydeck_chart(deck: pdk.Deck):
+    st.pydeck_chart(deck, use_container_width=True)
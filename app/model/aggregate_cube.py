@@ -0,0 +1,69 @@
+import polars as pl
+
+from app.model.transformer import FrameT
+
+
+class AggregateCube:
+    """Rollup do eventlog usado pelos gráficos do dashboard.
+
+    Mantém os nomes de coluna do eventlog para que as mesmas agregações rodem
+    sobre ele: "Partida Prevista" vira a hora cheia (dia x hora) e cada linha
+    carrega a quantidade de voos (`Qtd Voos`) e a soma dos atrasos de partida.
+    `Faixa Atraso` é o atraso arredondado para cima em múltiplos de 5 minutos
+    (0 = sem atraso, 185 = acima de 180), o que permite responder exatamente
+    "atraso > limite" para os limites do slider (0 a 180, passo 5).
+
+    Nesse grão o cubo só compensa quando vários voos caem na mesma linha; em
+    dados com poucos voos por rota/hora ele fica do tamanho do eventlog (razão
+    ~1,0) e `compresses` diz aos consumidores para usarem o fato direto.
+    """
+
+    DIMENSIONS = [
+        "Partida Prevista",
+        "ICAO Empresa Aérea",
+        "Empresa Aérea",
+        "ICAO Aeródromo Origem",
+        "Aeródromo Origem",
+        "ICAO Aeródromo Destino",
+        "Aeródromo Destino",
+        "Tipo Linha",
+        "Status do Voo",
+        "Situação Voo",
+        "Faixa Atraso",
+    ]
+    COUNT_COL = "Qtd Voos"
+    DELAY_SUM_COL = "Soma Atraso (min)"
+    DELAY_STEP = 5
+    DELAY_CAP = 185
+    # acima desta razão linhas do cubo / voos, agregar o cubo custa o mesmo que o eventlog
+    MAX_RATIO = 0.5
+
+    def build(self, df: FrameT) -> FrameT:
+        atraso = (pl.col("Partida Real") - pl.col("Partida Prevista")).dt.total_minutes()
+        faixa = self.delay_band(atraso)
+
+        return (
+            df.with_columns([
+                pl.col("Partida Prevista").dt.truncate("1h"),
+                atraso.alias("_atraso_min"),
+                faixa.alias("Faixa Atraso"),
+            ])
+            .group_by(self.DIMENSIONS)
+            .agg([
+                pl.len().cast(pl.UInt32).alias(self.COUNT_COL),
+                pl.col("_atraso_min").sum().alias(self.DELAY_SUM_COL),
+            ])
+            .sort("Partida Prevista")
+        )
+
+    def delay_band(self, atraso: pl.Expr) -> pl.Expr:
+        """Atraso (minutos) -> `Faixa Atraso` (múltiplo de `DELAY_STEP` arredondado para cima, até `DELAY_CAP`)."""
+        return (
+            (atraso.cast(pl.Float64) / self.DELAY_STEP).ceil().cast(pl.Int32) * self.DELAY_STEP
+        ).clip(0, self.DELAY_CAP).cast(pl.Int16)
+
+    @classmethod
+    def compresses(cls, cube: pl.DataFrame) -> bool:
+        """True se o cubo tem no máximo `MAX_RATIO` linhas por voo (`Qtd Voos` soma os voos do fato)."""
+        voos = cube.get_column(cls.COUNT_COL).sum()
+        return bool(voos) and cube.height <= cls.MAX_RATIO * voos
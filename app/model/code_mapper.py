@@ -0,0 +1,86 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Optional
+
+import polars as pl
+
+from app.model.reference_store import ReferenceStore
+
+
+@dataclass(frozen=True)
+class CodeTable:
+    """Tabela de códigos -> descrição. Vem de um JSON (`source`) ou de um dict inline (`mapping`)."""
+    source: Optional[str] = None
+    mapping: dict = field(default_factory=dict)
+    default: Optional[str] = None
+
+
+# Registro declarativo: para uma nova tabela basta adicionar uma entrada aqui
+CODE_TABLES: dict[str, CodeTable] = {
+    "justificativa": CodeTable(
+        source="app/docs/json/justification-codes.json",
+        default="Código não encontrado",
+    ),
+    "tipo_linha": CodeTable(
+        source="app/docs/json/airline-types.json",
+        default="Código não encontrado",
+    ),
+    "tamanho_aeroporto": CodeTable(
+        mapping={
+            "large_airport": "Grande Porte",
+            "medium_airport": "Médio Porte",
+            "small_airport": "Pequeno Porte",
+        },
+        default="",
+    ),
+}
+
+
+class CodeMapper:
+    """Compila as tabelas de códigos em lookups nativos do Polars (`replace_strict`).
+
+    Cada tabela vira um par de Series (códigos, descrições) uma única vez; a
+    expressão resultante roda inteira no engine do Polars, sem passar linha a
+    linha pelo interpretador como o antigo `map_elements`.
+    """
+
+    def __init__(self, tables: Optional[dict[str, CodeTable]] = None, reference: Optional[ReferenceStore] = None):
+        self.tables = dict(CODE_TABLES if tables is None else tables)
+        self.reference = reference or ReferenceStore()
+        self._compiled: dict[str, tuple[pl.Series, pl.Series]] = {}
+
+    def register(self, name: str, table: CodeTable) -> None:
+        self.tables[name] = table
+        self._compiled.pop(name, None)
+
+    def _compile(self, name: str) -> tuple[pl.Series, pl.Series]:
+        if name not in self._compiled:
+            table = self.tables[name]
+            if table.source:
+                codes = self.reference.get_code_table(table.source)
+                self._compiled[name] = (codes.get_column("codigo"), codes.get_column("descricao"))
+            else:
+                self._compiled[name] = (
+                    pl.Series("old", list(table.mapping.keys()), dtype=pl.Utf8),
+                    pl.Series("new", list(table.mapping.values()), dtype=pl.Utf8),
+                )
+        return self._compiled[name]
+
+    def enum(self, name: str) -> pl.Enum:
+        """Enum fechado com todas as descrições possíveis da tabela (inclusive o default)."""
+        _, new = self._compile(name)
+        categories = new.unique(maintain_order=True).to_list()
+        default = self.tables[name].default
+        if default is not None and default not in categories:
+            categories.append(default)
+        return pl.Enum(categories)
+
+    def expr(self, column: str, name: str, alias: Optional[str] = None) -> pl.Expr:
+        """Expressão que traduz `column` pela tabela `name`. Nulos continuam nulos."""
+        old, new = self._compile(name)
+        col = pl.col(column).cast(pl.Utf8)
+        return (
+            pl.when(col.is_not_null())
+            .then(col.replace_strict(old, new, default=self.tables[name].default, return_dtype=pl.Utf8))
+            .alias(alias or column)
+        )
@@ -1,34 +1,266 @@
 
+import codecs
 import glob
+import shutil
+import unicodedata
 import polars as pl
+from datetime import date, datetime, timedelta, timezone
 from io import StringIO
 from pathlib import Path
+from typing import Optional
+from zoneinfo import ZoneInfo
 
+from app.model.reference_store import AIRPORTS_SOURCE, ReferenceStore
+from app.model.star_schema import StarSchema
+
+# Teto de memória padrão da escrita out-of-core (janelas de ordenação)
+STREAMING_MEMORY_LIMIT = 2 * 1024 ** 3
+# Linhas lidas para estimar os bytes por linha do eventlog
+STREAMING_SAMPLE_ROWS = 10_000
+# Janela + cópia ordenada + buffers de escrita
+SORT_MEMORY_FACTOR = 3
+
+
+def _normalize_header(name: str) -> str:
+    """Chave de comparação de cabeçalho: sem BOM, acentos, caixa e espaços extras."""
+    name = unicodedata.normalize("NFKD", name.replace("\ufeff", ""))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.lower().split())
+
+def _instant(dtype: pl.DataType, day: date):
+    """Meia-noite UTC de `day` no tipo/fuso da coluna (instante real, mesmo em dias com troca de horário)."""
+    if dtype == pl.Date:
+        return day
+    tz = getattr(dtype, "time_zone", None)
+    utc = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return utc.astimezone(ZoneInfo(tz)) if tz else utc.replace(tzinfo=None)
 
 
 class DataFrameManager:
     
+    # Layout canônico do VRA (ANAC). Tudo entra como texto; o Transformer tipa as datas.
+    CSV_COLUMNS = [
+        "ICAO Empresa Aérea",
+        "Número Voo",
+        "Código Autorização (DI)",
+        "Código Tipo Linha",
+        "ICAO Aeródromo Origem",
+        "ICAO Aeródromo Destino",
+        "Partida Prevista",
+        "Partida Real",
+        "Chegada Prevista",
+        "Chegada Real",
+        "Situação Voo",
+        "Código Justificativa",
+    ]
+    CSV_SEPARATOR = ";"
+    # Chaves hive do eventlog particionado (ano=/mes=/empresa=)
+    PARTITION_COLS = ["ano", "mes"]
+    AIRLINE_PARTITION_COL = "empresa"
+    
     def __init__(self):
         pass
     
     def get_full_dataframe(self, csv_files_path: Path) -> pl.DataFrame:        
-        files = glob.glob(csv_files_path)
-        dfs = [pl.read_csv(
-            f, 
-            separator=";", 
-            schema_overrides={"Número Voo": pl.Utf8, "Código Autorização (DI)": pl.Utf8}
-            ) for f in files]
-        return pl.concat(dfs, how="diagonal_relaxed")
+        # os scans de cada arquivo são executados em paralelo pelo engine na união
+        return self.scan_full_dataframe(csv_files_path).collect()
+    
+    def scan_full_dataframe(self, csv_files_path: Path) -> pl.LazyFrame:
+        files = sorted(glob.glob(str(csv_files_path)))
+        if not files:
+            raise ValueError(f"Nenhum arquivo encontrado em {csv_files_path}")
+        # todos os arquivos saem no mesmo schema, então basta uma concatenação vertical
+        return pl.concat([self._scan_csv_normalized(f) for f in files], how="vertical")
+    
+    def _scan_csv_normalized(self, file_path) -> pl.LazyFrame:
+        """Scan de um CSV do VRA já no layout canônico (nomes, ordem e tipos)."""
+        encoding = self._detect_encoding(file_path)
+        if encoding == "utf8":
+            header = pl.read_csv(file_path, separator=self.CSV_SEPARATOR, n_rows=0).columns
+            lf = pl.scan_csv(
+                file_path,
+                separator=self.CSV_SEPARATOR,
+                schema={c: pl.Utf8 for c in header},
+                )
+        else:
+            # scan_csv só lê UTF-8; arquivos antigos em latin-1 são decodificados na leitura
+            lf = pl.read_csv(
+                file_path,
+                separator=self.CSV_SEPARATOR,
+                encoding=encoding,
+                infer_schema=False,
+                ).lazy()
+            header = lf.collect_schema().names()
+        
+        by_key = {_normalize_header(c): c for c in header}
+        return lf.select([
+            pl.col(by_key[_normalize_header(c)]).alias(c)
+            if _normalize_header(c) in by_key
+            else pl.lit(None, dtype=pl.Utf8).alias(c)
+            for c in self.CSV_COLUMNS
+        ])
+    
+    @staticmethod
+    def _detect_encoding(file_path, sample_size: int = 1 << 16) -> str:
+        with open(file_path, "rb") as f:
+            sample = f.read(sample_size)
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+            return "utf8"
+        except UnicodeDecodeError:
+            return "latin-1"
         
     def csv_to_dataframe(self, file_path) -> pl.DataFrame:
         csv = StringIO(file_path.GetContentString())
         return pl.read_csv(csv)
     
     def csv_to_json(self, file_path):
-        df = pl.read_csv(file_path)
-        df.write_ndjson("app/docs/json/airport-codes.json")
+        """Converte o CSV de aeroportos no JSON de referência e já compila a tabela tipada."""
+        df = pl.read_csv(file_path, infer_schema_length=10000)
+        df.write_json(AIRPORTS_SOURCE)  # array de registros, legível por json.load
+        ReferenceStore().get("airports")  # fonte mudou: recompila a tabela de aeroportos
     
     def parquet_to_dataframe(self, file_path):
         return pl.read_parquet(file_path)
     
-    
\ No newline at end of file
+    def scan_parquet(self, file_path) -> pl.LazyFrame:
+        return pl.scan_parquet(file_path)
+    
+    def _partition_keys(self, by_airline: bool, columns: list) -> tuple[list, list]:
+        keys = list(self.PARTITION_COLS)
+        key_exprs = [
+            pl.col("Partida Prevista").dt.year().alias("ano"),
+            pl.col("Partida Prevista").dt.month().alias("mes"),
+        ]
+        if by_airline:
+            keys.append(self.AIRLINE_PARTITION_COL)
+            # no eventlog em estrela a partição leva o id da companhia
+            airline = "Empresa Aérea" if "Empresa Aérea" in columns else StarSchema.AIRLINE_KEY
+            key_exprs.append(pl.col(airline).cast(pl.Utf8).alias(self.AIRLINE_PARTITION_COL))
+        return keys, key_exprs
+    
+    def write_partitioned(self, df: pl.DataFrame, dataset_path: Path, by_airline: bool = False) -> None:
+        """Grava o eventlog como dataset hive particionado por ano/mês (e opcionalmente empresa)."""
+        keys, key_exprs = self._partition_keys(by_airline, df.columns)
+        
+        # grava ao lado e troca no final para não deixar o dataset pela metade
+        dataset_path = Path(dataset_path)
+        tmp_path = dataset_path.with_name(dataset_path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        df.with_columns(key_exprs).write_parquet(tmp_path, partition_by=keys)
+        shutil.rmtree(dataset_path, ignore_errors=True)
+        tmp_path.rename(dataset_path)
+    
+    def sink_partitioned(self, lf: pl.LazyFrame, dataset_path: Path, by_airline: bool = False,
+                         max_bytes: int = STREAMING_MEMORY_LIMIT) -> None:
+        """Versão out-of-core de `write_partitioned`: mesmo layout e conteúdo, sem materializar o eventlog."""
+        keys, key_exprs = self._partition_keys(by_airline, lf.collect_schema().names())
+        dataset_path = Path(dataset_path)
+        tmp_path = dataset_path.with_name(dataset_path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        self._sink_windows(lf, tmp_path, max_bytes, keys, key_exprs)
+        shutil.rmtree(dataset_path, ignore_errors=True)
+        tmp_path.rename(dataset_path)
+    
+    def sink_sorted(self, lf: pl.LazyFrame, file_path: Path, max_bytes: int = STREAMING_MEMORY_LIMIT) -> None:
+        """Eventlog em um único Parquet, ordenado janela a janela e concatenado em streaming."""
+        file_path = Path(file_path)
+        tmp_path = file_path.with_name(file_path.name + ".janelas")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        self._sink_windows(lf, tmp_path, max_bytes)
+        pl.scan_parquet(tmp_path / "*.parquet").sink_parquet(file_path, engine="streaming")
+        shutil.rmtree(tmp_path)
+    
+    def _sink_windows(self, lf: pl.LazyFrame, out_path: Path, max_bytes: int,
+                      keys: Optional[list] = None, key_exprs: Optional[list] = None) -> None:
+        """Ordena por partida prevista e grava em janelas de dias consecutivos que cabem em `max_bytes`.
+        
+        As janelas não cruzam meses (uma partição ano/mês pode ter vários arquivos,
+        lidos em ordem de nome), então concatenar as janelas equivale ao sort global.
+        """
+        dtype = lf.collect_schema()["Partida Prevista"]
+        for i, (name, predicate) in enumerate(self._time_windows(lf, dtype, max_bytes)):
+            window = lf.filter(predicate).sort("Partida Prevista", nulls_last=True, maintain_order=True)
+            if keys:
+                target = pl.PartitionByKey(
+                    out_path,
+                    by=keys,
+                    file_path=lambda ctx, name=name: Path(ctx.file_path).with_name(name),
+                )
+                window.with_columns(key_exprs).sink_parquet(target, mkdir=True, engine="streaming")
+            else:
+                # sem partições todas as janelas ficam no mesmo diretório: numeração global
+                out_path.mkdir(parents=True, exist_ok=True)
+                window.sink_parquet(out_path / f"{i:06d}.parquet", engine="streaming")
+    
+    def _time_windows(self, lf: pl.LazyFrame, dtype: pl.DataType, max_bytes: int) -> list[tuple[str, pl.Expr]]:
+        """(nome do arquivo, predicado) de cada janela, a partir do histograma de voos por dia."""
+        col = pl.col("Partida Prevista")
+        sample = lf.head(STREAMING_SAMPLE_ROWS).collect(engine="streaming")
+        row_bytes = sample.estimated_size() / max(sample.height, 1)
+        # a ordenação mantém a janela e a cópia ordenada em memória ao mesmo tempo
+        max_rows = max(1, int(max_bytes / (row_bytes * SORT_MEMORY_FACTOR)))
+        
+        days = (
+            lf.group_by(col.dt.date().alias("dia"))
+            .agg(pl.len().alias("voos"))
+            .sort("dia", nulls_last=True)
+            .collect(engine="streaming")
+        )
+        windows: list[list] = []  # [primeiro dia, último dia, voos]
+        for day, n in days.iter_rows():
+            last = windows[-1] if windows else None
+            if (day is not None and last is not None and last[0] is not None
+                    and (day.year, day.month) == (last[1].year, last[1].month) and last[2] + n <= max_rows):
+                last[1], last[2] = day, last[2] + n
+            else:
+                windows.append([day, day, n])
+        
+        per_month: dict = {}
+        named = []
+        for first, last, _ in windows:
+            month = (first.year, first.month) if first is not None else None
+            idx = per_month[month] = per_month.get(month, -1) + 1
+            if first is None:
+                predicate = col.is_null()
+            else:
+                # limites com folga de um dia para podar row groups; o recorte exato é pela data local
+                predicate = (
+                    (col >= _instant(dtype, first - timedelta(days=1)))
+                    & (col < _instant(dtype, last + timedelta(days=2)))
+                    & col.dt.date().is_between(first, last)
+                )
+            named.append((month, idx, predicate))
+        
+        # nomes com largura fixa por mês ("0.parquet" quando o mês cabe numa janela só, como em `write_partitioned`)
+        width = {m: len(str(n)) for m, n in per_month.items()}
+        return [(f"{idx:0{width[m]}d}.parquet", predicate) for m, idx, predicate in named]
+    
+    def scan_partitioned(self, dataset_path: Path) -> pl.LazyFrame:
+        """Scan lazy do dataset particionado; as chaves hive ficam disponíveis para poda."""
+        return pl.scan_parquet(Path(dataset_path), hive_partitioning=True)
+    
+    def scan_eventlog(self, path: Path, dimensions_path: Optional[Path] = None,
+                      columns: Optional[list] = None) -> pl.LazyFrame:
+        """Scan do eventlog transformado (Parquet único ou dataset particionado, sem as chaves hive).
+
+        Com `dimensions_path`, um eventlog em estrela volta com as colunas das
+        dimensões (todas ou só `columns`) no lugar dos ids.
+        """
+        if Path(path).is_dir():
+            lf = self.scan_partitioned(path)
+            keys = [c for c in lf.collect_schema().names()
+                    if c in self.PARTITION_COLS or c == self.AIRLINE_PARTITION_COL]
+            lf = lf.drop(keys)
+        else:
+            lf = pl.scan_parquet(path)
+        dims = StarSchema.read(dimensions_path) if dimensions_path is not None else None
+        if dims is not None and StarSchema.is_star(lf.collect_schema().names()):
+            lf = StarSchema().expand(lf, dims, columns)
+        return lf
+    
+    def read_eventlog(self, path: Path, dimensions_path: Optional[Path] = None,
+                      columns: Optional[list] = None) -> pl.DataFrame:
+        """Lê o eventlog transformado, seja um Parquet único ou o dataset particionado."""
+        return self.scan_eventlog(path, dimensions_path, columns).collect()
+    
@@ -0,0 +1,79 @@
+import math
+
+import polars as pl
+
+from app.model.transformer import FrameT
+
+
+class DelaySketch:
+    """Sketches de quantis do atraso de partida, mergeáveis, por dia x rota x companhia.
+
+    Cada linha é um balde logarítmico (estilo DDSketch) com a quantidade de voos:
+    o balde `k >= 1` cobre atrasos em (γ^(k-2), γ^(k-1)] minutos e o balde 0 os
+    voos sem atraso (antecipados contam como 0). Juntar sketches é somar as
+    contagens dos mesmos baldes, então qualquer recorte dos filtros vira um
+    `group_by` sobre linhas já agregadas, com erro relativo <= `RELATIVE_ACCURACY`
+    no quantil estimado.
+    """
+
+    DIMENSIONS = [
+        "Partida Prevista",
+        "Empresa Aérea",
+        "ICAO Aeródromo Origem",
+        "Aeródromo Origem",
+        "ICAO Aeródromo Destino",
+        "Aeródromo Destino",
+        "Tipo Linha",
+        "Status do Voo",
+        "Situação Voo",
+    ]
+    BUCKET_COL = "Balde Atraso"
+    COUNT_COL = "Qtd Voos"
+    RELATIVE_ACCURACY = 0.01
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+    def build(self, df: FrameT) -> FrameT:
+        atraso = (pl.col("Partida Real") - pl.col("Partida Prevista")).dt.total_minutes()
+        balde = (
+            pl.when(atraso >= 1)
+            .then((atraso.cast(pl.Float64).log() / math.log(self.GAMMA)).ceil() + 1)
+            .otherwise(0)
+            .cast(pl.Int16)
+        )
+        return (
+            df.filter(pl.col("Partida Real").is_not_null() & pl.col("Partida Prevista").is_not_null())
+            .with_columns([
+                pl.col("Partida Prevista").dt.truncate("1d"),
+                balde.alias(self.BUCKET_COL),
+            ])
+            .group_by([*self.DIMENSIONS, self.BUCKET_COL])
+            .agg(pl.len().cast(pl.UInt32).alias(self.COUNT_COL))
+            .sort("Partida Prevista")
+        )
+
+    def bucket_value(self, bucket: pl.Expr) -> pl.Expr:
+        """Atraso representativo (minutos) do balde: ponto de menor erro relativo do intervalo."""
+        return (
+            pl.when(bucket > 0)
+            .then(2 * pl.lit(self.GAMMA).pow(bucket.cast(pl.Float64) - 1) / (self.GAMMA + 1))
+            .otherwise(0.0)
+        )
+
+    def quantiles(self, df: FrameT, by: list[str], qs: tuple = (0.5, 0.9, 0.99)) -> FrameT:
+        """Merge dos sketches de `df` por `by` e quantis `qs` (colunas p50, p90, ...), mais a contagem de voos."""
+        merged = (
+            df.group_by([*by, self.BUCKET_COL])
+            .agg(pl.col(self.COUNT_COL).sum())
+            .sort([*by, self.BUCKET_COL])
+        )
+        # posto (0-based) de cada quantil: primeiro balde cuja contagem acumulada passa dele
+        n = pl.col(self.COUNT_COL).sum()
+        acumulado = pl.col(self.COUNT_COL).cum_sum()
+        aggs = [n.alias(self.COUNT_COL)] + [
+            self.bucket_value(pl.col(self.BUCKET_COL).filter(acumulado > q * (n - 1)).first())
+            .alias(f"p{q * 100:g}")
+            for q in qs
+        ]
+        if not by:
+            return merged.select(aggs)
+        return merged.group_by(by, maintain_order=True).agg(aggs)
@@ -0,0 +1,78 @@
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from app.utils.utils import file_hash
+
+
+class IngestionManifest:
+    """Registro dos arquivos brutos já transformados.
+
+    Para cada CSV guarda tamanho, mtime, hash do conteúdo e o Parquet parcial
+    gerado a partir dele, permitindo reprocessar só o que é novo ou mudou. O
+    `fingerprint` registra a versão do pipeline e das referências com que as
+    partes foram geradas; se ele mudar, nenhuma parte vale mais.
+    """
+
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self.entries: dict[str, dict] = {}
+        self.fingerprint: Optional[dict] = None
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding="utf-8") as f:
+                data = json.load(f)
+            # manifesto antigo (só as entradas): sem fingerprint, tudo é reprocessado
+            if "files" in data:
+                self.entries, self.fingerprint = data["files"], data.get("fingerprint")
+            else:
+                self.entries = data
+
+    def save(self) -> None:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "files": self.entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def is_current(self, file_path) -> bool:
+        """True se o arquivo já foi ingerido com o mesmo conteúdo."""
+        key = str(file_path)
+        entry = self.entries.get(key)
+        if entry is None or not Path(entry["part"]).exists():
+            return False
+        stat = os.stat(file_path)
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return True
+        # mtime/tamanho mudaram: só o hash decide se o conteúdo é outro
+        if entry["size"] == stat.st_size and entry["sha256"] == file_hash(file_path):
+            entry["mtime"] = stat.st_mtime
+            return True
+        return False
+
+    def pending_files(self, files: list, fingerprint: Optional[dict] = None) -> list:
+        """Arquivos a (re)transformar; com `fingerprint` diferente do registrado, todos."""
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            return list(files)
+        return [f for f in files if not self.is_current(f)]
+
+    def removed_files(self, files: list) -> list:
+        current = {str(f) for f in files}
+        return [f for f in self.entries if f not in current]
+
+    def record(self, file_path, part_path: Path) -> None:
+        stat = os.stat(file_path)
+        self.entries[str(file_path)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_hash(file_path),
+            "part": str(part_path),
+        }
+
+    def forget(self, file_path) -> None:
+        entry = self.entries.pop(str(file_path), None)
+        if entry is not None:
+            Path(entry["part"]).unlink(missing_ok=True)
+
+    def parts(self) -> list[str]:
+        return [self.entries[f]["part"] for f in sorted(self.entries)]
@@ -0,0 +1,115 @@
+from typing import Optional
+
+import polars as pl
+
+from app.model.aggregate_cube import AggregateCube
+from app.model.transformer import FrameT
+
+
+class PeriodComparison:
+    """Contagens de voos por período (mês, trimestre, ano) x entidade x faixa de atraso.
+
+    Monta numa passada só, a partir do eventlog ou do cubo, a tabela que responde
+    "quanto mudou entre o período A e o período B" para aeroportos, companhias e
+    rotas: comparar dois períodos quaisquer é filtrar duas fatias dela e juntar.
+    `Faixa Atraso` segue o cubo (múltiplos de 5 min; nulo = voo sem partida real),
+    então a mesma tabela serve a qualquer limite de atraso do slider.
+    """
+
+    # granularidade -> (chave numérica dentro do ano, rótulo), sobre o rollup mensal (`_ano`, `_mes`)
+    PERIODS = {
+        "Mês": (pl.col("_mes"), pl.format("{}-{}", pl.col("_ano"), pl.col("_p").cast(pl.Utf8).str.zfill(2))),
+        "Trimestre": ((pl.col("_mes") - 1) // 3 + 1, pl.format("{}-T{}", pl.col("_ano"), pl.col("_p"))),
+        "Ano": (pl.lit(1, dtype=pl.Int8), pl.col("_ano").cast(pl.Utf8)),
+    }
+    # tipo -> (colunas agrupadas, rótulo); os rótulos só são formatados depois de agregar
+    ENTITIES = {
+        "Aeroporto": (["Aeródromo Origem"], pl.col("Aeródromo Origem").cast(pl.Utf8)),
+        "Companhia": (["Empresa Aérea"], pl.col("Empresa Aérea").cast(pl.Utf8)),
+        "Rota": (
+            ["ICAO Aeródromo Origem", "ICAO Aeródromo Destino"],
+            pl.format("{} → {}", pl.col("ICAO Aeródromo Origem"), pl.col("ICAO Aeródromo Destino")),
+        ),
+    }
+    SOURCE_COLS = ["Aeródromo Origem", "Empresa Aérea", "ICAO Aeródromo Origem", "ICAO Aeródromo Destino"]
+    COUNT_COL = "Qtd Voos"
+    BAND_COL = "Faixa Atraso"
+
+    def build(self, df: FrameT) -> FrameT:
+        if self.COUNT_COL in df.collect_schema().names():
+            base, count = df, pl.col(self.COUNT_COL).sum()
+        else:
+            atraso = (pl.col("Partida Real") - pl.col("Partida Prevista")).dt.total_minutes()
+            base, count = df.with_columns(AggregateCube().delay_band(atraso).alias(self.BAND_COL)), pl.len()
+
+        # rollup mensal primeiro: trimestre, ano e os rótulos das entidades saem dele, não das linhas
+        mensal = (
+            base.lazy()
+            .group_by([
+                pl.col("Partida Prevista").dt.year().alias("_ano"),
+                pl.col("Partida Prevista").dt.month().alias("_mes"),
+                *self.SOURCE_COLS,
+                self.BAND_COL,
+            ])
+            .agg(count.cast(pl.UInt32).alias(self.COUNT_COL))
+            .cache()
+        )
+        frames = [
+            mensal.group_by(["_ano", key.alias("_p"), *cols, self.BAND_COL])
+            .agg(pl.col(self.COUNT_COL).sum())
+            .select([
+                pl.lit(granularidade).alias("Granularidade"),
+                pl.lit(tipo).alias("Tipo"),
+                period_label.alias("Período"),
+                entity_label.alias("Entidade"),
+                self.BAND_COL,
+                self.COUNT_COL,
+            ])
+            for granularidade, (key, period_label) in self.PERIODS.items()
+            for tipo, (cols, entity_label) in self.ENTITIES.items()
+        ]
+        out = (
+            pl.concat(frames)
+            .filter(pl.col("Entidade").is_not_null() & pl.col("Período").is_not_null())
+            .sort(["Granularidade", "Tipo", "Período"])
+        )
+        return out if isinstance(df, pl.LazyFrame) else out.collect()
+
+    def periods(self, store: pl.DataFrame, granularidade: str) -> list[str]:
+        return (
+            store.filter(pl.col("Granularidade") == granularidade)
+            .get_column("Período").unique().sort().to_list()
+        )
+
+    def compare(
+        self,
+        store: pl.DataFrame,
+        granularidade: str,
+        tipo: str,
+        anterior: str,
+        atual: str,
+        limite: Optional[int] = None,
+        top: int = 10,
+    ) -> tuple[pl.DataFrame, pl.DataFrame]:
+        """(maiores aumentos, maiores quedas) de `anterior` para `atual`; com `limite`, conta só voos com
+        atraso > limite, senão todos os voos."""
+        fatia = store.filter(
+            (pl.col("Granularidade") == granularidade)
+            & (pl.col("Tipo") == tipo)
+            & pl.col("Período").is_in([anterior, atual])
+        )
+        if limite is not None:
+            fatia = fatia.filter(pl.col(self.BAND_COL).is_not_null() & (pl.col(self.BAND_COL) > limite))
+        qtd = pl.col(self.COUNT_COL).cast(pl.Int64)
+        variacao = (
+            fatia.group_by("Entidade")
+            .agg([
+                qtd.filter(pl.col("Período") == anterior).sum().alias("Anterior"),
+                qtd.filter(pl.col("Período") == atual).sum().alias("Atual"),
+            ])
+            .with_columns((pl.col("Atual") - pl.col("Anterior")).alias("Delta"))
+            .rename({"Entidade": tipo})
+        )
+        aumentos = variacao.filter(pl.col("Delta") > 0).sort(["Delta", tipo], descending=[True, False]).head(top)
+        quedas = variacao.filter(pl.col("Delta") < 0).sort(["Delta", tipo]).head(top)
+        return aumentos, quedas
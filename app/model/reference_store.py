@@ -0,0 +1,175 @@
+import json
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+import polars as pl
+
+from app.utils.utils import file_hash, load_json_file
+
+REFERENCE_DIR = Path("app/docs/reference")
+AIRPORTS_SOURCE = "app/docs/json/airport-codes.json"
+AIRLINES_SOURCE = "app/docs/json/airlines-codes.json"
+# Incrementar quando o layout das tabelas compiladas mudar: força recompilar mesmo com a fonte intacta
+REFERENCE_VERSION = 2
+
+# Caixa do Brasil usada para decidir a ordem (lon, lat) das coordenadas
+BR_LON = (-75.0, -28.0)
+BR_LAT = (-34.0, 6.0)
+
+
+def _coordinates_exprs(col: str = "coordinates") -> list[pl.Expr]:
+    """`lon`/`lat` (Float32) a partir do texto "a, b" das coordenadas.
+
+    A fonte normalmente traz "lon, lat"; se só a ordem invertida cair no Brasil,
+    os valores são trocados.
+    """
+    parts = pl.col(col).str.replace_all(r"\s+", "").str.split_exact(",", 1)
+    a = parts.struct.field("field_0").cast(pl.Float32, strict=False)
+    b = parts.struct.field("field_1").cast(pl.Float32, strict=False)
+
+    def _in_br(lon: pl.Expr, lat: pl.Expr) -> pl.Expr:
+        return lon.is_between(*BR_LON) & lat.is_between(*BR_LAT)
+
+    swap = ~_in_br(a, b).fill_null(False) & _in_br(b, a).fill_null(False)
+    return [
+        pl.when(swap).then(b).otherwise(a).alias("lon"),
+        pl.when(swap).then(a).otherwise(b).alias("lat"),
+    ]
+
+
+def _build_airports(source) -> pl.DataFrame:
+    airports = load_json_file(source)
+    return (
+        pl.from_records(airports, infer_schema_length=10000)
+        .select([
+            pl.col("icao_code").cast(pl.Utf8),
+            pl.col("name").cast(pl.Utf8),
+            pl.col("continent").cast(pl.Utf8),
+            pl.col("iso_country").cast(pl.Utf8),
+            pl.col("municipality").cast(pl.Utf8),
+            pl.col("gps_code").cast(pl.Utf8),
+            pl.col("coordinates").cast(pl.Utf8),
+            pl.col("type").cast(pl.Utf8),
+        ])
+        .with_columns(_coordinates_exprs())
+        .unique(subset=["icao_code"], keep="first", maintain_order=True)
+    )
+
+def _build_airlines(source) -> pl.DataFrame:
+    codes = load_json_file(source)
+    return (
+        pl.from_records(codes, infer_schema_length=10000)
+        .select([
+            pl.col("Nome").cast(pl.Utf8).alias("empresa_nome"),
+            pl.col("Sigla").cast(pl.Utf8).alias("icao_empresa"),
+        ])
+        .unique(subset=["icao_empresa"], keep="first", maintain_order=True)
+    )
+
+def _build_code_table(source) -> pl.DataFrame:
+    codes = load_json_file(source)  # dict código -> descrição
+    return pl.DataFrame(
+        {"codigo": list(codes.keys()), "descricao": list(codes.values())},
+        schema={"codigo": pl.Utf8, "descricao": pl.Utf8},
+    )
+
+
+class ReferenceStore:
+    """Tabelas de referência (aeroportos, companhias, códigos) compiladas em Arrow IPC.
+
+    Cada fonte JSON é convertida uma única vez em uma tabela tipada
+    (`app/docs/reference/<nome>.arrow`) acompanhada de um `.meta.json` com
+    tamanho, mtime e hash da fonte. Enquanto a fonte não muda, a tabela é lida
+    via memory-map; dentro do mesmo processo ela ainda fica em memória.
+    """
+
+    DIMENSIONS: dict[str, tuple[str, Callable[[str], pl.DataFrame]]] = {
+        "airports": (AIRPORTS_SOURCE, _build_airports),
+        "airlines": (AIRLINES_SOURCE, _build_airlines),
+    }
+
+    _loaded: dict[str, tuple[dict, pl.DataFrame]] = {}
+
+    def __init__(self, reference_dir: Path = REFERENCE_DIR, sources: Optional[dict[str, str]] = None):
+        self.reference_dir = Path(reference_dir)
+        # troca a fonte de uma dimensão (ex.: aeroportos sintéticos nos benchmarks)
+        self.sources = dict(sources or {})
+
+    def get(self, name: str) -> pl.DataFrame:
+        _, builder = self.DIMENSIONS[name]
+        return self._load(name, self.source(name), builder)
+
+    def source(self, name: str) -> str:
+        """Fonte JSON efetiva de uma dimensão (a padrão ou a trocada no construtor)."""
+        return self.sources.get(name, self.DIMENSIONS[name][0])
+
+    def get_code_table(self, source: str) -> pl.DataFrame:
+        """Tabela `codigo`/`descricao` compilada a partir de um JSON dict."""
+        return self._load(Path(source).stem, source, _build_code_table)
+
+    def compile(self, name: str, df: pl.DataFrame, source: Optional[str] = None) -> None:
+        """Grava `df` como a versão compilada de `name` (ex.: a partir do CSV de aeroportos)."""
+        self.reference_dir.mkdir(parents=True, exist_ok=True)
+        meta = self._source_meta(source) if source and Path(source).exists() else {}
+        meta["version"] = REFERENCE_VERSION
+        tmp = self._table_path(name).with_suffix(".tmp")
+        # sem compressão: é o que permite ler com memory_map
+        df.write_ipc(tmp, compression="uncompressed")
+        os.replace(tmp, self._table_path(name))
+        with open(self._meta_path(name), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        self._loaded.pop(str(self._table_path(name)), None)
+
+    def _load(self, name: str, source: str, builder: Callable[[str], pl.DataFrame]) -> pl.DataFrame:
+        table_path = self._table_path(name)
+        meta = self._read_meta(name)
+        if Path(source).exists() and not self._is_fresh(name, source, meta):
+            self.compile(name, builder(source), source)
+            meta = self._read_meta(name)
+        elif not table_path.exists():
+            raise FileNotFoundError(f"Fonte '{source}' e tabela compilada '{table_path}' não encontradas")
+
+        cached = self._loaded.get(str(table_path))
+        if cached is not None and cached[0] == meta:
+            return cached[1]
+        df = pl.read_ipc(table_path, memory_map=True)
+        self._loaded[str(table_path)] = (meta, df)
+        return df
+
+    def _is_fresh(self, name: str, source: str, meta: dict) -> bool:
+        if not meta or meta.get("source") != str(source) or meta.get("version") != REFERENCE_VERSION:
+            return False
+        stat = os.stat(source)
+        if meta["size"] == stat.st_size and meta["mtime"] == stat.st_mtime:
+            return True
+        if meta["size"] == stat.st_size and meta["sha256"] == file_hash(source):
+            # conteúdo igual, só o mtime mudou: atualiza o meta e segue usando a tabela
+            meta["mtime"] = stat.st_mtime
+            with open(self._meta_path(name), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            return True
+        return False
+
+    @staticmethod
+    def _source_meta(source: str) -> dict:
+        stat = os.stat(source)
+        return {
+            "source": str(source),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_hash(source),
+        }
+
+    def _read_meta(self, name: str) -> dict:
+        meta_path = self._meta_path(name)
+        if not meta_path.exists() or not self._table_path(name).exists():
+            return {}
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _table_path(self, name: str) -> Path:
+        return self.reference_dir / f"{name}.arrow"
+
+    def _meta_path(self, name: str) -> Path:
+        return self.reference_dir / f"{name}.meta.json"
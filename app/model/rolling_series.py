@@ -0,0 +1,131 @@
+from typing import Optional
+
+import polars as pl
+
+from app.model.transformer import FrameT
+
+
+class RollingSeries:
+    """Série diária de pontualidade por aeroporto (origem) e companhia, com somas acumuladas.
+
+    Cada entidade tem uma linha por dia (dias sem voo entram com zero) e as
+    colunas acumuladas `Voos Acum`/`Pontuais Acum`: a janela móvel de k dias no
+    dia d é `acum[d] - acum[d-k]`, O(1) por ponto para qualquer k. Novos dias
+    (partes novas do pipeline incremental) só recalculam o acumulado a partir do
+    primeiro dia alterado, partindo do último acumulado já gravado.
+    """
+
+    ENTITIES = {
+        "Aeroporto": "ICAO Aeródromo Origem",
+        "Companhia": "Empresa Aérea",
+    }
+    KEYS = ["Tipo", "Entidade"]
+    DAY_COL = "Dia"
+    ON_TIME_LIMIT_MIN = 15
+    WINDOWS = (7, 30)
+
+    def daily(self, df: FrameT) -> FrameT:
+        """Voos realizados e pontuais (atraso de partida <= `ON_TIME_LIMIT_MIN`) por entidade e dia."""
+        atraso = (pl.col("Partida Real") - pl.col("Partida Prevista")).dt.total_minutes()
+        base = (
+            df.filter(pl.col("Partida Real").is_not_null() & pl.col("Partida Prevista").is_not_null())
+            .with_columns([
+                pl.col("Partida Prevista").dt.date().alias(self.DAY_COL),
+                (atraso <= self.ON_TIME_LIMIT_MIN).alias("_pontual"),
+            ])
+        )
+        frames = [
+            base.group_by([self.DAY_COL, pl.col(col).cast(pl.Utf8).alias("Entidade")])
+            .agg([
+                pl.len().cast(pl.UInt32).alias("Voos"),
+                pl.col("_pontual").sum().cast(pl.UInt32).alias("Pontuais"),
+            ])
+            .select([pl.lit(tipo).alias("Tipo"), "Entidade", self.DAY_COL, "Voos", "Pontuais"])
+            for tipo, col in self.ENTITIES.items()
+        ]
+        return pl.concat(frames).filter(pl.col("Entidade").is_not_null())
+
+    def days(self, df: FrameT) -> FrameT:
+        """Dias distintos de `df`, na mesma chave de `daily`."""
+        return df.select(pl.col("Partida Prevista").dt.date().unique().alias(self.DAY_COL))
+
+    def build(self, df: FrameT) -> pl.DataFrame:
+        daily = self.daily(df)
+        return self._accumulate(daily.collect() if isinstance(daily, pl.LazyFrame) else daily)
+
+    def update(self, store: pl.DataFrame, daily: pl.DataFrame, days: Optional[list] = None) -> pl.DataFrame:
+        """Incorpora `daily` (saída de `daily` sobre os dias alterados): os dias presentes nele e os de `days`
+        substituem os gravados, mesmo os que não têm mais voos, e só o trecho a partir do primeiro desses
+        dias é reacumulado."""
+        alterados = pl.concat([
+            daily.get_column(self.DAY_COL),
+            pl.Series(self.DAY_COL, days or [], dtype=pl.Date),
+        ]).unique()
+        if alterados.is_empty():
+            return store
+        inicio = alterados.min()
+        mantido = store.filter(pl.col(self.DAY_COL) < inicio)
+        cauda = pl.concat([
+            store.filter(
+                (pl.col(self.DAY_COL) >= inicio) & ~pl.col(self.DAY_COL).is_in(alterados.implode())
+            ).select(daily.columns),
+            daily,
+        ])
+        offsets = (
+            mantido.group_by(self.KEYS)
+            .agg(pl.all().sort_by(self.DAY_COL).last())
+            .select([*self.KEYS, pl.col(self.DAY_COL).alias("_ultimo"), "Voos Acum", "Pontuais Acum"])
+        )
+        return pl.concat([mantido, self._accumulate(cauda, offsets)]).sort([*self.KEYS, self.DAY_COL])
+
+    def _accumulate(self, daily: pl.DataFrame, offsets: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+        """Completa os dias sem voo de cada entidade e calcula os acumulados (somando `offsets`, se houver)."""
+        daily = daily.group_by([*self.KEYS, self.DAY_COL]).agg(pl.col("Voos", "Pontuais").sum())
+        bounds = daily.group_by(self.KEYS).agg([
+            pl.col(self.DAY_COL).min().alias("_ini"),
+            pl.col(self.DAY_COL).max().alias("_fim"),
+        ])
+        base = pl.lit(0, dtype=pl.UInt64)
+        base_voos = base_pontuais = base
+        if offsets is not None:
+            # emenda no último dia já acumulado: os dias entre ele e a cauda entram zerados
+            bounds = bounds.join(offsets, on=self.KEYS, how="left").with_columns(
+                pl.coalesce(pl.col("_ultimo") + pl.duration(days=1), pl.col("_ini")).alias("_ini")
+            )
+            base_voos = pl.col("Voos Acum").fill_null(0)
+            base_pontuais = pl.col("Pontuais Acum").fill_null(0)
+        grid = bounds.select([
+            *self.KEYS,
+            pl.date_ranges("_ini", "_fim", "1d").alias(self.DAY_COL),
+            base_voos.cast(pl.UInt64).alias("_base_voos"),
+            base_pontuais.cast(pl.UInt64).alias("_base_pontuais"),
+        ]).explode(self.DAY_COL)
+        return (
+            grid.join(daily, on=[*self.KEYS, self.DAY_COL], how="left")
+            .with_columns(pl.col("Voos", "Pontuais").fill_null(0))
+            .sort([*self.KEYS, self.DAY_COL])
+            .with_columns([
+                (pl.col("Voos").cast(pl.UInt64).cum_sum().over(self.KEYS) + pl.col("_base_voos")).alias("Voos Acum"),
+                (pl.col("Pontuais").cast(pl.UInt64).cum_sum().over(self.KEYS) + pl.col("_base_pontuais")).alias("Pontuais Acum"),
+            ])
+            .drop("_base_voos", "_base_pontuais")
+        )
+
+    def series(self, store: pl.DataFrame, tipo: str, entidade: str, windows: tuple = WINDOWS) -> pl.DataFrame:
+        """Série de uma entidade: voos do dia e pontualidade (%) do dia e das janelas móveis `windows`."""
+        s = store.filter((pl.col("Tipo") == tipo) & (pl.col("Entidade") == entidade)).sort(self.DAY_COL)
+        cols = [pl.col(self.DAY_COL), pl.col("Voos"), self._rate(pl.col("Pontuais"), pl.col("Voos")).alias("Pontualidade dia (%)")]
+        for k in windows:
+            voos = self._window(pl.col("Voos Acum"), pl.col("Voos"), k)
+            pontuais = self._window(pl.col("Pontuais Acum"), pl.col("Pontuais"), k)
+            cols.append(self._rate(pontuais, voos).alias(f"Pontualidade {k}d (%)"))
+        return s.select(cols)
+
+    @staticmethod
+    def _window(acum: pl.Expr, valor: pl.Expr, k: int) -> pl.Expr:
+        # acumulado antes do 1º dia da série (0, exceto se a série foi cortada) cobre as janelas incompletas do início
+        return acum - acum.shift(k).fill_null(acum.first() - valor.first())
+
+    @staticmethod
+    def _rate(num: pl.Expr, den: pl.Expr) -> pl.Expr:
+        return pl.when(den > 0).then((num.cast(pl.Float64) / den * 100).round(1))
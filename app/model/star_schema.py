@@ -0,0 +1,145 @@
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional
+
+import polars as pl
+
+from app.model.transformer import FrameT
+
+
+class StarSchema:
+    """Eventlog em estrela: fato estreito com chaves inteiras e dimensões pequenas.
+
+    Os atributos de aeroporto (nome, município, GPS, coordenadas, porte, lon/lat),
+    companhia e justificativa se repetem em todas as linhas do eventlog largo; no
+    fato ficam só os ids (UInt16 enquanto a dimensão couber). Os ids são densos
+    (id = posição da linha na dimensão), então trazer um atributo de volta é um
+    `gather` da coluna da dimensão, sem join, e só das colunas pedidas.
+    """
+
+    # dimensão -> colunas; a primeira é o código e os demais atributos são função dele
+    DIMENSIONS = {
+        "aeroportos": ["ICAO Aeródromo", "Aeródromo", "Município", "GPS", "Coordenadas", "Tamanho", "Longitude", "Latitude"],
+        "companhias": ["ICAO Empresa Aérea", "Empresa Aérea"],
+        "justificativas": ["Código Justificativa", "Justificativa"],
+    }
+    # chave no fato -> (dimensão, colunas do eventlog largo na ordem de DIMENSIONS[dimensão])
+    KEYS = {
+        "ID Aeródromo Origem": ("aeroportos", [
+            "ICAO Aeródromo Origem", "Aeródromo Origem", "Origem Município", "Origem GPS",
+            "Origem Coordenadas", "Tamanho Origem", "Origem Longitude", "Origem Latitude",
+        ]),
+        "ID Aeródromo Destino": ("aeroportos", [
+            "ICAO Aeródromo Destino", "Aeródromo Destino", "Destino Município", "Destino GPS",
+            "Destino Coordenadas", "Tamanho Destino", "Destino Longitude", "Destino Latitude",
+        ]),
+        "ID Empresa Aérea": ("companhias", ["ICAO Empresa Aérea", "Empresa Aérea"]),
+        "ID Justificativa": ("justificativas", ["Código Justificativa", "Justificativa"]),
+    }
+    ID_COL = "ID"
+    AIRLINE_KEY = "ID Empresa Aérea"
+
+    @classmethod
+    def is_star(cls, columns: Iterable[str]) -> bool:
+        return any(key in columns for key in cls.KEYS)
+
+    def split(self, df: FrameT) -> tuple[FrameT, dict[str, pl.DataFrame]]:
+        dims = self.dimensions(df)
+        return self.fact(df, dims), dims
+
+    def dimensions(self, df: FrameT) -> dict[str, pl.DataFrame]:
+        """Uma tabela por dimensão, com os valores distintos do eventlog (aeroportos de origem e destino juntos)."""
+        parts: dict[str, list] = {}
+        for dim, cols in self.KEYS.values():
+            parts.setdefault(dim, []).append(
+                df.lazy().select([pl.col(c).alias(d) for c, d in zip(cols, self.DIMENSIONS[dim])])
+            )
+        plans = [
+            pl.concat(frames)
+            .unique(subset=[self.DIMENSIONS[dim][0]], keep="any")
+            .sort(pl.col(self.DIMENSIONS[dim][0]).cast(pl.Utf8), nulls_last=True)
+            for dim, frames in parts.items()
+        ]
+        # todas as dimensões saem do mesmo scan do eventlog
+        tables = pl.collect_all(plans)
+        return {
+            dim: table.with_row_index(self.ID_COL).with_columns(pl.col(self.ID_COL).cast(self._id_dtype(table.height)))
+            for dim, table in zip(parts, tables)
+        }
+
+    def fact(self, df: FrameT, dims: dict[str, pl.DataFrame]) -> FrameT:
+        """Troca as colunas de cada dimensão pelo id correspondente."""
+        for key, (dim, cols) in self.KEYS.items():
+            codes = dims[dim].select([pl.col(self.DIMENSIONS[dim][0]).alias(cols[0]), pl.col(self.ID_COL).alias(key)])
+            df = df.join(
+                codes.lazy() if isinstance(df, pl.LazyFrame) else codes,
+                on=cols[0],
+                how="left",
+                nulls_equal=True,
+                maintain_order="left",
+            )
+        return df.drop([c for _, cols in self.KEYS.values() for c in cols])
+
+    def expand(
+        self,
+        df: FrameT,
+        dims: dict[str, pl.DataFrame],
+        columns: Optional[Iterable[str]] = None,
+        keep_keys: bool = False,
+    ) -> FrameT:
+        """Traz de volta as colunas do eventlog largo (todas ou só `columns`) a partir dos ids."""
+        wanted = None if columns is None else set(columns)
+        names = df.collect_schema().names()
+        exprs = []
+        for key, (dim, cols) in self.KEYS.items():
+            if key not in names:
+                continue
+            for col, dim_col in zip(cols, self.DIMENSIONS[dim]):
+                if (wanted is None or col in wanted) and col not in names:
+                    exprs.append(pl.lit(dims[dim].get_column(dim_col)).gather(pl.col(key)).alias(col))
+        df = df.with_columns(exprs)
+        return df if keep_keys else df.drop([key for key in self.KEYS if key in names])
+
+    def display_columns(self, columns: Iterable[str]) -> list[str]:
+        """Colunas como no eventlog largo: cada id vira as colunas da sua dimensão, no lugar dele."""
+        columns = list(columns)
+        out = []
+        for col in columns:
+            if col in self.KEYS:
+                out.extend(c for c in self.KEYS[col][1] if c not in columns and c not in out)
+            elif col not in out:
+                out.append(col)
+        return out
+
+    def required_columns(self, columns: Iterable[str], available: Iterable[str]) -> list[str]:
+        """Colunas a ler de um frame com `available` para montar `columns` (as das dimensões viram os ids)."""
+        available = list(available)
+        out = []
+        for col in columns:
+            if col not in available:
+                col = next((key for key, (_, cols) in self.KEYS.items() if col in cols and key in available), col)
+            if col not in out:
+                out.append(col)
+        return out
+
+    def write(self, dims: dict[str, pl.DataFrame], path: Path) -> None:
+        """Um Parquet por dimensão em `path`; grava ao lado e troca no final, como o dataset particionado."""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        for name, table in dims.items():
+            table.write_parquet(tmp_path / f"{name}.parquet")
+        shutil.rmtree(path, ignore_errors=True)
+        tmp_path.rename(path)
+
+    @staticmethod
+    def read(path: Path) -> Optional[dict[str, pl.DataFrame]]:
+        path = Path(path)
+        if not path.is_dir():
+            return None
+        return {p.stem: pl.read_parquet(p) for p in sorted(path.glob("*.parquet"))}
+
+    @staticmethod
+    def _id_dtype(n: int) -> pl.DataType:
+        return pl.UInt16 if n <= 2 ** 16 else pl.UInt32
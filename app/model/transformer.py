@@ -1,39 +1,91 @@
+from typing import Optional, TypeVar, Union
+
 import polars as pl
 
-from app.utils.utils import load_json_file
+from app.model.code_mapper import CodeMapper
+from app.model.reference_store import REFERENCE_VERSION, ReferenceStore
+from app.utils.perf import traced
+from app.utils.utils import file_hash
+
+# Incrementar quando o resultado da transformação (regras, colunas, tipos) mudar:
+# invalida as partes já ingeridas mesmo com os CSVs intactos
+PIPELINE_VERSION = 1
+
+# As etapas privadas aceitam tanto DataFrame (modo eager) quanto LazyFrame (modo lazy)
+FrameT = TypeVar("FrameT", pl.DataFrame, pl.LazyFrame)
+
+# Colunas de baixa cardinalidade com domínio aberto: dicionário global (Categorical)
+CATEGORICAL_COLUMNS = [
+    "ICAO Empresa Aérea",
+    "Empresa Aérea",
+    "ICAO Aeródromo Origem",
+    "ICAO Aeródromo Destino",
+    "Aeródromo Origem",
+    "Aeródromo Destino",
+    "Origem Município",
+    "Destino Município",
+    "Situação Voo",
+]
 
 class Transformer:
     
-    def __init__(self):
-        pass
+    def __init__(self, reference: Optional[ReferenceStore] = None):
+        self.reference = reference or ReferenceStore()
+        self.codes = CodeMapper(reference=self.reference)
+        # linhas de entrada/aceitas e rejeições por regra da última validação
+        # (DataFrame no modo eager; plano lazy no modo lazy, para coletar junto com o eventlog)
+        self.validation_stats: Optional[Union[pl.DataFrame, pl.LazyFrame]] = None
     
+    @traced()
     def transform(self, df: pl.DataFrame) -> pl.DataFrame:
+        df = self._validate(df)
         df = self._map_rows(df)
-        df = self._remove_invalid_fligths(df)
         df = self._is_late(df)
         df = self._drop_unused_columns(df)
         df = self._normalize_dates(df)
+        df = self._encode_categories(df)
+        df = self._sort_by_departure(df)
         
         return df
-      
-    def _set_airports_names(self, df: pl.DataFrame) -> pl.DataFrame:
+    
+    @traced()
+    def transform_lazy(self, lf: pl.LazyFrame) -> pl.LazyFrame:
+        """Monta todo o pipeline como um único plano lazy (coletar uma vez no final).
+
+        A validação vem antes dos joins, então os voos rejeitados nunca chegam a
+        eles. O resultado é o mesmo de `transform`; `validation_stats` fica com o
+        plano das rejeições por regra, para coletar junto (`pl.collect_all`) com o
+        eventlog no mesmo scan.
+        """
+        lf = self._validate(lf)
+        lf = self._map_rows(lf)
+        lf = self._is_late(lf)
+        lf = self._drop_unused_columns(lf)
+        lf = self._normalize_dates(lf)
+        lf = self._encode_categories(lf)
+        lf = self._sort_by_departure(lf)
         
-        airports = load_json_file("app/docs/json/airport-codes.json")
+        return lf
 
-        df_airports = (
-            pl.from_records(airports, infer_schema_length=10000)
-            .select([
-                pl.col("icao_code").cast(pl.Utf8),
-                pl.col("name").cast(pl.Utf8),
-                pl.col("continent").cast(pl.Utf8),
-                pl.col("iso_country").cast(pl.Utf8),
-                pl.col("municipality").cast(pl.Utf8),
-                pl.col("gps_code").cast(pl.Utf8),
-                pl.col("coordinates").cast(pl.Utf8),
-                pl.col("type").cast(pl.Utf8),
-            ])
-            .unique(subset=["icao_code"], keep="first")
-        )
+    def fingerprint(self) -> dict:
+        """Versões e hashes das referências usadas na transformação; se mudar, as partes
+        gravadas com a versão anterior deixam de valer."""
+        sources = [self.reference.source(name) for name in ReferenceStore.DIMENSIONS]
+        sources += [table.source for table in self.codes.tables.values() if table.source]
+        return {
+            "pipeline_version": PIPELINE_VERSION,
+            "reference_version": REFERENCE_VERSION,
+            "sources": {str(s): file_hash(s) for s in sources},
+        }
+      
+    @staticmethod
+    def _same_kind(df: FrameT, other: pl.DataFrame) -> FrameT:
+        return other.lazy() if isinstance(df, pl.LazyFrame) else other
+      
+    def _set_airports_names(self, df: FrameT) -> FrameT:
+        
+        # `_validate` já descartou voos com aeroporto desconhecido, heliporto ou fora do Brasil
+        df_airports = self._same_kind(df, self.reference.get("airports"))
 
         # ---- Join para ORIGEM ----
         df = df.join(
@@ -45,10 +97,13 @@ class Transformer:
                 "municipality": "Origem Município",
                 "gps_code": "Origem GPS",
                 "coordinates": "Origem Coordenadas",
-                "type": "Tamanho Origem"
+                "type": "Tamanho Origem",
+                "lon": "Origem Longitude",
+                "lat": "Origem Latitude",
             }),
             on="ICAO Aeródromo Origem",
             how="left",
+            maintain_order="left",
         )
 
         # ---- Join para DESTINO ----
@@ -61,40 +116,24 @@ class Transformer:
                 "municipality": "Destino Município",
                 "gps_code": "Destino GPS",
                 "coordinates": "Destino Coordenadas",
-                "type": "Tamanho Destino"
+                "type": "Tamanho Destino",
+                "lon": "Destino Longitude",
+                "lat": "Destino Latitude",
             }),
             on="ICAO Aeródromo Destino",
             how="left",
+            maintain_order="left",
         )
         
-        df = df.filter(
-            (pl.col("Tamanho Origem").is_not_null()) & 
-            (pl.col("Tamanho Origem") != "heliport")
-            ) 
-        df = df.filter(
-            (pl.col("Tamanho Destino").is_not_null()) & 
-            (pl.col("Tamanho Destino") != "heliport")
-            )
-        
-        mapping = {
-            "large_airport": "Grande Porte",
-            "medium_airport": "Médio Porte",
-            "small_airport": "Pequeno Porte"
-        }
-        
         df = df.with_columns([
-            (pl.col("Tamanho Origem")
-            .map_elements(lambda x: mapping.get(x, ""))
-            .alias("Tamanho Origem")),
-            (pl.col("Tamanho Destino")
-            .map_elements(lambda x: mapping.get(x, ""))
-            .alias("Tamanho Destino"))
+            self.codes.expr("Tamanho Origem", "tamanho_aeroporto"),
+            self.codes.expr("Tamanho Destino", "tamanho_aeroporto"),
         ])
-        
 
         return df
       
-    def _map_rows(self, df: pl.DataFrame) -> pl.DataFrame:
+    @traced()
+    def _map_rows(self, df: FrameT) -> FrameT:
         
         df = self._set_airports_names(df)
         df = self._map_justification_codes(df)
@@ -102,7 +141,8 @@ class Transformer:
         df = self._map_airlines_codes(df)
         return df
         
-    def _is_late(self, df: pl.DataFrame) -> pl.DataFrame:
+    @traced()
+    def _is_late(self, df: FrameT) -> FrameT:
         return df.with_columns([
             (pl.when(
                 (pl.col("Partida Real") > pl.col("Partida Prevista"))| 
@@ -114,57 +154,58 @@ class Transformer:
             )
         ]) 
     
-    def _remove_invalid_fligths(self, df: pl.DataFrame) -> pl.DataFrame:
-    
-        df = self._remove_null_fligths(df)
-        df = self._filter_brazil_only(df)
-        
-        return df
-    
-    def _remove_null_fligths(self, df: pl.DataFrame) -> pl.DataFrame:
-        
-        df = df.filter(
-            (pl.col("Situação Voo").is_not_null()) & 
-            (pl.col("Situação Voo") == "REALIZADO")
-            )
-        df = df.filter([
-            ((pl.col("Partida Real").is_not_null()) & 
-            (pl.col("Chegada Real").is_not_null())),
-            ((pl.col("Partida Prevista").is_not_null()) & 
-            (pl.col("Chegada Prevista").is_not_null()))
-            ])
-        
-        return df
-    
-    def _filter_brazil_only(self, df: pl.DataFrame) -> pl.DataFrame:
-        df = df = df.filter(
-            (pl.col("Destino País ISO").is_not_null()) & 
-            (pl.col("Destino País ISO") == "BR")
-            ) 
-        df = df.filter(
-            (pl.col("Origem País ISO").is_not_null()) & 
-            (pl.col("Origem País ISO") == "BR")
-            )
-        return df
+    def _validation_rules(self) -> dict[str, pl.Expr]:
+        """Regras de validação: nome -> condição das linhas válidas, sobre as colunas brutas.
+
+        As regras de aeroporto consultam os códigos ICAO da base de referência, no
+        lugar de filtrar o porte/país depois dos joins.
+        """
+        airports = self.reference.get("airports")
+        conhecidos = airports.filter(pl.col("type").is_not_null() & (pl.col("type") != "heliport")).get_column("icao_code").implode()
+        brasil = airports.filter(pl.col("iso_country") == "BR").get_column("icao_code").implode()
+        return {
+            "situacao_nao_realizada": pl.col("Situação Voo") == "REALIZADO",
+            "horario_real_nulo": pl.col("Partida Real").is_not_null() & pl.col("Chegada Real").is_not_null(),
+            "horario_previsto_nulo": pl.col("Partida Prevista").is_not_null() & pl.col("Chegada Prevista").is_not_null(),
+            "origem_desconhecida_ou_heliporto": pl.col("ICAO Aeródromo Origem").is_in(conhecidos),
+            "destino_desconhecido_ou_heliporto": pl.col("ICAO Aeródromo Destino").is_in(conhecidos),
+            "origem_fora_do_brasil": pl.col("ICAO Aeródromo Origem").is_in(brasil),
+            "destino_fora_do_brasil": pl.col("ICAO Aeródromo Destino").is_in(brasil),
+        }
+
+    @traced()
+    def _validate(self, df: FrameT) -> FrameT:
+        """Aplica todas as regras num único filtro e guarda as rejeições por regra em `validation_stats`.
+
+        As regras viram colunas booleanas calculadas uma vez; delas saem tanto o
+        filtro (AND de todas) quanto as estatísticas (linhas de entrada, aceitas e
+        reprovadas em cada regra; uma linha pode reprovar em mais de uma).
+        """
+        rules = self._validation_rules()
+        names = [f"_ok_{nome}" for nome in rules]
+        # no modo lazy, `pl.collect_all` reconhece a base comum do eventlog e das estatísticas e a calcula uma vez
+        df = df.with_columns([expr.fill_null(False).alias(n) for n, expr in zip(names, rules.values())])
+        valid = pl.all_horizontal(names)
+        self.validation_stats = df.select([
+            pl.len().cast(pl.UInt32).alias("linhas_entrada"),
+            valid.sum().cast(pl.UInt32).alias("linhas_aceitas"),
+            *[(~pl.col(n)).sum().cast(pl.UInt32).alias(f"rejeitadas_{nome}") for n, nome in zip(names, rules)],
+        ])
+        return df.filter(valid).drop(names)
    
-    def _map_justification_codes(self, df: pl.DataFrame) -> pl.DataFrame:
+    def _map_justification_codes(self, df: FrameT) -> FrameT:
         
-        codes = load_json_file("app/docs/json/justification-codes.json")  # dict
         return df.with_columns(
-            pl.col("Código Justificativa")
-            .map_elements(lambda x: codes.get(x, "Código não encontrado"))
-            .alias("Justificativa")
+            self.codes.expr("Código Justificativa", "justificativa", alias="Justificativa")
         )
     
-    def _map_airlines_types(self, df: pl.DataFrame) -> pl.DataFrame:
-        codes = load_json_file("app/docs/json/airline-types.json")  # dict
+    def _map_airlines_types(self, df: FrameT) -> FrameT:
         return df.with_columns(
-            pl.col("Código Tipo Linha")
-            .map_elements(lambda x: codes.get(x, "Código não encontrado"))
-            .alias("Tipo Linha")
+            self.codes.expr("Código Tipo Linha", "tipo_linha", alias="Tipo Linha")
         )   
         
-    def _drop_unused_columns(self, df: pl.DataFrame) -> pl. DataFrame:
+    @traced()
+    def _drop_unused_columns(self, df: FrameT) -> FrameT:
         return df.drop([
             "Origem Continente", 
             "Origem País ISO", 
@@ -174,32 +215,26 @@ class Transformer:
             "Código Tipo Linha",
             ])
         
-    def _map_airlines_codes(self, df: pl.DataFrame) -> pl.DataFrame:
+    def _map_airlines_codes(self, df: FrameT) -> FrameT:
         
-        codes = load_json_file("app/docs/json/airlines-codes.json")
-        df_airlines = (
-            pl.from_records(codes, infer_schema_length=10000)
-            .select([
-                pl.col("Nome").cast(pl.Utf8).alias("empresa_nome"),
-                pl.col("Sigla").cast(pl.Utf8).alias("icao_empresa"),
-            ])
-            .unique(subset=["icao_empresa"], keep="first")
-        )
+        df_airlines = self.reference.get("airlines")
         
         df = df.join(
-            df_airlines,
+            self._same_kind(df, df_airlines),
             left_on="ICAO Empresa Aérea",
             right_on="icao_empresa",
             how="left",
+            maintain_order="left",
         ).with_columns(
             pl.col("empresa_nome").alias("Empresa Aérea")  
         ).drop(["empresa_nome"])
         
         return df
     
-    def _normalize_dates(self, df: pl.DataFrame) -> pl.DataFrame:
+    @traced()
+    def _normalize_dates(self, df: FrameT) -> FrameT:
         
-        date_cols = [c for c in df.columns if c.startswith(("Partida Prevista", "Partida Real", "Chegada Prevista", "Chegada Real"))]
+        date_cols = [c for c in df.collect_schema().names() if c.startswith(("Partida Prevista", "Partida Real", "Chegada Prevista", "Chegada Real"))]
         
         df = df.with_columns([
             pl.col(c)
@@ -208,4 +243,25 @@ class Transformer:
             for c in date_cols
         ])
         
-        return df
\ No newline at end of file
+        return df
+    
+    @traced()
+    def _encode_categories(self, df: FrameT) -> FrameT:
+        """Troca Utf8 por dicionário: Enum para conjuntos fechados de códigos, Categorical para o resto."""
+        enums = {
+            "Status do Voo": pl.Enum(["Atrasado", "Ok"]),
+            "Tipo Linha": self.codes.enum("tipo_linha"),
+            "Justificativa": self.codes.enum("justificativa"),
+            "Tamanho Origem": self.codes.enum("tamanho_aeroporto"),
+            "Tamanho Destino": self.codes.enum("tamanho_aeroporto"),
+        }
+        columns = df.collect_schema().names()
+        return df.with_columns(
+            [pl.col(c).cast(dtype) for c, dtype in enums.items() if c in columns] +
+            [pl.col(c).cast(pl.Categorical) for c in CATEGORICAL_COLUMNS if c in columns]
+        )
+    
+    @traced()
+    def _sort_by_departure(self, df: FrameT) -> FrameT:
+        """Eventlog ordenado por partida prevista: o dashboard recorta períodos por busca binária."""
+        return df.sort("Partida Prevista", nulls_last=True, maintain_order=True)
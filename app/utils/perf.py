@@ -0,0 +1,147 @@
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import polars as pl
+
+from app.utils.utils import rss_bytes
+
+# Tracer ativo no contexto atual (cada sessão do Streamlit roda em sua própria thread/contexto)
+_ACTIVE: ContextVar[Optional["Tracer"]] = ContextVar("perf_tracer", default=None)
+# sufixo dos spans que só montaram um plano lazy (o trabalho aparece no span da coleta/sink)
+PLAN_SUFFIX = " [plano]"
+
+
+def _rows(value: Any) -> Optional[int]:
+    """Linhas de um resultado: DataFrame, FrameView já materializado ou tupla de frames."""
+    if isinstance(value, pl.DataFrame):
+        return value.height
+    frame = getattr(value, "loaded_frame", None)
+    if isinstance(frame, pl.DataFrame):
+        return frame.height
+    if isinstance(value, tuple):
+        counts = [r for r in (_rows(v) for v in value) if r is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+class Tracer:
+    """Registra spans (tempo, linhas de entrada/saída, variação de RSS) das etapas instrumentadas.
+
+    Só coleta enquanto ativo (`with tracer.activate():`); fora disso `traced`
+    chama a função direto, sem custo de medição.
+    """
+
+    def __init__(self):
+        self.spans: list[dict] = []
+        self._origin = time.perf_counter()
+        self._depth = 0
+
+    @contextmanager
+    def activate(self):
+        token = _ACTIVE.set(self)
+        try:
+            yield self
+        finally:
+            _ACTIVE.reset(token)
+
+    @contextmanager
+    def span(self, name: str, rows_in: Optional[int] = None):
+        record = {"name": name, "depth": self._depth, "rows_in": rows_in, "rows_out": None}
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield record
+        finally:
+            self._depth -= 1
+            end = time.perf_counter()
+            rss_after = rss_bytes()
+            record.update({
+                "start_ms": (start - self._origin) * 1000,
+                "wall_ms": (end - start) * 1000,
+                "rss_delta_mb": (rss_after - rss_before) / 1024 ** 2,
+                "rss_mb": rss_after / 1024 ** 2,
+            })
+            self.spans.append(record)
+
+    def summary(self) -> pl.DataFrame:
+        """Spans agregados por nome, do mais caro para o mais barato."""
+        if not self.spans:
+            return pl.DataFrame()
+        return (
+            pl.DataFrame(self.spans)
+            .group_by("name")
+            .agg([
+                pl.len().alias("chamadas"),
+                pl.col("wall_ms").sum().round(2).alias("total_ms"),
+                pl.col("wall_ms").max().round(2).alias("max_ms"),
+                pl.col("rows_in").max().alias("linhas_entrada"),
+                pl.col("rows_out").max().alias("linhas_saida"),
+                pl.col("rss_delta_mb").sum().round(1).alias("delta_rss_mb"),
+            ])
+            .sort("total_ms", descending=True)
+        )
+
+    def to_trace(self) -> dict:
+        """Trace no formato Chrome Trace Event (abre em chrome://tracing ou Perfetto)."""
+        return {
+            "traceEvents": [
+                {
+                    "name": s["name"], "ph": "X", "pid": 0, "tid": 0,
+                    "ts": s["start_ms"] * 1000, "dur": s["wall_ms"] * 1000,
+                    "args": {k: s[k] for k in ("rows_in", "rows_out", "rss_delta_mb", "rss_mb")},
+                }
+                for s in sorted(self.spans, key=lambda s: s["start_ms"])
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_trace(), f)
+        return path
+
+
+def active_tracer() -> Optional[Tracer]:
+    return _ACTIVE.get()
+
+@contextmanager
+def span(name: str, rows_in: Optional[int] = None):
+    """Span avulso (ex.: o `collect`/`sink` de um plano lazy); sem `Tracer` ativo não mede nada."""
+    tracer = _ACTIVE.get()
+    if tracer is None:
+        yield {}
+        return
+    with tracer.span(name, rows_in) as record:
+        yield record
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Instrumenta a função quando há um `Tracer` ativo; linhas de entrada vêm do 1º frame nos argumentos.
+
+    Se a função devolve um LazyFrame ela só montou o plano: o span ganha o sufixo
+    `PLAN_SUFFIX`, e o tempo de execução fica no span de quem coleta.
+    """
+    def decorator(fn: Callable) -> Callable:
+        label = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _ACTIVE.get()
+            if tracer is None:
+                return fn(*args, **kwargs)
+            rows_in = next((r for r in map(_rows, args) if r is not None), None)
+            with tracer.span(label, rows_in) as record:
+                result = fn(*args, **kwargs)
+                record["rows_out"] = _rows(result)
+                if isinstance(result, pl.LazyFrame):
+                    record["name"] = label + PLAN_SUFFIX
+            return result
+        return wrapper
+    return decorator
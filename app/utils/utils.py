@@ -1,7 +1,38 @@
+import hashlib
 import json
+import os
+import sys
 import polars as pl
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 
 def load_json_file(file_path) -> dict:
     with open(file=file_path, encoding="utf-8") as f:
         return json.load(f)
+
+def file_hash(file_path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+def rss_bytes() -> int:
+    """Memória residente atual do processo (Linux via /proc; senão, o pico)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss_bytes()
+
+def peak_rss_bytes() -> int:
+    """Pico de memória residente do processo até agora (0 se a plataforma não informar)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return peak if sys.platform == "darwin" else peak * 1024
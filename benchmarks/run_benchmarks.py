@@ -0,0 +1,336 @@
+"""Benchmarks do pipeline (ingestão, etapas do Transformer) e das agregações do dashboard.
+
+Uso:
+    python -m benchmarks.run_benchmarks --rows 1M [--rows 10M ...] [--repeat 3]
+                                        [--save-baseline] [--fail-on-regression]
+
+Para cada escala gera (uma vez) os CSVs sintéticos em `benchmarks/data/`,
+mede tempo, linhas de entrada/saída, throughput e memória (variação do RSS e
+pico amostrado durante a etapa) de cada etapa, grava o resultado em
+`benchmarks/results/` e compara com o baseline local em
+`benchmarks/baselines/<escala>.json`, gravado na primeira execução de cada
+escala (ou com `--save-baseline`). Os baselines dependem da máquina e ficam
+fora do git.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import polars as pl
+import pydeck as pdk
+
+from app.dashboard.services.aggregations import (
+    FILTER_INDEX_COLS,
+    STAR_COLUMNS,
+    _agg_aeroporto_mais_atrasos,
+    _agg_atrasos_por_ano,
+    _agg_companhias_por_ano,
+    _agg_dias_semana_por_ano,
+    _agg_kpis,
+    _agg_periodo_por_ano,
+    _agg_status,
+    _agg_top_rotas,
+    _agg_variacao_aeroporto,
+    _agg_voos_por_dia,
+    _agg_atrasos_lote,
+    _agg_percentis_atraso,
+    _apply_filters,
+    _base_atraso,
+)
+from app.dashboard.services.agg_cache import FrameView
+from app.dashboard.services.bitmap_index import BitmapIndex
+from app.dashboard.services.pagination import _page_rows
+from app.dashboard.ui.maps import _CompactDeck, _prepare_routes, _route_map_data
+from app.model.aggregate_cube import AggregateCube
+from app.model.dataframe_manager import DataFrameManager
+from app.model.period_comparison import PeriodComparison
+from app.model.delay_sketch import DelaySketch
+from app.model.reference_store import ReferenceStore
+from app.model.rolling_series import RollingSeries
+from app.model.star_schema import StarSchema
+from app.model.transformer import Transformer
+from app.utils.utils import rss_bytes
+from benchmarks.synthetic_vra import generate, parse_rows, write_airports
+
+DATA_DIR = Path("benchmarks/data")
+RESULTS_DIR = Path("benchmarks/results")
+BASELINES_DIR = Path("benchmarks/baselines")
+DEFAULT_SCALES = ["1M"]
+# razão tempo_atual / tempo_baseline acima da qual a etapa é marcada como regressão
+REGRESSION_TOLERANCE = 1.25
+# etapas rápidas demais para comparar com segurança (ruído domina)
+MIN_COMPARABLE_SECONDS = 0.005
+# intervalo de amostragem do RSS durante cada etapa
+RSS_SAMPLE_SECONDS = 0.005
+
+# Etapas de `Transformer.transform`, na mesma ordem
+TRANSFORM_STAGES = [
+    "_validate",
+    "_map_rows",
+    "_is_late",
+    "_drop_unused_columns",
+    "_normalize_dates",
+    "_encode_categories",
+    "_sort_by_departure",
+]
+GENERAL_AGGS = [_agg_kpis, _agg_voos_por_dia, _agg_status, _agg_top_rotas]
+DELAY_AGGS = [
+    _agg_aeroporto_mais_atrasos,
+    _agg_variacao_aeroporto,
+    _agg_atrasos_por_ano,
+    _agg_dias_semana_por_ano,
+    _agg_periodo_por_ano,
+    _agg_companhias_por_ano,
+]
+
+
+@dataclass
+class BenchResult:
+    name: str
+    seconds: float
+    rows_in: int
+    rows_out: int
+    rows_per_s: float
+    rss_delta_mb: float
+    peak_delta_mb: float
+
+
+class RssSampler:
+    """Pico de RSS durante um bloco, amostrado numa thread.
+
+    O pico do processo (`ru_maxrss`) só cresce: depois da etapa mais pesada todas
+    as seguintes reportariam o mesmo número. As alocações do Polars são nativas,
+    então `tracemalloc` também não as veria.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self) -> RssSampler:
+        self.start = self.peak = rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def _rows(value: Any) -> int:
+    if isinstance(value, (pl.DataFrame, pl.Series)):
+        return value.height if isinstance(value, pl.DataFrame) else len(value)
+    if isinstance(value, tuple):
+        return sum(_rows(v) for v in value)
+    return 0
+
+def measure(name: str, fn: Callable[[], Any], rows_in: Optional[int], repeat: int = 1) -> tuple[BenchResult, Any]:
+    """Executa `fn` `repeat` vezes e guarda o melhor tempo (o resultado é o da última execução).
+
+    Com `rows_in=None` (ex.: leitura dos CSVs) a vazão é medida pelas linhas de saída.
+    """
+    best = float("inf")
+    with RssSampler() as rss:
+        for _ in range(max(repeat, 1)):
+            t0 = time.perf_counter()
+            value = fn()
+            best = min(best, time.perf_counter() - t0)
+    rows_in = _rows(value) if rows_in is None else rows_in
+    result = BenchResult(
+        name=name,
+        seconds=best,
+        rows_in=rows_in,
+        rows_out=_rows(value),
+        rows_per_s=rows_in / best if best > 0 else 0.0,
+        rss_delta_mb=(rss_bytes() - rss.start) / 1024 ** 2,
+        peak_delta_mb=(rss.peak - rss.start) / 1024 ** 2,
+    )
+    print(f"  {name:<48} {best:9.3f}s {result.rows_per_s:14,.0f} linhas/s  pico +{result.peak_delta_mb:7.0f} MB")
+    return result, value
+
+def prepare_data(label: str, data_dir: Path = DATA_DIR) -> Path:
+    """CSVs sintéticos da escala `label` (gerados só na primeira vez)."""
+    out = data_dir / f"vra_{label.lower()}"
+    marker = out / ".completo"
+    if not marker.exists():
+        print(f"Gerando {label} linhas sintéticas em {out} ...")
+        write_airports(out / "airport-codes.json")
+        generate(out, parse_rows(label))
+        marker.touch()
+    return out
+
+def run_suite(label: str, repeat: int = 3, data_dir: Path = DATA_DIR) -> dict:
+    data = prepare_data(label, data_dir)
+    csv_glob = str(data / "*.csv")
+    reference = ReferenceStore(data / "reference", sources={"airports": str(data / "airport-codes.json")})
+    results: list[BenchResult] = []
+
+    def bench(name, fn, rows_in, times=1):
+        result, value = measure(name, fn, rows_in, times)
+        results.append(result)
+        return value
+
+    print(f"[{label}]")
+    mng = DataFrameManager()
+    raw = bench("DataFrameManager.get_full_dataframe", lambda: mng.get_full_dataframe(csv_glob), None)
+
+    transformer = Transformer(reference)
+    reference.get("airports")  # compila a dimensão fora da medição
+    df = raw
+    for stage in TRANSFORM_STAGES:
+        step = getattr(transformer, stage)
+        df = bench(f"Transformer.{stage}", lambda step=step, df=df: step(df), df.height)
+    eventlog = df
+    bench("Transformer.transform_lazy", lambda: transformer.transform_lazy(mng.scan_full_dataframe(csv_glob)).collect(), raw.height)
+    del raw
+
+    # eventlog em estrela: divisão em fato + dimensões e volta ao frame de análise (gather pelos ids)
+    star = StarSchema()
+    fato, dims = bench("StarSchema.split", lambda: star.split(eventlog), eventlog.height)
+    bench("StarSchema.expand [análise]", lambda: star.expand(fato, dims, STAR_COLUMNS, keep_keys=True), fato.height, repeat)
+    print(f"  memória: eventlog largo {eventlog.estimated_size() / 1024 ** 2:,.1f} MB · fato {fato.estimated_size() / 1024 ** 2:,.1f} MB")
+
+    cube = bench("AggregateCube.build", lambda: AggregateCube().build(eventlog), eventlog.height)
+    print(f"  cubo: {cube.height:,} linhas para {eventlog.height:,} voos (razão {cube.height / max(eventlog.height, 1):.3f}"
+          f"{'' if AggregateCube.compresses(cube) else ', não usado pelo dashboard'})")
+
+    sketch = bench("DelaySketch.build", lambda: DelaySketch().build(eventlog), eventlog.height)
+    # percentis por rota: fusão dos sketches x quantil exato sobre o eventlog
+    rota = ("ICAO Aeródromo Origem", "ICAO Aeródromo Destino")
+    bench("_agg_percentis_atraso [rota, sketch]", lambda: _agg_percentis_atraso(sketch, rota), sketch.height, repeat)
+    atraso = (pl.col("Partida Real") - pl.col("Partida Prevista")).dt.total_minutes().clip(0)
+    bench("percentis exatos [rota]", lambda: eventlog.group_by(rota).agg(
+        [atraso.quantile(q, "nearest").alias(f"p{q * 100:g}") for q in (0.5, 0.9, 0.99)]), eventlog.height, repeat)
+
+    # comparação entre períodos: montagem das contagens e uma comparação (lookup)
+    comparison = PeriodComparison()
+    periodos = bench("PeriodComparison.build", lambda: comparison.build(eventlog), eventlog.height)
+    meses = comparison.periods(periodos, "Mês")
+    if len(meses) >= 2:
+        bench("PeriodComparison.compare [mês, rota]", lambda: comparison.compare(periodos, "Mês", "Rota", meses[0], meses[-1], 15),
+              periodos.height, repeat)
+
+    # série de pontualidade: montagem completa, atualização com o último mês e leitura de uma série (janelas O(1))
+    rolling = RollingSeries()
+    store = bench("RollingSeries.build", lambda: rolling.build(eventlog), eventlog.height)
+    dia = pl.col("Partida Prevista").dt.date()
+    ultimo_mes = eventlog.filter(dia >= dia.max().dt.month_start())
+    bench("RollingSeries.update [último mês]", lambda: rolling.update(store, rolling.daily(ultimo_mes)), ultimo_mes.height, repeat)
+    companhia = store.filter(pl.col("Tipo") == "Companhia").get_column("Entidade")[0]
+    bench("RollingSeries.series [companhia]", lambda: rolling.series(store, "Companhia", companhia), store.height, repeat)
+
+    # filtros: com e sem os índices invertidos
+    n = eventlog.height
+    empresas = eventlog.get_column("Empresa Aérea").drop_nulls().unique().sort().to_list()
+    origens = eventlog.get_column("ICAO Aeródromo Origem").drop_nulls().unique().sort().to_list()
+    day = eventlog.get_column("Partida Prevista").drop_nulls()
+    meio = str(day[len(day) // 2].date())
+    presets = {
+        "1 empresa": ([empresas[0]], [], [], [], [], [], None),
+        "empresa + periodo": ([empresas[0]], [], [], [], [], [], (meio, None)),
+        "3 origens + status": ([], [], ["Atrasado"], [], origens[:3], [], None),
+    }
+    index = bench("BitmapIndex (construção)", lambda: BitmapIndex(eventlog, list(FILTER_INDEX_COLS)), n)
+    for preset, filtros in presets.items():
+        bench(f"_apply_filters [{preset}]", lambda f=filtros: _apply_filters(eventlog, *f), n, repeat)
+        bench(f"_apply_filters [{preset}, índice]", lambda f=filtros: _apply_filters(eventlog, *f, index=index), n, repeat)
+
+    delay = bench("_base_atraso", lambda: _base_atraso(eventlog, 15), n, repeat)
+    for fn in GENERAL_AGGS:
+        bench(fn.__name__, lambda fn=fn: fn(eventlog), n, repeat)
+        bench(f"{fn.__name__} [cubo]", lambda fn=fn: fn(cube), cube.height, repeat)
+    for fn in DELAY_AGGS:
+        bench(fn.__name__, lambda fn=fn: fn(delay), delay.height, repeat)
+    # base de atraso + as seis agregações num único collect_all (comparar com _base_atraso + soma das individuais)
+    bench("_agg_atrasos_lote", lambda: _agg_atrasos_lote(eventlog, 15), n, repeat)
+    # navegador de dados: 1ª página ordenada (monta a permutação) e uma página profunda (só gather)
+    view = FrameView.of(eventlog)
+    bench("_page_rows [ordenada, 1ª]", lambda: _page_rows(view, tuple(eventlog.columns), 0, 100, "Empresa Aérea", True), n)
+    bench("_page_rows [ordenada, meio]", lambda: _page_rows(view, tuple(eventlog.columns), n // 200, 100, "Empresa Aérea", True), n, repeat)
+    bench("_prepare_routes", lambda: _prepare_routes(delay, "auto (detectar)", 1000, True), delay.height, repeat)
+    arcos, linhas, nos = bench("_route_map_data", lambda: _route_map_data(delay, "auto (detectar)", 5000, True), delay.height, repeat)
+    if arcos is not None:
+        layers = [pdk.Layer("ArcLayer", data=arcos), pdk.Layer("LineLayer", data=linhas), pdk.Layer("ScatterplotLayer", data=nos)]
+        bench("_CompactDeck.to_json", lambda: _CompactDeck(layers=layers).to_json(), arcos.height + linhas.height, repeat)
+
+    return {
+        "escala": label,
+        "linhas": parse_rows(label),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "resultados": [asdict(r) for r in results],
+    }
+
+def compare(current: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list[str]:
+    """Etapas cujo tempo passou de `tolerance` x o baseline."""
+    base = {r["name"]: r for r in baseline["resultados"]}
+    regressions = []
+    for r in current["resultados"]:
+        ref = base.get(r["name"])
+        if ref is None or ref["seconds"] < MIN_COMPARABLE_SECONDS:
+            continue
+        ratio = r["seconds"] / ref["seconds"]
+        flag = " <-- REGRESSÃO" if ratio > tolerance else ""
+        print(f"  {r['name']:<48} {ref['seconds']:9.3f}s -> {r['seconds']:9.3f}s ({ratio:5.2f}x){flag}")
+        if flag:
+            regressions.append(r["name"])
+    return regressions
+
+def save_json(data: dict, path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline e das agregações")
+    parser.add_argument("--rows", action="append", help="escala (1M, 10M, 100M...); pode repetir")
+    parser.add_argument("--repeat", type=int, default=3, help="repetições das etapas rápidas (vale o melhor tempo)")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--save-baseline", action="store_true", help="grava o resultado como novo baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    regressions: list[str] = []
+    for label in args.rows or DEFAULT_SCALES:
+        current = run_suite(label, args.repeat, args.data_dir)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        print(f"Resultado: {save_json(current, RESULTS_DIR / f'{label.lower()}-{stamp}.json')}")
+
+        baseline_path = BASELINES_DIR / f"{label.lower()}.json"
+        baseline: Optional[dict] = None
+        if baseline_path.exists():
+            with open(baseline_path, encoding="utf-8") as f:
+                baseline = json.load(f)
+            print(f"Comparação com {baseline_path}:")
+            regressions += [f"{label}: {name}" for name in compare(current, baseline, args.tolerance)]
+        if args.save_baseline or baseline is None:
+            print(f"Baseline: {save_json(current, baseline_path)}")
+
+    if regressions:
+        print("Regressões:\n  " + "\n  ".join(regressions))
+        if args.fail_on_regression:
+            sys.exit(1)
@@ -0,0 +1,237 @@
+"""Gerador de CSVs sintéticos no layout do VRA (ANAC) para os benchmarks.
+
+Os arquivos saem como os originais: um CSV por mês, separador `;`, cabeçalho
+com os nomes em português e datas "%Y-%m-%d %H:%M:%S". As distribuições
+imitam o tráfego real: poucas companhias concentram o mercado, aeroportos
+seguem uma cauda longa (Zipf), há picos de partida de manhã e no fim da
+tarde, a duração depende da distância e o atraso é uma mistura de voos
+pontuais, atrasos curtos e uma cauda longa.
+"""
+from __future__ import annotations
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from app.model.dataframe_manager import DataFrameManager
+from app.utils.utils import load_json_file
+
+CHUNK_ROWS = 1_000_000
+JUSTIFICATION_SOURCE = "app/docs/json/justification-codes.json"
+
+# (ICAO, participação de mercado)
+AIRLINES = [
+    ("AZU", 0.33), ("GLO", 0.30), ("TAM", 0.28), ("PTB", 0.03), ("OWT", 0.02),
+    ("TTL", 0.01), ("SID", 0.01), ("MWM", 0.01), ("ABJ", 0.005), ("LTG", 0.005),
+]
+# ICAO, nome, município, lon, lat, porte
+AIRPORTS = [
+    ("SBGR", "Guarulhos", "São Paulo", -46.47, -23.43, "large_airport"),
+    ("SBSP", "Congonhas", "São Paulo", -46.66, -23.63, "large_airport"),
+    ("SBBR", "Brasília", "Brasília", -47.92, -15.87, "large_airport"),
+    ("SBKP", "Viracopos", "Campinas", -47.13, -23.01, "large_airport"),
+    ("SBGL", "Galeão", "Rio de Janeiro", -43.25, -22.81, "large_airport"),
+    ("SBCF", "Confins", "Belo Horizonte", -43.97, -19.62, "large_airport"),
+    ("SBRJ", "Santos Dumont", "Rio de Janeiro", -43.16, -22.91, "medium_airport"),
+    ("SBRF", "Guararapes", "Recife", -34.92, -8.13, "large_airport"),
+    ("SBPA", "Salgado Filho", "Porto Alegre", -51.17, -29.99, "large_airport"),
+    ("SBSV", "Luís Eduardo Magalhães", "Salvador", -38.32, -12.91, "large_airport"),
+    ("SBCT", "Afonso Pena", "Curitiba", -49.17, -25.53, "large_airport"),
+    ("SBFZ", "Pinto Martins", "Fortaleza", -38.53, -3.78, "large_airport"),
+    ("SBEG", "Eduardo Gomes", "Manaus", -60.05, -3.04, "large_airport"),
+    ("SBBE", "Val de Cans", "Belém", -48.48, -1.38, "large_airport"),
+    ("SBFL", "Hercílio Luz", "Florianópolis", -48.55, -27.67, "medium_airport"),
+    ("SBGO", "Santa Genoveva", "Goiânia", -49.22, -16.63, "medium_airport"),
+    ("SBCY", "Marechal Rondon", "Cuiabá", -56.12, -15.65, "medium_airport"),
+    ("SBVT", "Eurico de Aguiar Salles", "Vitória", -40.29, -20.26, "medium_airport"),
+    ("SBNT", "São Gonçalo do Amarante", "Natal", -35.38, -5.77, "medium_airport"),
+    ("SBMO", "Zumbi dos Palmares", "Maceió", -35.79, -9.51, "medium_airport"),
+    ("SBSL", "Marechal Cunha Machado", "São Luís", -44.24, -2.59, "medium_airport"),
+    ("SBCG", "Campo Grande", "Campo Grande", -54.67, -20.47, "medium_airport"),
+    ("SBTE", "Teresina", "Teresina", -42.82, -5.06, "medium_airport"),
+    ("SBJP", "Castro Pinto", "João Pessoa", -34.95, -7.15, "medium_airport"),
+    ("SBAR", "Santa Maria", "Aracaju", -37.07, -10.98, "medium_airport"),
+    ("SBPJ", "Palmas", "Palmas", -48.36, -10.29, "medium_airport"),
+    ("SBPV", "Porto Velho", "Porto Velho", -63.90, -8.71, "medium_airport"),
+    ("SBNF", "Navegantes", "Navegantes", -48.65, -26.88, "medium_airport"),
+    ("SBUL", "Uberlândia", "Uberlândia", -48.23, -18.88, "medium_airport"),
+    ("SBRP", "Leite Lopes", "Ribeirão Preto", -47.78, -21.13, "medium_airport"),
+    ("SBFI", "Cataratas", "Foz do Iguaçu", -54.49, -25.60, "medium_airport"),
+    ("SBLO", "Londrina", "Londrina", -51.13, -23.33, "medium_airport"),
+    ("SBJV", "Joinville", "Joinville", -48.80, -26.22, "small_airport"),
+    ("SBMK", "Montes Claros", "Montes Claros", -43.82, -16.71, "small_airport"),
+    ("SBIL", "Ilhéus", "Ilhéus", -39.03, -14.82, "small_airport"),
+    ("SBPS", "Porto Seguro", "Porto Seguro", -39.08, -16.44, "small_airport"),
+    ("SBJU", "Juazeiro do Norte", "Juazeiro do Norte", -39.27, -7.22, "small_airport"),
+    ("SBCH", "Chapecó", "Chapecó", -52.66, -27.13, "small_airport"),
+    ("SBRB", "Plácido de Castro", "Rio Branco", -67.90, -9.87, "small_airport"),
+    ("SBMQ", "Macapá", "Macapá", -51.07, 0.05, "small_airport"),
+    # não entram no eventlog: heliporto e voos internacionais
+    ("SDHP", "Heliponto Paulista", "São Paulo", -46.65, -23.56, "heliport"),
+    ("KMIA", "Miami International", "Miami", -80.29, 25.79, "large_airport"),
+    ("LPPT", "Humberto Delgado", "Lisboa", -9.13, 38.78, "large_airport"),
+    ("SAEZ", "Ezeiza", "Buenos Aires", -58.54, -34.82, "large_airport"),
+]
+# aeroportos fora do Brasil: (continente, país)
+FOREIGN = {"KMIA": ("NA", "US"), "LPPT": ("EU", "PT"), "SAEZ": ("SA", "AR")}
+LINE_TYPES = [("C", 0.86), ("N", 0.08), ("G", 0.03), ("T", 0.02), ("S", 0.01)]
+CANCEL_RATE = 0.04
+MISSING_REAL_RATE = 0.005
+# perfil horário das partidas (0h..23h), picos às 7h e às 18h
+HOURLY_PROFILE = np.array([
+    0.3, 0.2, 0.2, 0.2, 0.4, 1.5, 3.5, 5.0, 4.5, 4.0, 3.8, 3.5,
+    3.4, 3.5, 3.6, 3.8, 4.2, 4.8, 5.0, 4.4, 3.6, 2.8, 1.8, 0.8,
+])
+
+
+def parse_rows(value: str) -> int:
+    """'1M' / '10M' / '100M' / '500k' / '12345' -> int."""
+    value = value.strip().lower().replace("_", "")
+    mult = {"k": 1_000, "m": 1_000_000, "b": 1_000_000_000}.get(value[-1], 1)
+    return int(float(value[:-1] if value[-1] in "kmb" else value) * mult)
+
+def _probabilities(weights) -> np.ndarray:
+    p = np.asarray(weights, dtype=np.float64)
+    return p / p.sum()
+
+def write_airports(path: Path) -> Path:
+    """Tabela de aeroportos no formato de `airport-codes.json`."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = []
+    for icao, name, city, lon, lat, kind in AIRPORTS:
+        continent, country = FOREIGN.get(icao, ("SA", "BR"))
+        rows.append({
+            "icao_code": icao, "name": name, "continent": continent, "iso_country": country,
+            "municipality": city, "gps_code": icao, "coordinates": f"{lon}, {lat}", "type": kind,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    return path
+
+def _months(start: str, end: str) -> list[tuple[int, int]]:
+    y, m = map(int, start.split("-"))
+    y2, m2 = map(int, end.split("-"))
+    out = []
+    while (y, m) <= (y2, m2):
+        out.append((y, m))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+def _chunk(rng: np.random.Generator, n: int, year: int, month: int, justificativas: list) -> pl.DataFrame:
+    airline_codes, airline_p = zip(*AIRLINES)
+    n_airports = len(AIRPORTS)
+    # cauda longa: o k-ésimo aeroporto recebe ~1/k do tráfego
+    airport_p = _probabilities(1.0 / np.arange(1, n_airports + 1))
+    origem = rng.choice(n_airports, size=n, p=airport_p)
+    destino = rng.choice(n_airports - 1, size=n, p=_probabilities(np.delete(airport_p, -1)))
+    destino = np.where(destino >= origem, destino + 1, destino)  # origem != destino
+
+    lon = np.radians([a[3] for a in AIRPORTS])
+    lat = np.radians([a[4] for a in AIRPORTS])
+    dlat, dlon = lat[destino] - lat[origem], lon[destino] - lon[origem]
+    hav = np.sin(dlat / 2) ** 2 + np.cos(lat[origem]) * np.cos(lat[destino]) * np.sin(dlon / 2) ** 2
+    dist_km = 2 * 6371 * np.arcsin(np.sqrt(hav))
+    duracao = (30 + dist_km / 750 * 60).astype(np.int64)  # minutos
+
+    days = (np.datetime64(f"{year + (month == 12)}-{month % 12 + 1:02d}-01") - np.datetime64(f"{year}-{month:02d}-01")).astype(int)
+    dia = rng.integers(0, days, size=n)
+    hora = rng.choice(24, size=n, p=_probabilities(HOURLY_PROFILE))
+    minuto = rng.integers(0, 12, size=n) * 5
+    partida_prev = (
+        np.datetime64(f"{year}-{month:02d}-01T00:00", "ms")
+        + dia.astype("timedelta64[D]") + hora.astype("timedelta64[h]") + minuto.astype("timedelta64[m]")
+    )
+
+    # atraso: 70% pontual (-5..+5), 25% curto (exp. média 20 min), 5% cauda longa (lognormal)
+    kind = rng.choice(3, size=n, p=[0.70, 0.25, 0.05])
+    atraso = np.select(
+        [kind == 0, kind == 1],
+        [rng.integers(-5, 6, size=n), rng.exponential(20, size=n).astype(np.int64) + 6],
+        default=(rng.lognormal(4.2, 0.6, size=n)).astype(np.int64) + 30,
+    )
+    partida_real = partida_prev + atraso.astype("timedelta64[m]")
+    chegada_prev = partida_prev + duracao.astype("timedelta64[m]")
+    chegada_real = partida_real + (duracao + rng.integers(-8, 15, size=n)).astype("timedelta64[m]")
+
+    cancelado = rng.random(n) < CANCEL_RATE
+    sem_real = rng.random(n) < MISSING_REAL_RATE
+    just_idx = rng.integers(0, len(justificativas), size=n)
+    com_just = (atraso > 15) | cancelado
+
+    line_codes, line_p = zip(*LINE_TYPES)
+    fmt = "%Y-%m-%d %H:%M:%S"
+    df = pl.DataFrame({
+        "ICAO Empresa Aérea": np.asarray(airline_codes)[rng.choice(len(AIRLINES), size=n, p=_probabilities(airline_p))],
+        "Número Voo": rng.integers(1, 10000, size=n).astype(str),
+        "Código Autorização (DI)": rng.choice(["0", "1", "2"], size=n, p=[0.9, 0.08, 0.02]),
+        "Código Tipo Linha": np.asarray(line_codes)[rng.choice(len(LINE_TYPES), size=n, p=_probabilities(line_p))],
+        "ICAO Aeródromo Origem": np.asarray([a[0] for a in AIRPORTS])[origem],
+        "ICAO Aeródromo Destino": np.asarray([a[0] for a in AIRPORTS])[destino],
+        "Partida Prevista": partida_prev,
+        "Partida Real": partida_real,
+        "Chegada Prevista": chegada_prev,
+        "Chegada Real": chegada_real,
+        "Situação Voo": np.where(cancelado, "CANCELADO", "REALIZADO"),
+        "Código Justificativa": np.where(com_just, np.asarray(justificativas)[just_idx], ""),
+        "_sem_real": cancelado | sem_real,
+    })
+    return df.with_columns(
+        [pl.col(c).dt.strftime(fmt) for c in ("Partida Prevista", "Chegada Prevista")]
+        + [
+            pl.when(pl.col("_sem_real")).then(pl.lit("")).otherwise(pl.col(c).dt.strftime(fmt)).alias(c)
+            for c in ("Partida Real", "Chegada Real")
+        ]
+    ).drop("_sem_real").select(DataFrameManager.CSV_COLUMNS)
+
+def generate(
+    out_dir: Path,
+    rows: int,
+    start: str = "2021-01",
+    end: str = "2022-12",
+    seed: int = 42,
+    chunk_rows: int = CHUNK_ROWS,
+) -> list[Path]:
+    """Gera `rows` voos espalhados em um CSV por mês entre `start` e `end` (AAAA-MM).
+
+    Escreve em blocos de `chunk_rows` linhas, então a memória não cresce com `rows`.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    justificativas = list(load_json_file(JUSTIFICATION_SOURCE).keys())
+    months = _months(start, end)
+    per_month = np.full(len(months), rows // len(months))
+    per_month[: rows % len(months)] += 1
+
+    files = []
+    for (year, month), total in zip(months, per_month):
+        path = out_dir / f"VRA_{year}_{month:02d}.csv"
+        with open(path, "wb") as f:
+            for i, offset in enumerate(range(0, max(int(total), 1), chunk_rows)):
+                n = int(min(chunk_rows, total - offset))
+                _chunk(rng, n, year, month, justificativas).write_csv(
+                    f, separator=DataFrameManager.CSV_SEPARATOR, include_header=i == 0
+                )
+        files.append(path)
+    return files
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gera CSVs sintéticos no layout do VRA")
+    parser.add_argument("--rows", default="1M")
+    parser.add_argument("--out", type=Path, default=Path("benchmarks/data"))
+    parser.add_argument("--start", default="2021-01")
+    parser.add_argument("--end", default="2022-12")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    t0 = datetime.now()
+    out = args.out / f"vra_{args.rows.lower()}"
+    write_airports(out / "airport-codes.json")
+    files = generate(out, rows, args.start, args.end, args.seed)
+    print(f"{rows:,} linhas em {len(files)} arquivos ({out}) em {(datetime.now() - t0).total_seconds():.1f}s")
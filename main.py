@@ -1,38 +1,284 @@
 
+import glob
+import shutil
+from datetime import datetime
 import polars as pl
+from loguru import logger
 from app.dashboard.flight_dashboard import FlightsDashboard
+from app.model.aggregate_cube import AggregateCube
 from app.model.dataframe_manager import DataFrameManager
+from app.model.delay_sketch import DelaySketch
+from app.model.ingestion_manifest import IngestionManifest
+from app.model.period_comparison import PeriodComparison
+from app.model.rolling_series import RollingSeries
+from app.model.star_schema import StarSchema
 from app.model.transformer import Transformer
+from app.utils.perf import Tracer, span
 from app.utils.utils import load_json_file
 from pathlib import Path
+from typing import Optional
 
 TRANSFORM_NEEDED = False
+LAZY_TRANSFORM = True
+INCREMENTAL_TRANSFORM = True
+PARTITIONED_OUTPUT = True
+PARTITION_BY_AIRLINE = False
+# eventlog gravado em estrela: fato estreito com ids inteiros + dimensões em DIMENSIONS_PATH
+STAR_OUTPUT = True
 RAWLOG_PATH = Path("logs/test_logs/eventlog_no_transformation.parquet")
 TRANSFORMED_LOG_PATH = Path("logs/eventlog.parquet")
+TRANSFORMED_DATASET_PATH = Path("logs/eventlog")
+CUBE_PATH = Path("logs/eventlog_cube.parquet")
+DELAY_SKETCH_PATH = Path("logs/eventlog_delay_sketch.parquet")
+SERIES_PATH = Path("logs/eventlog_series.parquet")
+PERIODS_PATH = Path("logs/eventlog_periods.parquet")
+DIMENSIONS_PATH = Path("logs/eventlog_dimensions")
+# tudo o que é gravado a partir do eventlog; um artefato novo entra aqui (dashboard e checagem de saída)
+DERIVED_PATHS = {
+    "cube_path": CUBE_PATH,
+    "sketch_path": DELAY_SKETCH_PATH,
+    "series_path": SERIES_PATH,
+    "periods_path": PERIODS_PATH,
+    "dimensions_path": DIMENSIONS_PATH,
+}
 CSV_FILES_PATH = Path("app/docs/*.csv")
+MANIFEST_PATH = Path("logs/manifest.json")
+PARTS_PATH = Path("logs/parts")
+# rejeições por regra de validação de cada ingestão (uma linha por arquivo de origem)
+VALIDATION_STATS_PATH = Path("logs/validation_stats.parquet")
+# modo out-of-core: cada CSV vai do scan ao Parquet pelo engine streaming e o eventlog
+# é ordenado/gravado em janelas que cabem no teto de memória (não volta DataFrame)
+STREAMING_TRANSFORM = False
+STREAMING_MEMORY_LIMIT_MB = 2048
+# trace (tempo, linhas, memória) das etapas do Transformer, no formato Chrome Trace Event
+TRACE_TRANSFORM = False
+TRACE_PATH = Path("logs/transform_trace.json")
 
-def execute_transformation() -> pl.DataFrame:
+def execute_transformation() -> Optional[pl.DataFrame]:
+    if not TRACE_TRANSFORM:
+        return _execute_transformation()
+    tracer = Tracer()
+    with tracer.activate():
+        eventlog = _execute_transformation()
+    tracer.export(TRACE_PATH)
+    with pl.Config(tbl_rows=-1, tbl_width_chars=200):
+        logger.info(f"Trace do pipeline em {TRACE_PATH}:\n{tracer.summary()}")
+    return eventlog
+
+def _execute_transformation() -> Optional[pl.DataFrame]:
+    
+    if STREAMING_TRANSFORM:
+        return execute_streaming_transformation()
+    
+    if INCREMENTAL_TRANSFORM and not RAWLOG_PATH.exists():
+        return execute_incremental_transformation()
     
     mng = DataFrameManager()
+    transformer = Transformer()
+    if LAZY_TRANSFORM:
+        if RAWLOG_PATH.exists():
+            source = mng.scan_parquet(RAWLOG_PATH)
+        else:
+            source = mng.scan_full_dataframe(CSV_FILES_PATH)
+        plans = [transformer.transform_lazy(source), transformer.validation_stats]
+        # no modo lazy as etapas do Transformer só montam o plano: o trabalho é medido aqui
+        with span("pl.collect_all [eventlog + validação]") as record:
+            eventlog, stats = pl.collect_all(plans)
+            record["rows_out"] = eventlog.height
+        record_validation_stats(stats, str(RAWLOG_PATH if RAWLOG_PATH.exists() else CSV_FILES_PATH))
+        write_eventlog(mng, eventlog)
+        return eventlog
+    
     if RAWLOG_PATH.exists():
         eventlog = mng.parquet_to_dataframe(RAWLOG_PATH)
     else:
         eventlog = mng.get_full_dataframe(CSV_FILES_PATH)
     
-    transformer = Transformer()
     eventlog = transformer.transform(eventlog)
-    eventlog.write_parquet(TRANSFORMED_LOG_PATH)
+    record_validation_stats(transformer.validation_stats, str(RAWLOG_PATH if RAWLOG_PATH.exists() else CSV_FILES_PATH))
+    write_eventlog(mng, eventlog)
+    return eventlog
+
+def write_eventlog(mng: DataFrameManager, eventlog: pl.DataFrame, days: Optional[list] = None) -> None:
+    # os artefatos derivados abaixo saem do eventlog largo, já em memória
+    fato, dims = StarSchema().split(eventlog) if STAR_OUTPUT else (eventlog, None)
+    if PARTITIONED_OUTPUT:
+        mng.write_partitioned(fato, TRANSFORMED_DATASET_PATH, by_airline=PARTITION_BY_AIRLINE)
+    else:
+        fato.write_parquet(TRANSFORMED_LOG_PATH)
+    write_dimensions(dims)
+    # rollup dia x hora x dimensões consumido pelos gráficos do dashboard
+    AggregateCube().build(eventlog).write_parquet(CUBE_PATH)
+    # sketches de quantis do atraso (dia x rota x companhia) para os percentis do dashboard
+    DelaySketch().build(eventlog).write_parquet(DELAY_SKETCH_PATH)
+    # contagens por mês/trimestre/ano x aeroporto/companhia/rota para a comparação entre períodos
+    PeriodComparison().build(eventlog).write_parquet(PERIODS_PATH)
+    write_series(eventlog, days)
+
+def write_series(eventlog, days: Optional[list] = None) -> None:
+    """Série diária de pontualidade por aeroporto/companhia. Com `days` (dias afetados pelos CSVs
+    novos/alterados, inclusive os que a versão anterior deles cobria) só esses dias são recontados,
+    a partir do eventlog inteiro, e reacumulados; sem eles, recalcula tudo."""
+    series = RollingSeries()
+    if days is None or not SERIES_PATH.exists():
+        series.build(eventlog).write_parquet(SERIES_PATH)
+        return
+    if not days:
+        return
+    afetados = eventlog.lazy().filter(pl.col("Partida Prevista").dt.date().is_in(days))
+    daily = series.daily(afetados).collect()
+    series.update(pl.read_parquet(SERIES_PATH), daily, days).write_parquet(SERIES_PATH)
+
+def record_validation_stats(stats: pl.DataFrame, source: str) -> None:
+    """Grava as rejeições por regra da ingestão de `source`, substituindo a linha anterior do mesmo arquivo."""
+    stats = stats.select([
+        pl.lit(source).alias("arquivo"),
+        pl.lit(datetime.now()).alias("processado_em"),
+        pl.all(),
+    ])
+    if VALIDATION_STATS_PATH.exists():
+        anteriores = pl.read_parquet(VALIDATION_STATS_PATH).filter(pl.col("arquivo") != source)
+        stats = pl.concat([anteriores, stats], how="diagonal_relaxed")
+    VALIDATION_STATS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    stats.write_parquet(VALIDATION_STATS_PATH)
+
+def write_dimensions(dims: Optional[dict]) -> None:
+    """Dimensões do eventlog em estrela; sem elas (eventlog largo) remove as de uma execução anterior."""
+    if dims is None:
+        shutil.rmtree(DIMENSIONS_PATH, ignore_errors=True)
+    else:
+        StarSchema().write(dims, DIMENSIONS_PATH)
+
+def eventlog_path() -> Path:
+    return TRANSFORMED_DATASET_PATH if PARTITIONED_OUTPUT else TRANSFORMED_LOG_PATH
+
+def stage_parts(mng: DataFrameManager, transformer: Transformer, streaming: bool = False) -> tuple[bool, list, Optional[list]]:
+    """Transforma só os CSVs novos/alterados em partes Parquet; devolve (houve mudança, partes,
+    dias afetados — os das partes novas e os da versão anterior das regravadas; None se algum CSV
+    saiu ou o pipeline/referências mudaram e o que depende deles precisa ser refeito)."""
+    manifest = IngestionManifest(MANIFEST_PATH)
+    files = sorted(glob.glob(str(CSV_FILES_PATH)))
+    
+    fingerprint = transformer.fingerprint()
+    # referências ou transformação novas: as partes antigas não podem se misturar às novas
+    stale = fingerprint != manifest.fingerprint
+    removed = manifest.removed_files(files)
+    pending = manifest.pending_files(files, fingerprint)
+    for f in removed:
+        manifest.forget(f)
+    manifest.fingerprint = fingerprint
+    
+    PARTS_PATH.mkdir(parents=True, exist_ok=True)
+    days = set()
+    for f in pending:
+        part = PARTS_PATH / f"{Path(f).stem}.parquet"
+        if part.exists():
+            # CSV alterado: os dias da versão anterior saem da série mesmo que não existam mais nele
+            days.update(part_days(part))
+        lf = transformer.transform_lazy(mng.scan_full_dataframe(f))
+        # a parte e as estatísticas de validação saem do mesmo scan do CSV
+        with span(f"pl.collect_all [parte {part.name}]") as record:
+            if streaming:
+                _, stats = pl.collect_all(
+                    [lf.sink_parquet(part, engine="streaming", lazy=True), transformer.validation_stats],
+                    engine="streaming",
+                )
+            else:
+                df_part, stats = pl.collect_all([lf, transformer.validation_stats])
+                df_part.write_parquet(part)
+                record["rows_out"] = df_part.height
+        record_validation_stats(stats, f)
+        manifest.record(f, part)
+        days.update(part_days(part))
+    manifest.save()
+    
+    parts = manifest.parts()
+    if not parts:
+        raise ValueError(f"Nenhum arquivo encontrado em {CSV_FILES_PATH}")
+    return bool(removed or pending), parts, None if removed or stale else sorted(days)
+
+def part_days(part: Path) -> list:
+    """Dias (data local da partida prevista) cobertos por uma parte."""
+    return RollingSeries().days(pl.scan_parquet(part)).collect().to_series().to_list()
+
+def execute_incremental_transformation() -> pl.DataFrame:
+    """Transforma só os CSVs novos/alterados e remonta o eventlog a partir das partes."""
+    
+    mng = DataFrameManager()
+    changed, parts, days = stage_parts(mng, Transformer())
+    if not changed and outputs_exist():
+        return mng.read_eventlog(eventlog_path(), DIMENSIONS_PATH)
+    
+    with span("collect [eventlog das partes]") as record:
+        eventlog = (
+            pl.concat([pl.scan_parquet(p) for p in parts], how="diagonal_relaxed")
+            .sort("Partida Prevista", nulls_last=True, maintain_order=True)
+            .collect()
+        )
+        record["rows_out"] = eventlog.height
+    write_eventlog(mng, eventlog, days)
     return eventlog
+
+def execute_streaming_transformation() -> None:
+    """Mesmo resultado do modo incremental sem materializar o eventlog: as partes são
+    gravadas com `sink_parquet` e o eventlog/cubo saem de scans em streaming."""
+    
+    mng = DataFrameManager()
+    changed, parts, days = stage_parts(mng, Transformer(), streaming=True)
+    if not changed and outputs_exist():
+        return None
     
+    max_bytes = STREAMING_MEMORY_LIMIT_MB * 1024 ** 2
+    eventlog = pl.concat([pl.scan_parquet(p) for p in parts], how="diagonal_relaxed")
+    dims = None
+    if STAR_OUTPUT:
+        # dimensões montadas num scan das partes; o fato sai do mesmo plano lazy
+        star = StarSchema()
+        dims = star.dimensions(eventlog)
+        eventlog = star.fact(eventlog, dims)
+    with span("sink [eventlog]"):
+        if PARTITIONED_OUTPUT:
+            mng.sink_partitioned(eventlog, TRANSFORMED_DATASET_PATH, by_airline=PARTITION_BY_AIRLINE, max_bytes=max_bytes)
+        else:
+            mng.sink_sorted(eventlog, TRANSFORMED_LOG_PATH, max_bytes=max_bytes)
+    write_dimensions(dims)
+
+    def scan() -> pl.LazyFrame:
+        return mng.scan_eventlog(eventlog_path(), DIMENSIONS_PATH)
+
+    with span("sink [cubo]"):
+        AggregateCube().build(scan()).sink_parquet(CUBE_PATH, engine="streaming")
+    with span("sink [sketch]"):
+        DelaySketch().build(scan()).sink_parquet(DELAY_SKETCH_PATH, engine="streaming")
+    with span("sink [períodos]"):
+        PeriodComparison().build(scan()).sink_parquet(PERIODS_PATH, engine="streaming")
+    with span("collect [série]"):
+        write_series(scan(), days)
+    return None
+
+def derived_paths(only_existing: bool = False) -> dict:
+    """Caminhos dos artefatos derivados (cubo, sketches, série, períodos, dimensões) para o dashboard."""
+    return {k: str(p) if p.exists() or not only_existing else None for k, p in DERIVED_PATHS.items()}
 
+def outputs_exist() -> bool:
+    """Eventlog e todos os artefatos derivados gravados (as dimensões só no modo estrela): sem CSV
+    novo, é o que permite pular a remontagem."""
+    paths = [eventlog_path(), *(p for p in DERIVED_PATHS.values() if STAR_OUTPUT or p != DIMENSIONS_PATH)]
+    return all(p.exists() for p in paths)
 
 if __name__ == "__main__":
     try:
         dash = FlightsDashboard()
-        if TRANSFORM_NEEDED:
-            dash.render_dashboard(execute_transformation())
+        if TRANSFORM_NEEDED and STREAMING_TRANSFORM:
+            execute_transformation()
+            dash.render_dashboard(dataset_path=str(eventlog_path()), **derived_paths())
+        elif TRANSFORM_NEEDED:
+            dash.render_dashboard(execute_transformation(), **derived_paths())
+        elif PARTITIONED_OUTPUT and TRANSFORMED_DATASET_PATH.exists():
+            # o dashboard varre o dataset lazy e poda partições pelos filtros
+            dash.render_dashboard(dataset_path=str(TRANSFORMED_DATASET_PATH), **derived_paths())
         elif TRANSFORMED_LOG_PATH.exists():
             eventlog = pl.read_parquet(TRANSFORMED_LOG_PATH)
-            dash.render_dashboard(eventlog)
+            dash.render_dashboard(eventlog, **derived_paths(only_existing=True))
     except ValueError:
-        raise ValueError
\ No newline at end of file
+        raise ValueError
@@ -0,0 +1,199 @@
+"""Relatórios em lote: as mesmas agregações do dashboard, sem subir o Streamlit.
+
+Uso:
+    python report.py [--dataset logs/eventlog] [--cube logs/eventlog_cube.parquet]
+                     [--dimensions logs/eventlog_dimensions]
+                     [--presets presets.json] [--out reports] [--format parquet|json]
+                     [--limite 15] [--workers 8]
+
+`presets.json` é uma lista de filtros nomeados, com as mesmas chaves de `_apply_filters`:
+    [{"nome": "geral"},
+     {"nome": "gol_2022", "empresas": ["GOL LINHAS AÉREAS S.A. (EX- VRG LINHAS AÉREAS S.A.)"],
+      "faixa_partida": ["2022-01-01", "2022-12-31"]}]
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import polars as pl
+
+from app.dashboard.services.aggregations import (
+    FILTER_INDEX_COLS,
+    STAR_COLUMNS,
+    _agg_aeroporto_mais_atrasos,
+    _agg_atrasos_por_ano,
+    _agg_companhias_por_ano,
+    _agg_dias_semana_por_ano,
+    _agg_kpis,
+    _agg_periodo_por_ano,
+    _agg_status,
+    _agg_top_rotas,
+    _agg_variacao_aeroporto,
+    _agg_voos_por_dia,
+    _agg_atrasos_lote,
+    _apply_filters,
+    _supports_filters,
+)
+from app.dashboard.services.bitmap_index import BitmapIndex
+from app.dashboard.services.time_index import _sort_by_time
+from app.model.aggregate_cube import AggregateCube
+from app.model.dataframe_manager import DataFrameManager
+
+DATASET_PATH = Path("logs/eventlog")
+CUBE_PATH = Path("logs/eventlog_cube.parquet")
+DIMENSIONS_PATH = Path("logs/eventlog_dimensions")
+REPORTS_PATH = Path("reports")
+DEFAULT_DELAY_LIMIT = 15
+PRESET_KEYS = ("empresas", "situacoes", "status", "tipos_linha", "icao_origem", "icao_destino", "faixa_partida")
+
+# nome -> (função, base): "geral" usa o frame filtrado; "atraso" sai do lote `_agg_atrasos_lote`
+REPORT_AGGS = {
+    "kpis": (_agg_kpis, "geral"),
+    "voos_por_dia": (_agg_voos_por_dia, "geral"),
+    "status": (_agg_status, "geral"),
+    "top_rotas": (_agg_top_rotas, "geral"),
+    "aeroporto_mais_atrasos": (_agg_aeroporto_mais_atrasos, "atraso"),
+    "variacao_aeroporto": (_agg_variacao_aeroporto, "atraso"),
+    "atrasos_por_ano": (_agg_atrasos_por_ano, "atraso"),
+    "dias_semana_por_ano": (_agg_dias_semana_por_ano, "atraso"),
+    "periodo_por_ano": (_agg_periodo_por_ano, "atraso"),
+    "companhias_por_ano": (_agg_companhias_por_ano, "atraso"),
+}
+
+
+def load_eventlog(path: Path, dimensions_path: Optional[Path] = DIMENSIONS_PATH) -> pl.DataFrame:
+    """Eventlog (arquivo Parquet ou dataset particionado) ordenado por partida prevista.
+
+    Em estrela, só as colunas das dimensões usadas pelas agregações são trazidas.
+    """
+    df = DataFrameManager().read_eventlog(Path(path), dimensions_path, list(STAR_COLUMNS))
+    return _sort_by_time(df, "Partida Prevista")
+
+def load_presets(path: Optional[Path]) -> list[dict]:
+    if path is None:
+        return [{"nome": "geral"}]
+    with open(path, encoding="utf-8") as f:
+        presets = json.load(f)
+    for i, preset in enumerate(presets):
+        desconhecidas = set(preset) - set(PRESET_KEYS) - {"nome"}
+        if desconhecidas:
+            raise ValueError(f"Preset {preset.get('nome', i)}: chaves desconhecidas {sorted(desconhecidas)}")
+        preset.setdefault("nome", f"preset_{i}")
+    return presets
+
+def _filters(preset: dict) -> tuple:
+    filtros = [preset.get(k) or [] for k in PRESET_KEYS[:-1]]
+    faixa = preset.get("faixa_partida")
+    return (*filtros, tuple(faixa) if faixa else None)
+
+def _bases(eventlog: pl.DataFrame, cube: Optional[pl.DataFrame], index: BitmapIndex,
+           cube_index: Optional[BitmapIndex], preset: dict, limite: int) -> dict:
+    """Frame "geral" e agregações de "atraso" de um preset; usa o cubo quando ele cobre os filtros, como o dashboard."""
+    filtros = _filters(preset)
+    if cube is not None and _supports_filters(cube, *filtros):
+        geral = _apply_filters(cube, *filtros, index=cube_index)
+    else:
+        geral = _apply_filters(eventlog, *filtros, index=index)
+    # agregações de atraso calculadas juntas, num único scan do frame filtrado
+    return {"geral": geral, "atraso": _agg_atrasos_lote(geral, limite)}
+
+def _write(df: pl.DataFrame, path: Path, fmt: str) -> str:
+    path = path.with_suffix(f".{fmt}")
+    if fmt == "json":
+        df.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.Utf8)).write_json(path)
+    else:
+        df.write_parquet(path)
+    return path.name
+
+def _run_agg(name: str, fn, df, out_dir: Path, fmt: str) -> dict:
+    return _write_result(name, fn(df), out_dir, fmt)
+
+def _write_result(name: str, result, out_dir: Path, fmt: str) -> dict:
+    """Grava o resultado de uma agregação e devolve o que entra no resumo do preset."""
+    if name == "kpis":
+        voos, empresas, rotas = result
+        return {"voos": voos, "empresas": empresas, "rotas": rotas}
+    if name == "variacao_aeroporto":
+        aumentos, quedas, ano_anterior, ano_atual = result
+        return {
+            "ano_anterior": ano_anterior,
+            "ano_atual": ano_atual,
+            "aumentos": _write(aumentos, out_dir / f"{name}_aumentos", fmt),
+            "quedas": _write(quedas, out_dir / f"{name}_quedas", fmt),
+        }
+    return {"arquivo": _write(result, out_dir / name, fmt), "linhas": result.height}
+
+def run_report(
+    dataset_path: Path = DATASET_PATH,
+    presets: Optional[list[dict]] = None,
+    out_path: Path = REPORTS_PATH,
+    cube_path: Optional[Path] = CUBE_PATH,
+    dimensions_path: Optional[Path] = DIMENSIONS_PATH,
+    fmt: str = "parquet",
+    limite: int = DEFAULT_DELAY_LIMIT,
+    workers: Optional[int] = None,
+) -> dict:
+    """Calcula todas as agregações de cada preset em paralelo e grava em `out_path/<preset>/`."""
+    presets = presets or [{"nome": "geral"}]
+    eventlog = load_eventlog(dataset_path, dimensions_path)
+    cube = _sort_by_time(pl.read_parquet(cube_path), "Partida Prevista") if cube_path and Path(cube_path).exists() else None
+    if cube is not None and not AggregateCube.compresses(cube):
+        # cubo do tamanho do eventlog: as agregações saem direto do fato
+        cube = None
+
+    # índices invertidos montados uma vez e reaproveitados por todos os presets
+    index = BitmapIndex(eventlog, list(FILTER_INDEX_COLS))
+    cube_index = BitmapIndex(cube, list(FILTER_INDEX_COLS)) if cube is not None else None
+
+    out_path = Path(out_path)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # o Polars solta o GIL durante as consultas: presets e agregações rodam em paralelo
+        bases = list(pool.map(lambda p: _bases(eventlog, cube, index, cube_index, p, limite), presets))
+        tasks = {}
+        for preset, base in zip(presets, bases):
+            out_dir = out_path / preset["nome"]
+            out_dir.mkdir(parents=True, exist_ok=True)
+            for name, (fn, kind) in REPORT_AGGS.items():
+                if kind == "atraso":
+                    task = pool.submit(_write_result, name, base[kind][fn], out_dir, fmt)
+                else:
+                    task = pool.submit(_run_agg, name, fn, base[kind], out_dir, fmt)
+                tasks[(preset["nome"], name)] = task
+        results = {key: task.result() for key, task in tasks.items()}
+
+    summary = {}
+    for preset in presets:
+        summary[preset["nome"]] = {
+            "filtros": {k: preset[k] for k in PRESET_KEYS if preset.get(k)},
+            "limite_atraso_min": limite,
+            "agregacoes": {name: results[(preset["nome"], name)] for name in REPORT_AGGS},
+        }
+    with open(out_path / "resumo.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relatórios em lote das agregações do dashboard")
+    parser.add_argument("--dataset", type=Path, default=DATASET_PATH)
+    parser.add_argument("--cube", type=Path, default=CUBE_PATH)
+    parser.add_argument("--dimensions", type=Path, default=DIMENSIONS_PATH)
+    parser.add_argument("--presets", type=Path, default=None)
+    parser.add_argument("--out", type=Path, default=REPORTS_PATH)
+    parser.add_argument("--format", choices=("parquet", "json"), default="parquet")
+    parser.add_argument("--limite", type=int, default=DEFAULT_DELAY_LIMIT)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    run_report(
+        dataset_path=args.dataset,
+        presets=load_presets(args.presets),
+        out_path=args.out,
+        cube_path=args.cube,
+        dimensions_path=args.dimensions,
+        fmt=args.format,
+        limite=args.limite,
+        workers=args.workers,
+    )